@@ -131,7 +131,7 @@ var vm = new Vue({
         },
         // 获取热销商品数据
         get_hot_goods: function(){
-            axios.get(this.host+'/skus/hot/', {
+            axios.get(this.host+'/categories/'+this.cat+'/hotskus/', {
                 responseType: 'json'
             })
             .then(response => {
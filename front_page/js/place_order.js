@@ -86,16 +86,50 @@ var vm = new Vue({
                         responseType: 'json'
                     })
                     .then(response => {
-                        // alert('下单成功');
-                        location.href = '/order_success.html?order_id='+response.data.order_id
-                            +'&amount='+this.payment_amount
-                            +'&pay='+this.pay_method;
+                        if (response.status == 202) {
+                            // 异步下单: 轮询下单结果
+                            this.poll_order_status(response.data.token);
+                        } else {
+                            // alert('下单成功');
+                            this.on_order_success(response.data.order_id);
+                        }
                     })
                     .catch(error => {
                         this.order_submitting = false;
                         alert(error.response.data[0]);
                     })
             }
+        },
+        // 下单成功，跳转到订单成功页面
+        on_order_success: function(order_id){
+            location.href = '/order_success.html?order_id='+order_id
+                +'&amount='+this.payment_amount
+                +'&pay='+this.pay_method;
+        },
+        // 获取异步下单的结果，处理中时1秒之后再次获取
+        poll_order_status: function(token){
+            axios.get(this.host+'/orders/'+token+'/status/', {
+                    headers: {
+                        'Authorization': 'JWT ' + this.token
+                    },
+                    responseType: 'json'
+                })
+                .then(response => {
+                    if (response.data.status == 'success') {
+                        this.on_order_success(response.data.order_id);
+                    } else if (response.data.status == 'failed') {
+                        this.order_submitting = false;
+                        alert(response.data.message);
+                    } else {
+                        setTimeout(() => {
+                            this.poll_order_status(token);
+                        }, 1000);
+                    }
+                })
+                .catch(error => {
+                    this.order_submitting = false;
+                    console.log(error.response.data);
+                })
         }
     }
 });
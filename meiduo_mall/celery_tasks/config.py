@@ -1,2 +1,8 @@
 # 指定Celery的中间人的地址
 broker_url = 'redis://172.16.179.139:6379/3'
+
+
+# 异步下单任务发送到专门的orders队列
+task_routes = {
+    'place_order': {'queue': 'orders'},
+}
@@ -0,0 +1,13 @@
+# 封装保存浏览记录的任务函数
+from users.histories import HistoryStore
+
+from celery_tasks.main import celery_app
+
+
+@celery_app.task(name='record_browse_history')
+def record_browse_history(user_id, sku_id, timestamp):
+    """
+    保存登录用户的浏览记录:
+    timestamp: 浏览时间戳(毫秒)，由发出任务时生成，任务延迟执行时浏览顺序不受影响
+    """
+    HistoryStore(user_id).record(sku_id, timestamp)
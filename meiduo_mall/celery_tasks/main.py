@@ -12,4 +12,4 @@ celery_app = Celery('celery_tasks')
 celery_app.config_from_object('celery_tasks.config')
 
 # 3. 让celery worker在启动时自动加载任务函数
-celery_app.autodiscover_tasks(['celery_tasks.sms', 'celery_tasks.email', 'celery_tasks.html'])
\ No newline at end of file
+celery_app.autodiscover_tasks(['celery_tasks.sms', 'celery_tasks.email', 'celery_tasks.html', 'celery_tasks.stock', 'celery_tasks.histories', 'celery_tasks.orders'])
\ No newline at end of file
@@ -0,0 +1,57 @@
+# 封装异步下单的任务函数
+# 下单任务发送到orders队列，由专门的worker处理: celery -A celery_tasks.main worker -Q orders -l info
+import logging
+
+from rest_framework import serializers
+
+from cart.store import get_cart_store
+from orders import constants
+from orders.jobs import acquire_sku_slots, release_sku_slots, finish_order_job, JOB_SUCCESS, JOB_FAILED
+from orders.serializers import OrderSerializer
+from users.models import User, Address
+
+from celery_tasks.main import celery_app
+
+# 获取日志器
+logger = logging.getLogger('django')
+
+
+@celery_app.task(name='place_order', bind=True, max_retries=constants.ORDER_JOB_MAX_RETRIES)
+def place_order(self, token, user_id, address_id, pay_method, cart_items):
+    """
+    异步下单:
+    cart_items: 下单时购物车中被勾选商品的快照 [[sku_id, count], ...]
+    同时处理的包含同一商品的下单任务数量不超过ORDER_SKU_CONCURRENCY，达到上限时稍后重试，
+    重试ORDER_JOB_MAX_RETRIES次之后下单失败
+    """
+    cart = {int(sku_id): int(count) for sku_id, count in cart_items}
+
+    # 占用商品的并发数
+    if not acquire_sku_slots(cart.keys(), token):
+        if self.request.retries >= constants.ORDER_JOB_MAX_RETRIES:
+            finish_order_job(token, JOB_FAILED, message='下单人数过多，请稍后重试')
+            return
+
+        raise self.retry(countdown=constants.ORDER_JOB_RETRY_COUNTDOWN)
+
+    try:
+        user = User.objects.get(id=user_id)
+        address = Address.objects.get(id=address_id)
+
+        order = OrderSerializer().place_order(user, address, pay_method, cart)
+    except serializers.ValidationError as e:
+        # 商品库存不足等下单失败的原因
+        finish_order_job(token, JOB_FAILED, message=str(e.detail[0]))
+        return
+    except Exception:
+        logger.exception('异步下单失败：[token: %s]' % token)
+        finish_order_job(token, JOB_FAILED, message='下单失败')
+        return
+    finally:
+        # 释放商品的并发数
+        release_sku_slots(cart.keys(), token)
+
+    # 清除购物车对应的购物车记录
+    get_cart_store(user_id).remove(*cart.keys())
+
+    finish_order_job(token, JOB_SUCCESS, order_id=order.order_id)
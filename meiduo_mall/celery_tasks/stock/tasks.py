@@ -0,0 +1,20 @@
+# 封装库存回写的任务函数
+from goods import constants
+from goods.stock import write_back_reservation
+
+from celery_tasks.main import celery_app
+
+
+# acks_late: worker处理完成之后才确认消息，worker异常退出时消息会重新投递
+@celery_app.task(name='write_back_sku_stock', bind=True, max_retries=None, acks_late=True)
+def write_back_sku_stock(self, reservation_id, sku_counts):
+    """
+    将redis中预占的库存回写到数据库:
+    reservation_id: 预占id，同一次预占重复投递时只回写一次
+    sku_counts: [[sku_id, count], ...]
+    """
+    sku_counts = {int(sku_id): int(count) for sku_id, count in sku_counts}
+
+    # 商品正在被对账时稍后重试
+    if not write_back_reservation(reservation_id, sku_counts):
+        raise self.retry(countdown=constants.SKU_STOCK_WRITE_BACK_RETRY_COUNTDOWN)
@@ -0,0 +1,168 @@
+# 封装cookie购物车数据的编码和解码
+# 编码之后的格式(base64url编码，不带'='填充):
+# | 头部(1字节) | 商品数量n(varint) | n个(sku_id差值(varint), count(zigzag varint)) | 勾选状态位图(ceil(n/8)字节) |
+# 头部: 版本号 << 1 | 是否zlib压缩
+# 旧版本的cookie购物车数据是 base64(pickle(cart_dict))，解码时兼容读取
+import base64
+import io
+import pickle
+import zlib
+
+# 当前编码格式的版本号
+VERSION = 1
+
+# 头部中的压缩标记
+FLAG_COMPRESSED = 0x01
+
+# 数据超过该字节数时才尝试进行压缩
+COMPRESS_MIN_SIZE = 64
+
+# pickle协议2及以上的数据以0x80开头
+PICKLE_PROTO = 0x80
+
+
+def _write_varint(buf, value):
+    """将非负整数按照varint编码写入buf"""
+    while value > 0x7f:
+        buf.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+
+def _read_varint(data, pos):
+    """从data的pos位置读取一个varint，返回(value, 新的pos)"""
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def _zigzag(value):
+    """有符号整数 -> 无符号整数"""
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def _unzigzag(value):
+    """无符号整数 -> 有符号整数"""
+    return value >> 1 if not value & 1 else -(value >> 1) - 1
+
+
+class _RestrictedUnpickler(pickle.Unpickler):
+    """
+    只允许解析内置的dict、int、bool等数据，不允许加载任何全局对象:
+    cookie是客户端可以修改的数据，普通的pickle.loads会执行其中构造的任意代码
+    """
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError('不允许加载全局对象: %s.%s' % (module, name))
+
+
+def _loads_legacy(data):
+    """解析旧版本的pickle格式，数据不是购物车字典的格式时返回空字典"""
+    cart_dict = _RestrictedUnpickler(io.BytesIO(data)).load()
+
+    if not isinstance(cart_dict, dict):
+        return {}
+
+    for sku_id, count_selected in cart_dict.items():
+        if not isinstance(sku_id, int) or not isinstance(count_selected, dict) or \
+                not isinstance(count_selected.get('count'), int) or \
+                not isinstance(count_selected.get('selected'), bool):
+            return {}
+
+    return cart_dict
+
+
+def dumps(cart_dict):
+    """
+    将购物车字典编码为cookie字符串:
+    cart_dict: {
+        <sku_id>: {
+            'count': <count>,
+            'selected': <selected>
+        },
+        ...
+    }
+    """
+    sku_ids = sorted(cart_dict.keys())
+
+    payload = bytearray()
+    _write_varint(payload, len(sku_ids))
+
+    # sku_id从小到大排列，只保存和前一个sku_id的差值
+    prev_sku_id = 0
+    bitmap = bytearray((len(sku_ids) + 7) // 8)
+    for index, sku_id in enumerate(sku_ids):
+        count_selected = cart_dict[sku_id]
+        _write_varint(payload, sku_id - prev_sku_id)
+        _write_varint(payload, _zigzag(int(count_selected['count'])))
+        prev_sku_id = sku_id
+
+        if count_selected['selected']:
+            bitmap[index // 8] |= 1 << (index % 8)
+
+    payload += bitmap
+
+    # 数据较大并且压缩之后更小时才进行压缩
+    header = VERSION << 1
+    if len(payload) > COMPRESS_MIN_SIZE:
+        compressed = zlib.compress(bytes(payload))
+        if len(compressed) < len(payload):
+            header |= FLAG_COMPRESSED
+            payload = compressed
+
+    data = bytes([header]) + bytes(payload)
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def loads(cookie_cart):
+    """
+    将cookie字符串解码为购物车字典，兼容旧版本的pickle格式
+    数据无法解析时返回空字典
+    """
+    if not cookie_cart:
+        return {}
+
+    try:
+        # 补齐base64编码的'='填充
+        data = base64.urlsafe_b64decode(cookie_cart + '=' * (-len(cookie_cart) % 4))
+
+        if data[0] == PICKLE_PROTO:
+            # 旧版本: base64(pickle(cart_dict))
+            return _loads_legacy(data)
+
+        header = data[0]
+        if header >> 1 != VERSION:
+            return {}
+
+        payload = data[1:]
+        if header & FLAG_COMPRESSED:
+            payload = zlib.decompress(payload)
+
+        count, pos = _read_varint(payload, 0)
+
+        items = []
+        sku_id = 0
+        for i in range(count):
+            delta, pos = _read_varint(payload, pos)
+            value, pos = _read_varint(payload, pos)
+            sku_id += delta
+            items.append((sku_id, _unzigzag(value)))
+
+        bitmap = payload[pos:]
+        if len(bitmap) != (count + 7) // 8:
+            return {}
+
+        cart_dict = {}
+        for index, (sku_id, value) in enumerate(items):
+            cart_dict[sku_id] = {
+                'count': value,
+                'selected': bool(bitmap[index // 8] & (1 << (index % 8)))
+            }
+        return cart_dict
+    except Exception:
+        return {}
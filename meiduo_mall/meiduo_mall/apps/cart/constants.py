@@ -1,2 +1,5 @@
 # 购物车cookie的有效期
 CART_COOKIE_EXPIRES = 365 * 24 * 60 * 60
+
+# 购物车批量操作的最大操作数量
+CART_BATCH_OPERATIONS_LIMIT = 100
@@ -0,0 +1,37 @@
+# 将登录用户的redis购物车记录转换为单hash存储
+# 用法: python manage.py migrate_cart_layout [--dry-run]
+# 迁移可以在线进行：先将CART_STORE_CLASS设置为cart.store.PackedCartStore，
+# 活跃用户在访问购物车时会自动转换，再执行该命令转换剩余用户的购物车记录
+from django.core.management.base import BaseCommand
+from django_redis import get_redis_connection
+
+from cart.store import PackedCartStore
+
+
+class Command(BaseCommand):
+    help = '将cart_<id>和cart_selected_<id>转换为单hash存储cart_packed_<id>'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='只统计需要转换的用户数量，不进行转换')
+        parser.add_argument('--batch-size', type=int, default=1000, help='每次SCAN的key数量')
+
+    def handle(self, *args, **options):
+        redis_conn = get_redis_connection('cart')
+
+        count = 0
+        # cart_[0-9]*: 只匹配cart_<user_id>，不匹配cart_selected_<id>和cart_packed_<id>
+        for key in redis_conn.scan_iter(match='cart_[0-9]*', count=options['batch_size']):
+            user_id = key.decode().split('_', 1)[1]
+            if not user_id.isdigit():
+                continue
+
+            if not options['dry_run']:
+                # 每个用户的转换在一个lua脚本中完成，转换过程中用户仍然可以正常操作购物车
+                PackedCartStore(user_id, redis_conn).migrate()
+
+            count += 1
+
+        if options['dry_run']:
+            self.stdout.write('需要转换的用户数量: %s' % count)
+        else:
+            self.stdout.write(self.style.SUCCESS('已转换的用户数量: %s' % count))
@@ -1,6 +1,9 @@
 from rest_framework import serializers
 
+from cart import constants
+from goods.cache import get_sku_snapshot
 from goods.models import SKU
+from goods.serializers import SKUSnapshotSerializer
 
 
 class CartSerializer(serializers.Serializer):
@@ -11,30 +14,27 @@ class CartSerializer(serializers.Serializer):
 
     def validate(self, attrs):
         # sku_id是否存在
+        # 下单扣减库存时不会清除商品快照缓存，库存需要从数据库中查询
+        # select stock from tb_sku where id=<sku_id>;
         sku_id = attrs['sku_id']
+        stock = SKU.objects.filter(id=sku_id).values_list('stock', flat=True).first()
 
-        try:
-            sku = SKU.objects.get(id=sku_id)
-        except SKU.DoesNotExist:
+        if stock is None:
             raise serializers.ValidationError('商品不存在')
 
         # 商品库存是否足够
         count = attrs['count']
 
-        if count > sku.stock:
+        if count > stock:
             raise serializers.ValidationError('商品库存不足')
 
         return attrs
 
 
-class CartSKUSerializer(serializers.ModelSerializer):
+class CartSKUSerializer(SKUSnapshotSerializer):
     count = serializers.IntegerField(label='商品数量')
     selected = serializers.BooleanField(label='勾选状态')
 
-    class Meta:
-        model = SKU
-        fields = ('id', 'name', 'price', 'default_image', 'count', 'selected')
-
 
 class CartDelSerializer(serializers.Serializer):
     """购物车记录删除序列化器类"""
@@ -42,9 +42,7 @@ class CartDelSerializer(serializers.Serializer):
 
     def validate_sku_id(self, value):
         # sku_id对应商品是否存在
-        try:
-            sku = SKU.objects.get(id=value)
-        except SKU.DoesNotExist:
+        if get_sku_snapshot(value) is None:
             raise serializers.ValidationError('商品不存在')
 
         return value
@@ -53,3 +51,53 @@ class CartDelSerializer(serializers.Serializer):
 class CartSelectSerializer(serializers.Serializer):
     """购物车全选和取消全选的序列化器类"""
     selected = serializers.BooleanField(label='勾选状态')
+
+
+class CartOperationSerializer(serializers.Serializer):
+    """购物车批量操作中单个操作的序列化器类"""
+    ACTION_CHOICES = (
+        ('add', '添加'),
+        ('set', '修改'),
+        ('delete', '删除'),
+    )
+
+    action = serializers.ChoiceField(label='操作类型', choices=ACTION_CHOICES)
+    sku_id = serializers.IntegerField(label='商品id')
+    count = serializers.IntegerField(label='数量', required=False)
+    selected = serializers.BooleanField(label='勾选状态', default=True)
+
+    def validate(self, attrs):
+        # 添加和修改操作必须传递count
+        if attrs['action'] != 'delete' and 'count' not in attrs:
+            raise serializers.ValidationError('缺少count参数')
+
+        return attrs
+
+
+class CartBatchSerializer(serializers.Serializer):
+    """购物车批量操作序列化器类"""
+    operations = CartOperationSerializer(label='操作列表', many=True)
+
+    def validate_operations(self, value):
+        if not value:
+            raise serializers.ValidationError('操作列表不能为空')
+
+        if len(value) > constants.CART_BATCH_OPERATIONS_LIMIT:
+            raise serializers.ValidationError('操作数量超过上限')
+
+        # 一次查询所有操作涉及的商品的库存(商品快照缓存中的库存可能不是最新的)
+        # select id, stock from tb_sku where id in (...);
+        stocks = dict(SKU.objects.filter(id__in=[operation['sku_id'] for operation in value]).values_list(
+            'id', 'stock'))
+
+        for operation in value:
+            # sku_id是否存在
+            sku_id = operation['sku_id']
+            if sku_id not in stocks:
+                raise serializers.ValidationError('商品不存在')
+
+            # 商品库存是否足够
+            if operation['action'] != 'delete' and operation['count'] > stocks[sku_id]:
+                raise serializers.ValidationError('商品库存不足')
+
+        return value
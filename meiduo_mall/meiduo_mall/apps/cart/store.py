@@ -0,0 +1,373 @@
+# 封装登录用户redis购物车记录的操作
+from django.conf import settings
+from django.utils.module_loading import import_string
+from django_redis import get_redis_connection
+
+# 全选和取消全选：将hash中所有商品sku_id添加到set中或从set中移除
+# KEYS[1]: 购物车hash KEYS[2]: 勾选状态set
+# ARGV[1]: 1: 全选 0: 取消全选
+SELECT_ALL_SCRIPT = """
+local sku_ids = redis.call('hkeys', KEYS[1])
+if #sku_ids == 0 then
+    return 0
+end
+if ARGV[1] == '1' then
+    redis.call('sadd', KEYS[2], unpack(sku_ids))
+else
+    redis.call('srem', KEYS[2], unpack(sku_ids))
+end
+return #sku_ids
+"""
+
+
+class CartStore(object):
+    """
+    登录用户的redis购物车记录:
+    hash: cart_<user_id> 存储购物车中添加的商品id和对应数量count
+    set: cart_selected_<user_id> 存储购物车中被勾选的商品id
+    每个操作都通过一次pipeline或lua脚本完成，只和redis交互一次
+    """
+    def __init__(self, user_id, redis_conn=None):
+        self.redis_conn = redis_conn or get_redis_connection('cart')
+        self.cart_key = 'cart_%s' % user_id
+        self.cart_selected_key = 'cart_selected_%s' % user_id
+
+    def get_cart(self):
+        """
+        获取用户的购物车记录:
+        {
+            <sku_id>: {
+                'count': <count>,
+                'selected': <selected>
+            },
+            ...
+        }
+        """
+        pl = self.redis_conn.pipeline()
+        pl.hgetall(self.cart_key)
+        pl.smembers(self.cart_selected_key)
+        # {b'<sku_id>': b'<count>', ...}, Set(b'<sku_id>', ...)
+        cart_redis, sku_ids = pl.execute()
+
+        return self._to_cart_dict(cart_redis, sku_ids)
+
+    def _to_cart_dict(self, cart_redis, sku_ids):
+        """将redis中的hash和set数据转换为购物车字典"""
+        cart_dict = {}
+        for sku_id, count in cart_redis.items():
+            cart_dict[int(sku_id)] = {
+                'count': int(count),
+                'selected': sku_id in sku_ids
+            }
+        return cart_dict
+
+    def get_selected(self):
+        """
+        获取用户购物车中被勾选的商品和数量:
+        {
+            <sku_id>: <count>,
+            ...
+        }
+        """
+        cart_dict = self.get_cart()
+        return {sku_id: item['count'] for sku_id, item in cart_dict.items() if item['selected']}
+
+    def add(self, sku_id, count, selected=True):
+        """添加商品，如果该商品已经添加过，数量进行累加"""
+        self.add_many([(sku_id, count, selected)])
+
+    def add_many(self, items):
+        """
+        批量添加商品:
+        items: [(sku_id, count, selected), ...]
+        """
+        if not items:
+            return
+
+        pl = self.redis_conn.pipeline()
+        selected_ids = []
+        for sku_id, count, selected in items:
+            pl.hincrby(self.cart_key, sku_id, count)
+            if selected:
+                selected_ids.append(sku_id)
+
+        if selected_ids:
+            pl.sadd(self.cart_selected_key, *selected_ids)
+        pl.execute()
+
+    def set(self, sku_id, count, selected):
+        """修改商品的数量和勾选状态"""
+        self.set_many([(sku_id, count, selected)])
+
+    def set_many(self, items):
+        """
+        批量修改商品的数量和勾选状态:
+        items: [(sku_id, count, selected), ...]
+        """
+        if not items:
+            return
+
+        cart = {}
+        selected_add = []
+        selected_remove = []
+        for sku_id, count, selected in items:
+            cart[sku_id] = count
+            if selected:
+                selected_add.append(sku_id)
+            else:
+                selected_remove.append(sku_id)
+
+        pl = self.redis_conn.pipeline()
+        pl.hmset(self.cart_key, cart)
+        if selected_add:
+            pl.sadd(self.cart_selected_key, *selected_add)
+        if selected_remove:
+            pl.srem(self.cart_selected_key, *selected_remove)
+        pl.execute()
+
+    def remove(self, *sku_ids):
+        """删除购物车中的商品"""
+        if not sku_ids:
+            return
+
+        pl = self.redis_conn.pipeline()
+        pl.hdel(self.cart_key, *sku_ids)
+        pl.srem(self.cart_selected_key, *sku_ids)
+        pl.execute()
+
+    def select_many(self, sku_ids, selected):
+        """批量设置商品的勾选状态"""
+        if not sku_ids:
+            return
+
+        if selected:
+            self.redis_conn.sadd(self.cart_selected_key, *sku_ids)
+        else:
+            self.redis_conn.srem(self.cart_selected_key, *sku_ids)
+
+    def select_all(self, selected):
+        """全选和取消全选"""
+        script = self.redis_conn.register_script(SELECT_ALL_SCRIPT)
+        script(keys=[self.cart_key, self.cart_selected_key], args=[1 if selected else 0])
+
+    def apply(self, operations):
+        """
+        在一个事务中依次执行多个购物车操作，并返回操作之后的购物车记录:
+        operations: [(action, sku_id, count, selected), ...]
+        action: add: 添加(数量累加) set: 修改 delete: 删除
+        """
+        pl = self.redis_conn.pipeline()
+        for action, sku_id, count, selected in operations:
+            if action == 'add':
+                pl.hincrby(self.cart_key, sku_id, count)
+                if selected:
+                    pl.sadd(self.cart_selected_key, sku_id)
+            elif action == 'set':
+                pl.hset(self.cart_key, sku_id, count)
+                if selected:
+                    pl.sadd(self.cart_selected_key, sku_id)
+                else:
+                    pl.srem(self.cart_selected_key, sku_id)
+            else:
+                pl.hdel(self.cart_key, sku_id)
+                pl.srem(self.cart_selected_key, sku_id)
+
+        pl.hgetall(self.cart_key)
+        pl.smembers(self.cart_selected_key)
+        cart_redis, sku_ids = pl.execute()[-2:]
+
+        return self._to_cart_dict(cart_redis, sku_ids)
+
+    def merge(self, cart_dict):
+        """
+        将cookie中的购物车数据合并到redis购物车记录中
+        cart_dict: {
+            <sku_id>: {
+                'count': <count>,
+                'selected': <selected>
+            },
+            ...
+        }
+        """
+        self.set_many([(sku_id, item['count'], item['selected']) for sku_id, item in cart_dict.items()])
+
+
+# 单hash存储：每个商品的value = count * 2 + selected
+# 所有脚本的KEYS[1]: 单hash KEYS[2]: 旧的购物车hash KEYS[3]: 旧的勾选状态set
+# 执行脚本前先将旧的存储格式转换为单hash存储(在线迁移)
+MIGRATE_SCRIPT = """
+if redis.call('exists', KEYS[2]) == 1 then
+    local cart = redis.call('hgetall', KEYS[2])
+    for i = 1, #cart, 2 do
+        local selected = redis.call('sismember', KEYS[3], cart[i])
+        redis.call('hset', KEYS[1], cart[i], tonumber(cart[i + 1]) * 2 + selected)
+    end
+end
+redis.call('del', KEYS[2], KEYS[3])
+"""
+
+PACKED_GET_SCRIPT = MIGRATE_SCRIPT + """
+return redis.call('hgetall', KEYS[1])
+"""
+
+# ARGV: sku_id1, count1, selected1, sku_id2, count2, selected2, ...
+PACKED_ADD_SCRIPT = MIGRATE_SCRIPT + """
+for i = 1, #ARGV, 3 do
+    local value = tonumber(redis.call('hget', KEYS[1], ARGV[i]) or 0)
+    local count = math.floor(value / 2) + tonumber(ARGV[i + 1])
+    local selected = value % 2
+    if ARGV[i + 2] == '1' then
+        selected = 1
+    end
+    redis.call('hset', KEYS[1], ARGV[i], count * 2 + selected)
+end
+return 1
+"""
+
+# ARGV: sku_id1, value1, sku_id2, value2, ...
+PACKED_SET_SCRIPT = MIGRATE_SCRIPT + """
+redis.call('hmset', KEYS[1], unpack(ARGV))
+return 1
+"""
+
+# ARGV: sku_id1, sku_id2, ...
+PACKED_REMOVE_SCRIPT = MIGRATE_SCRIPT + """
+return redis.call('hdel', KEYS[1], unpack(ARGV))
+"""
+
+# ARGV[1]: 1: 勾选 0: 取消勾选 ARGV[2]...: sku_id 不传sku_id时表示全部商品
+PACKED_SELECT_SCRIPT = MIGRATE_SCRIPT + """
+local sku_ids = {}
+if #ARGV > 1 then
+    for i = 2, #ARGV do
+        sku_ids[#sku_ids + 1] = ARGV[i]
+    end
+else
+    sku_ids = redis.call('hkeys', KEYS[1])
+end
+local selected = tonumber(ARGV[1])
+for i = 1, #sku_ids do
+    local value = redis.call('hget', KEYS[1], sku_ids[i])
+    if value then
+        value = tonumber(value)
+        redis.call('hset', KEYS[1], sku_ids[i], value - value % 2 + selected)
+    end
+end
+return #sku_ids
+"""
+
+
+# ARGV: action1, sku_id1, count1, selected1, action2, ...
+PACKED_APPLY_SCRIPT = MIGRATE_SCRIPT + """
+for i = 1, #ARGV, 4 do
+    local action = ARGV[i]
+    local sku_id = ARGV[i + 1]
+    if action == 'delete' then
+        redis.call('hdel', KEYS[1], sku_id)
+    elseif action == 'set' then
+        redis.call('hset', KEYS[1], sku_id, tonumber(ARGV[i + 2]) * 2 + tonumber(ARGV[i + 3]))
+    else
+        local value = tonumber(redis.call('hget', KEYS[1], sku_id) or 0)
+        local count = math.floor(value / 2) + tonumber(ARGV[i + 2])
+        local selected = value % 2
+        if ARGV[i + 3] == '1' then
+            selected = 1
+        end
+        redis.call('hset', KEYS[1], sku_id, count * 2 + selected)
+    end
+end
+return redis.call('hgetall', KEYS[1])
+"""
+
+
+def pack_value(count, selected):
+    """将商品数量和勾选状态保存到一个整数中"""
+    return int(count) * 2 + (1 if selected else 0)
+
+
+def unpack_value(value):
+    """单hash中的value -> (count, selected)"""
+    value = int(value)
+    return value >> 1, bool(value & 1)
+
+
+class PackedCartStore(CartStore):
+    """
+    登录用户的redis购物车记录(单hash存储):
+    hash: cart_packed_<user_id> 存储购物车中添加的商品id和对应的value
+    value = count * 2 + selected，HGETALL一次即可获取整个购物车
+    第一次访问时将旧的 cart_<user_id> 和 cart_selected_<user_id> 转换为单hash存储
+    """
+    def __init__(self, user_id, redis_conn=None):
+        super().__init__(user_id, redis_conn)
+        self.cart_packed_key = 'cart_packed_%s' % user_id
+
+    def _execute(self, script, args):
+        script = self.redis_conn.register_script(script)
+        return script(keys=[self.cart_packed_key, self.cart_key, self.cart_selected_key], args=args)
+
+    def get_cart(self):
+        cart_redis = self._execute(PACKED_GET_SCRIPT, [])
+        return self._to_packed_cart_dict(cart_redis)
+
+    def _to_packed_cart_dict(self, cart_redis):
+        """[b'<sku_id>', b'<value>', ...] -> 购物车字典"""
+        cart_dict = {}
+        for i in range(0, len(cart_redis), 2):
+            count, selected = unpack_value(cart_redis[i + 1])
+            cart_dict[int(cart_redis[i])] = {
+                'count': count,
+                'selected': selected
+            }
+        return cart_dict
+
+    def add_many(self, items):
+        if not items:
+            return
+
+        args = []
+        for sku_id, count, selected in items:
+            args.extend([sku_id, count, 1 if selected else 0])
+        self._execute(PACKED_ADD_SCRIPT, args)
+
+    def set_many(self, items):
+        if not items:
+            return
+
+        args = []
+        for sku_id, count, selected in items:
+            args.extend([sku_id, pack_value(count, selected)])
+        self._execute(PACKED_SET_SCRIPT, args)
+
+    def remove(self, *sku_ids):
+        if not sku_ids:
+            return
+
+        self._execute(PACKED_REMOVE_SCRIPT, list(sku_ids))
+
+    def select_many(self, sku_ids, selected):
+        if not sku_ids:
+            return
+
+        self._execute(PACKED_SELECT_SCRIPT, [1 if selected else 0] + list(sku_ids))
+
+    def select_all(self, selected):
+        self._execute(PACKED_SELECT_SCRIPT, [1 if selected else 0])
+
+    def apply(self, operations):
+        args = []
+        for action, sku_id, count, selected in operations:
+            args.extend([action, sku_id, count or 0, 1 if selected else 0])
+
+        cart_redis = self._execute(PACKED_APPLY_SCRIPT, args)
+        return self._to_packed_cart_dict(cart_redis)
+
+    def migrate(self):
+        """将旧的存储格式转换为单hash存储"""
+        self._execute(MIGRATE_SCRIPT, [])
+
+
+def get_cart_store(user_id):
+    """返回配置文件中指定的购物车记录存储类(CART_STORE_CLASS)的对象"""
+    store_class = import_string(getattr(settings, 'CART_STORE_CLASS', 'cart.store.CartStore'))
+    return store_class(user_id)
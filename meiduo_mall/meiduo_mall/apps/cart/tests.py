@@ -1,6 +1,10 @@
-from django.test import TestCase
+from django.test import TestCase, SimpleTestCase
 import pickle
 import base64
+import os
+from unittest import mock
+
+from cart import codec
 
 
 # pickle.dumps(obj|dict): 将传入的字典或对象转换为bytes字节流
@@ -55,3 +59,75 @@ import base64
 #     res = base64.b64encode(pickle.dumps(cart_dict)).decode()
 #     # response.set_cookie('cart', res, max_age='过期时间: s')
 #     print(res)
+
+
+class LegacyCookieCartTest(SimpleTestCase):
+    """旧版本pickle格式cookie购物车的解析"""
+
+    def test_loads_legacy_cart(self):
+        cart_dict = {1: {'count': 2, 'selected': True}, 3: {'count': 1, 'selected': False}}
+        cookie_cart = base64.urlsafe_b64encode(pickle.dumps(cart_dict)).decode()
+
+        self.assertEqual(codec.loads(cookie_cart), cart_dict)
+
+    def test_reject_pickle_globals(self):
+        """构造了全局对象(可以执行任意代码)的数据解析为空购物车"""
+        class Exploit(object):
+            def __reduce__(self):
+                return os.system, ('true',)
+
+        cookie_cart = base64.urlsafe_b64encode(pickle.dumps(Exploit())).decode()
+
+        with mock.patch('os.system') as system:
+            self.assertEqual(codec.loads(cookie_cart), {})
+        system.assert_not_called()
+
+
+class CookieCartCodecTest(SimpleTestCase):
+    """cookie购物车编码格式的测试"""
+
+    def assertRoundTrip(self, cart_dict):
+        self.assertEqual(codec.loads(codec.dumps(cart_dict)), cart_dict)
+
+    def test_round_trip(self):
+        self.assertRoundTrip({
+            1: {'count': 2, 'selected': True},
+            3: {'count': 1, 'selected': False},
+            5: {'count': 3, 'selected': True}
+        })
+
+    def test_empty_cart(self):
+        self.assertRoundTrip({})
+        self.assertEqual(codec.loads(''), {})
+
+    def test_varint_boundaries(self):
+        """sku_id差值和count跨越varint的字节数边界"""
+        values = [0, 1, 63, 64, 127, 128, 8191, 8192, 16383, 16384, (1 << 31) - 1, 1 << 40]
+
+        cart_dict = {}
+        sku_id = 0
+        for i, value in enumerate(values):
+            sku_id += value + 1
+            cart_dict[sku_id] = {'count': value, 'selected': i % 3 == 0}
+
+        self.assertRoundTrip(cart_dict)
+
+    def test_compressed(self):
+        """商品较多时压缩保存，勾选状态位图跨越多个字节"""
+        cart_dict = {sku_id: {'count': 1, 'selected': sku_id % 2 == 0} for sku_id in range(1, 201)}
+
+        cookie_cart = codec.dumps(cart_dict)
+        data = base64.urlsafe_b64decode(cookie_cart + '=' * (-len(cookie_cart) % 4))
+
+        self.assertTrue(data[0] & codec.FLAG_COMPRESSED)
+        self.assertEqual(codec.loads(cookie_cart), cart_dict)
+
+    def test_version_mismatch(self):
+        """版本号不同或者数据被截断时解析为空购物车"""
+        cookie_cart = codec.dumps({1: {'count': 2, 'selected': True}})
+        data = base64.urlsafe_b64decode(cookie_cart + '=' * (-len(cookie_cart) % 4))
+
+        other_version = bytes([(codec.VERSION + 1) << 1]) + data[1:]
+        self.assertEqual(codec.loads(base64.urlsafe_b64encode(other_version).decode()), {})
+
+        self.assertEqual(codec.loads(base64.urlsafe_b64encode(data[:-1]).decode()), {})
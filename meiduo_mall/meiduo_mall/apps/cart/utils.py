@@ -1,8 +1,8 @@
 # 封装合并购物车记录函数
-import base64
-import pickle
-
-from django_redis import get_redis_connection
+from cart import codec
+from cart.serializers import CartSKUSerializer
+from cart.store import get_cart_store
+from goods.cache import get_sku_snapshots
 
 
 def merge_cookie_cart_to_redis(request, user, response):
@@ -27,54 +27,44 @@ def merge_cookie_cart_to_redis(request, user, response):
     #     },
     #     ...
     # }
-    cart_dict = pickle.loads(base64.b64decode(cookie_cart.encode())) # {}
+    cart_dict = codec.loads(cookie_cart) # {}
     if not cart_dict:
         # 字典为空，cookie购物车中无数据，不需要合并
         return
 
     # 2. 将cookie中购物车数据合并对应redis购物车记录中
-    # 组织数据
-    # 保存cookie购物车数据中添加的商品id和对应的数量count，
-    # 在进行合并时将cart的key和value作为属性和值设置到redis hash中
-    # {
-    #     '<sku_id>': '<count>',
-    #     ...
-    # }
-    cart = {}
-
-    # 保存cookie购物车数据中被勾选的商品id，
-    # 在进行合并时将cart_selected_add商品id添加到redis set中
-    cart_selected_add = []
-
-    # 保存cookie购物车数据中未被勾选的商品id，
-    # 在进行合并时将cart_selected_remove商品id从redis set中移除
-    cart_selected_remove = []
-
-    for sku_id, count_selected in cart_dict.items():
-        cart[sku_id] = count_selected['count']
+    # 商品id和对应的数量count作为属性和值设置到redis hash中，
+    # 被勾选的商品id添加到redis set中，未被勾选的商品id从redis set中移除
+    get_cart_store(user.id).merge(cart_dict)
 
-        if count_selected['selected']:
-            # 勾选
-            cart_selected_add.append(sku_id)
-        else:
-            # 未勾选
-            cart_selected_remove.append(sku_id)
-
-    # 进行合并
-    redis_conn = get_redis_connection('cart')
+    # 3. 删除cookie中的购物车数据
+    response.delete_cookie('cart')
 
-    # 在进行合并时将cart的key和value作为属性和值设置到redis hash中
-    cart_key = 'cart_%s' % user.id
-    redis_conn.hmset(cart_key, cart)
 
-    # 在进行合并时将cart_selected_add商品id添加到redis set中
-    cart_selected_key = 'cart_selected_%s' % user.id
-    if cart_selected_add:
-        redis_conn.sadd(cart_selected_key, *cart_selected_add)
+def get_cart_skus_data(cart_dict):
+    """
+    根据购物车记录获取购物车中商品的序列化数据:
+    cart_dict: {
+        <sku_id>: {
+            'count': <count>,
+            'selected': <selected>
+        },
+        ...
+    }
+    """
+    # 根据用户购物车中商品的id获取对应商品的快照数据
+    # 缓存未命中时：select * from tb_sku where id in (1, 3, 5);
+    snapshots = get_sku_snapshots(cart_dict.keys())
 
-    # 在进行合并时将cart_selected_remove商品id从redis set中移除
-    if cart_selected_remove:
-        redis_conn.srem(cart_selected_key, *cart_selected_remove)
+    skus = []
+    for sku_id in sorted(snapshots):
+        # 给商品快照增加count和selected
+        # 分别保存该商品在用户购物车中添加的数量和勾选状态
+        sku = dict(snapshots[sku_id])
+        sku['count'] = cart_dict[sku_id]['count']
+        sku['selected'] = cart_dict[sku_id]['selected']
+        skus.append(sku)
 
-    # 3. 删除cookie中的购物车数据
-    response.delete_cookie('cart')
+    # 将购物车数据序列化
+    serializer = CartSKUSerializer(skus, many=True)
+    return serializer.data
@@ -1,15 +1,11 @@
-import base64
-import pickle
-
-from django_redis import get_redis_connection
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from cart import constants
-from cart.serializers import CartSerializer, CartSKUSerializer, CartDelSerializer, CartSelectSerializer
-
-from goods.models import SKU
+from cart import constants, codec
+from cart.serializers import CartSerializer, CartDelSerializer, CartSelectSerializer, CartBatchSerializer
+from cart.store import get_cart_store
+from cart.utils import get_cart_skus_data
 
 
 # /cart/ jwt token
@@ -44,16 +40,8 @@ class CartView(APIView):
         # 2. 删除用户的购物车记录
         if user and user.is_authenticated:
             # 2.1 如果用户已登录，删除redis中对应的购物车记录
-            # redis链接
-            redis_conn = get_redis_connection('cart')
-
-            # 删除hash中sku_id属性和对应的值
-            cart_key = 'cart_%s' % user.id
-            redis_conn.hdel(cart_key, sku_id)
-
-            # 删除set中勾选状态
-            cart_selected_key = 'cart_selected_%s' % user.id
-            redis_conn.srem(cart_selected_key, sku_id)
+            # 删除hash中sku_id属性和对应的值以及set中勾选状态
+            get_cart_store(user.id).remove(sku_id)
 
             # 返回应答
             return Response(status=status.HTTP_204_NO_CONTENT)
@@ -75,7 +63,7 @@ class CartView(APIView):
             #     },
             #     ...
             # }
-            cart_dict = pickle.loads(base64.b64decode(cookie_cart.encode()))  # {}
+            cart_dict = codec.loads(cookie_cart)  # {}
 
             if not cart_dict:
                 # 字典为空，购物车无数据，不需要删除
@@ -85,7 +73,7 @@ class CartView(APIView):
             if sku_id in cart_dict:
                 del cart_dict[sku_id]
                 # 设置cookie购物车数据
-                cart_data = base64.b64encode(pickle.dumps(cart_dict)).decode()
+                cart_data = codec.dumps(cart_dict)
                 response.set_cookie('cart', cart_data, max_age=constants.CART_COOKIE_EXPIRES)
 
             # 3. 返回应答，购物车记录删除成功
@@ -119,22 +107,8 @@ class CartView(APIView):
         # 2. 修改用户的购物车记录
         if user and user.is_authenticated:
             # 2.1 如果用户已登录，修改redis中对应的购物车记录
-            # redis链接
-            redis_conn = get_redis_connection('cart')
-
-            # 修改hash中sku_id属性对应值
-            cart_key = 'cart_%s' % user.id
-            redis_conn.hset(cart_key, sku_id, count)
-
-            # 修改勾选状态
-            cart_selected_key = 'cart_selected_%s' % user.id
-
-            if selected:
-                # 将sku_id添加到set中
-                redis_conn.sadd(cart_selected_key, sku_id)
-            else:
-                # 将sku_id从set中移除
-                redis_conn.srem(cart_selected_key, sku_id)
+            # 修改hash中sku_id属性对应值和set中勾选状态
+            get_cart_store(user.id).set(sku_id, count, selected)
 
             return Response(serializer.validated_data)
         else:
@@ -156,7 +130,7 @@ class CartView(APIView):
             #     },
             #     ...
             # }
-            cart_dict = pickle.loads(base64.b64decode(cookie_cart.encode())) # {}
+            cart_dict = codec.loads(cookie_cart) # {}
 
             if not cart_dict:
                 # 字典为空，购物车无数据，不需要修改
@@ -169,7 +143,7 @@ class CartView(APIView):
             }
 
             # 3. 返回应答，购物车记录修改成功
-            cart_data = base64.b64encode(pickle.dumps(cart_dict)).decode()
+            cart_data = codec.dumps(cart_dict)
             response.set_cookie('cart', cart_data, max_age=constants.CART_COOKIE_EXPIRES)
             return response
 
@@ -192,25 +166,6 @@ class CartView(APIView):
         # 1. 获取用户购物车的记录
         if user and user.is_authenticated:
             # 1.1 如果用户已登录，从redis中获取用户的购物车记录
-            # redis链接
-            redis_conn = get_redis_connection('cart')
-
-            # 从redis hash中获取用户购物车中添加的商品的id和对应的数量count
-            cart_key = 'cart_%s' % user.id
-
-            # {
-            #     b'<sku_id>': b'<count>',
-            #     ...
-            # }
-            cart_redis = redis_conn.hgetall(cart_key)
-
-            # 从redis set中获取用户购物车被勾选的商品的id
-            cart_selected_key = 'cart_selected_%s' % user.id
-
-            # Set(b'<sku_id>', b'<sku_id>', ...)
-            sku_ids = redis_conn.smembers(cart_selected_key)
-
-            # 组织数据
             # {
             #     '<sku_id>': {
             #         'count': '<count>',
@@ -218,13 +173,7 @@ class CartView(APIView):
             #     },
             #     ...
             # }
-            cart_dict = {}
-
-            for sku_id, count in cart_redis.items():
-                cart_dict[int(sku_id)] = {
-                    'count': int(count),
-                    'selected': sku_id in sku_ids
-                }
+            cart_dict = get_cart_store(user.id).get_cart()
         else:
             # 1.2 如果用户未登录，从cookie中获取用户的购物车记录
             # 获取cookie中购物车数据
@@ -239,25 +188,13 @@ class CartView(APIView):
                 #     },
                 #     ...
                 # }
-                cart_dict = pickle.loads(base64.b64decode(cookie_cart.encode()))
+                cart_dict = codec.loads(cookie_cart)
             else:
                 cart_dict = {}
 
         # 2. 根据用户购物车中商品的id获取对应商品的数据
-        cart_sku_ids = cart_dict.keys() # (1, 3, 5)
-
-        # select * from tb_sku where id in (1, 3, 5);
-        skus = SKU.objects.filter(id__in=cart_sku_ids)
-
-        for sku in skus:
-            # 给sku对象增加属性count和selected
-            # 分别保存该对象在用户购物车中添加的商品的数量和勾选状态
-            sku.count = cart_dict[sku.id]['count']
-            sku.selected = cart_dict[sku.id]['selected']
-
         # 3. 将购物车数据序列化并返回
-        serializer = CartSKUSerializer(skus, many=True)
-        return Response(serializer.data)
+        return Response(get_cart_skus_data(cart_dict))
 
     # POST /cart/
     def post(self, request):
@@ -288,19 +225,10 @@ class CartView(APIView):
         # 2. 保存用户的购物车记录
         if user and user.is_authenticated:
             # 2.1 如果用户已登录，在redis中存储用户的购物车记录
-            # 获取redis链接
-            redis_conn = get_redis_connection('cart')
-
             # hash: 存储登录用户购物车添加的商品id和对应数量count
             # 如果该商品已经添加过，购物车记录中商品的数量需要进行累加
-            cart_key = 'cart_%s' % user.id
-            redis_conn.hincrby(cart_key, sku_id, count)
-
             # set: 存储登录用户购物车中被勾选的商品的id
-            cart_selected_key = 'cart_selected_%s' % user.id
-
-            if selected:
-                redis_conn.sadd(cart_selected_key, sku_id)
+            get_cart_store(user.id).add(sku_id, count, selected)
 
             return Response(serializer.validated_data, status=status.HTTP_201_CREATED)
         else:
@@ -317,7 +245,7 @@ class CartView(APIView):
                 #     },
                 #     ...
                 # }
-                cart_dict = pickle.loads(base64.b64decode(cookie_cart.encode()))
+                cart_dict = codec.loads(cookie_cart)
             else:
                 cart_dict = {}
 
@@ -334,7 +262,7 @@ class CartView(APIView):
             # 3. 返回应答，购物车记录添加成功
             response = Response(serializer.data, status=status.HTTP_201_CREATED)
             # 设置cookie购物车数据
-            cart_data = base64.b64encode(pickle.dumps(cart_dict)).decode()
+            cart_data = codec.dumps(cart_dict)
             response.set_cookie('cart', cart_data, max_age=constants.CART_COOKIE_EXPIRES)
             return response
 
@@ -370,20 +298,9 @@ class CartSelectView(APIView):
         # 2. 设置购物车记录的勾选状态 True: 全选 False: 取消全选
         if user and user.is_authenticated:
             # 2.1 如果用户已登录，操作redis中对应的购物车记录
-            # 获取redis链接
-            redis_conn = get_redis_connection('cart')
-
-            # 从redis hash中获取用户购物车中所有商品的id
-            cart_key = 'cart_%s' % user.id
-            sku_ids = redis_conn.hkeys(cart_key)
-
-            cart_selected_key = 'cart_selected_%s' % user.id
-            if selected:
-                # 全选：将用户购物车中所有商品sku_id添加到redis set中
-                redis_conn.sadd(cart_selected_key, *sku_ids)
-            else:
-                # 全不选：将用户购物车中所有商品sku_id从redis set中移除
-                redis_conn.srem(cart_selected_key, *sku_ids)
+            # 全选：将用户购物车中所有商品sku_id添加到redis set中
+            # 全不选：将用户购物车中所有商品sku_id从redis set中移除
+            get_cart_store(user.id).select_all(selected)
 
             # 返回应答
             return Response({'message': 'OK'})
@@ -401,7 +318,7 @@ class CartSelectView(APIView):
                 #     },
                 #     ...
                 # }
-                cart_dict = pickle.loads(base64.b64decode(cookie_cart.encode()))
+                cart_dict = codec.loads(cookie_cart)
             else:
                 cart_dict = {}
 
@@ -412,10 +329,73 @@ class CartSelectView(APIView):
             # 3. 返回应答
             response = Response({'message': 'OK'})
             # 设置cookie购物车记录
-            cart_data = base64.b64encode(pickle.dumps(cart_dict)).decode()
+            cart_data = codec.dumps(cart_dict)
             response.set_cookie('cart', cart_data, max_age=constants.CART_COOKIE_EXPIRES)
             return response
 
 
+# POST /cart/batch/
+class CartBatchView(APIView):
+    def perform_authentication(self, request):
+        """让当前视图跳过DRF框架认证过程"""
+        pass
+
+    def post(self, request):
+        """
+        购物车记录批量操作:
+        1. 获取操作列表并进行校验(操作类型，所有商品是否存在，商品库存是否足够)
+        2. 依次执行所有操作
+            2.1 如果用户已登录，在一个redis事务中操作redis中的购物车记录
+            2.2 如果用户未登录，操作cookie中的购物车记录
+        3. 返回操作之后的购物车数据
+        """
+        # 1. 获取操作列表并进行校验(操作类型，所有商品是否存在，商品库存是否足够)
+        serializer = CartBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
 
+        # [(action, sku_id, count, selected), ...]
+        operations = [(operation['action'], operation['sku_id'], operation.get('count'), operation['selected'])
+                      for operation in serializer.validated_data['operations']]
 
+        try:
+            # 触发认证机制
+            user = request.user
+        except Exception:
+            user = None
+
+        # 2. 依次执行所有操作
+        if user and user.is_authenticated:
+            # 2.1 如果用户已登录，在一个redis事务中操作redis中的购物车记录，并获取操作之后的购物车记录
+            cart_dict = get_cart_store(user.id).apply(operations)
+
+            # 3. 返回操作之后的购物车数据
+            return Response(get_cart_skus_data(cart_dict))
+        else:
+            # 2.2 如果用户未登录，操作cookie中的购物车记录
+            cart_dict = codec.loads(request.COOKIES.get('cart'))
+
+            for action, sku_id, count, selected in operations:
+                if action == 'add':
+                    # 数据累加
+                    if sku_id in cart_dict:
+                        count += cart_dict[sku_id]['count']
+
+                    cart_dict[sku_id] = {
+                        'count': count,
+                        'selected': selected
+                    }
+                elif action == 'set':
+                    cart_dict[sku_id] = {
+                        'count': count,
+                        'selected': selected
+                    }
+                else:
+                    cart_dict.pop(sku_id, None)
+
+            # 3. 返回操作之后的购物车数据
+            response = Response(get_cart_skus_data(cart_dict))
+
+            # 设置cookie购物车数据
+            cart_data = codec.dumps(cart_dict)
+            response.set_cookie('cart', cart_data, max_age=constants.CART_COOKIE_EXPIRES)
+            return response
@@ -0,0 +1,3 @@
+# 首页数据修改之后重新生成首页静态页面的防抖时间: s
+# 这段时间内的多次修改只会生成一次首页
+INDEX_HTML_DEBOUNCE_SECONDS = 5
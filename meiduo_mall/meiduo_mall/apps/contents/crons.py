@@ -1,13 +1,12 @@
 # 定义函数生成首页的静态页面
-import os
+# 首页数据修改时由contents.signals发出防抖的生成任务，也可以手动执行生成
 import time
 
-from django.conf import settings
 from django.template import loader
 
 from contents.models import ContentCategory
-from goods.models import GoodsChannel
-from collections import OrderedDict
+from goods.utils import get_categories
+from meiduo_mall.utils.publisher import StaticFilePublisher
 
 
 def generate_static_index_html():
@@ -25,35 +24,7 @@ def generate_static_index_html():
     # }
     print('generate_static_index_html: %s' % time.ctime())
 
-    categories = OrderedDict() # 有序字典
-
-    # 获取`频道`数据
-    channels = GoodsChannel.objects.order_by('group_id', 'sequence')
-
-    for channel in channels:
-        # 获取频道组id
-        group_id = channel.group_id
-
-        if group_id not in categories:
-            categories[group_id] = {'channels': [], 'sub_cats': []}
-
-        # 获取频道关联一级分类
-        cat1 = channel.category
-
-        categories[group_id]['channels'].append({
-            'id': cat1.id,
-            'name': cat1.name,
-            'url': channel.url
-        })
-
-        # 获取和一级分类关联的二级分类
-        for cat2 in cat1.goodscategory_set.all():
-            cat2.sub_cats = []
-            # 获取和二级分类关联的三级分类
-            for cat3 in cat2.goodscategory_set.all():
-                cat2.sub_cats.append(cat3)
-
-            categories[group_id]['sub_cats'].append(cat2)
+    categories = get_categories()
 
     # 首页广告
     # {
@@ -82,8 +53,8 @@ def generate_static_index_html():
     # 模板渲染：给模板文传数据，将模板文件中变量进行替换，获取替换之后html页面
     res_html = temp.render(context)
 
-    # 3. 保存静态页面：将渲染之后的html内容保存成一个静态文件
-    save_path = os.path.join(settings.GENERATED_STATIC_HTML_FILES_DIR, 'index.html')
+    # 3. 保存静态页面：将渲染之后的html内容发布成一个静态文件，内容未变化时不再写入
+    publisher = StaticFilePublisher()
+    publisher.publish('index.html', res_html)
 
-    with open(save_path, 'w', encoding='utf8') as f:
-        f.write(res_html)
+    print('generate_static_index_html: %s' % publisher.stats())
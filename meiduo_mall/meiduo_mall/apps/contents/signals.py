@@ -0,0 +1,18 @@
+# 首页相关的信号处理函数
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from contents import constants
+from contents.models import Content, ContentCategory
+from goods.models import GoodsCategory, GoodsChannel
+from meiduo_mall.utils.debounce import debounce_task
+
+
+@receiver([post_save, post_delete], sender=Content)
+@receiver([post_save, post_delete], sender=ContentCategory)
+@receiver([post_save, post_delete], sender=GoodsCategory)
+@receiver([post_save, post_delete], sender=GoodsChannel)
+def generate_static_index_html_later(sender, **kwargs):
+    """首页广告、商品分类或频道修改或删除之后，发出重新生成首页静态页面的任务"""
+    from celery_tasks.html.tasks import generate_static_index_html
+    debounce_task(generate_static_index_html, 'index_html', constants.INDEX_HTML_DEBOUNCE_SECONDS)
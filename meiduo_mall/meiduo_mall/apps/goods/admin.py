@@ -1,20 +1,27 @@
 from django.contrib import admin
 
-from goods import models
+from goods import constants, models
+from meiduo_mall.utils.debounce import debounce_task
 
 # Register your models here.
 
 
+def generate_static_spu_pages_later(spu_id):
+    """发出重新生成SPU下所有静态详情页面的任务，防抖时间内同一SPU的多次修改只生成一次"""
+    from celery_tasks.html.tasks import generate_static_spu_pages
+    debounce_task(generate_static_spu_pages, 'spu_pages_%s' % spu_id, constants.SPU_PAGES_DEBOUNCE_SECONDS,
+                  args=(spu_id,))
+
+
 # save_model和delete_model
 class SKUAdmin(admin.ModelAdmin):
     """SKU模型Admin管理类"""
     def save_model(self, request, obj, form, change):
-        # 数据保存
+        # 数据保存(商品快照缓存由goods.signals在事务提交之后清除)
         obj.save()
 
-        # 发出任务消息
-        from celery_tasks.html.tasks import generate_static_sku_detail_html
-        generate_static_sku_detail_html.delay(obj.id)
+        # 发出任务消息: SKU的增加或修改会影响同一SPU下其他页面的规格选项
+        generate_static_spu_pages_later(obj.spu_id)
 
 
 class SKUSpecificationAdmin(admin.ModelAdmin):
@@ -22,18 +29,16 @@ class SKUSpecificationAdmin(admin.ModelAdmin):
         # 数据保存
         obj.save()
 
-        # 发出任务消息
-        from celery_tasks.html.tasks import generate_static_sku_detail_html
-        generate_static_sku_detail_html.delay(obj.sku.id)
+        # 发出任务消息: SKU规格的修改会影响同一SPU下其他页面的规格选项
+        generate_static_spu_pages_later(obj.sku.spu_id)
 
     def delete_model(self, request, obj):
         # 数据删除
-        sku_id = obj.sku.id
+        spu_id = obj.sku.spu_id
         obj.delete()
 
         # 发出任务消息
-        from celery_tasks.html.tasks import generate_static_sku_detail_html
-        generate_static_sku_detail_html.delay(sku_id)
+        generate_static_spu_pages_later(spu_id)
 
 
 class SKUImageAdmin(admin.ModelAdmin):
@@ -42,8 +47,7 @@ class SKUImageAdmin(admin.ModelAdmin):
         obj.save()
 
         # 发出任务消息
-        from celery_tasks.html.tasks import generate_static_sku_detail_html
-        generate_static_sku_detail_html.delay(obj.sku.id)
+        generate_static_spu_pages_later(obj.sku.spu_id)
 
         # 设置SKU默认图片
         sku = obj.sku
@@ -53,12 +57,11 @@ class SKUImageAdmin(admin.ModelAdmin):
 
     def delete_model(self, request, obj):
         # 数据删除
-        sku_id = obj.sku.id
+        spu_id = obj.sku.spu_id
         obj.delete()
 
         # 发出任务消息
-        from celery_tasks.html.tasks import generate_static_sku_detail_html
-        generate_static_sku_detail_html.delay(sku_id)
+        generate_static_spu_pages_later(spu_id)
 
 admin.site.register(models.GoodsCategory)
 admin.site.register(models.GoodsChannel)
@@ -0,0 +1,129 @@
+# 封装商品快照(SKU常用字段)的读缓存
+# 两级缓存：进程内LRU缓存 -> redis缓存 -> 数据库
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache
+
+from goods import constants
+from goods.models import SKU
+
+
+def make_sku_snapshot(sku):
+    """根据SKU对象生成商品快照"""
+    return {
+        'id': sku.id,
+        'name': sku.name,
+        'price': sku.price,
+        'default_image': sku.default_image.url if sku.default_image else None,
+        'stock': sku.stock,
+        'is_launched': sku.is_launched,
+        'comments': sku.comments
+    }
+
+
+class LocalLRUCache(object):
+    """进程内的LRU缓存，缓存数据有过期时间"""
+    def __init__(self, max_size, expires):
+        self.max_size = max_size
+        self.expires = expires
+        # {<key>: (<过期时间>, <value>), ...}
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_many(self, keys):
+        now = time.time()
+        res = {}
+        with self.lock:
+            for key in keys:
+                item = self.data.get(key)
+                if item is None:
+                    continue
+
+                if item[0] < now:
+                    # 已过期
+                    del self.data[key]
+                    continue
+
+                # 最近访问过的数据移动到末尾
+                self.data.move_to_end(key)
+                res[key] = item[1]
+        return res
+
+    def set_many(self, data):
+        expire_at = time.time() + self.expires
+        with self.lock:
+            for key, value in data.items():
+                self.data[key] = (expire_at, value)
+                self.data.move_to_end(key)
+
+            # 超过最大数量时，删除最久没有访问的数据
+            while len(self.data) > self.max_size:
+                self.data.popitem(last=False)
+
+    def delete_many(self, keys):
+        with self.lock:
+            for key in keys:
+                self.data.pop(key, None)
+
+
+local_cache = LocalLRUCache(constants.SKU_SNAPSHOT_LOCAL_MAX_SIZE, constants.SKU_SNAPSHOT_LOCAL_EXPIRES)
+
+
+def _cache_key(sku_id):
+    return 'sku_snapshot_%s' % sku_id
+
+
+def get_sku_snapshots(sku_ids):
+    """
+    获取多个商品的快照，不存在的商品不会返回:
+    {
+        <sku_id>: {'id': .., 'name': .., 'price': .., 'default_image': .., 'stock': .., 'is_launched': .., 'comments': ..},
+        ...
+    }
+    """
+    sku_ids = set(int(sku_id) for sku_id in sku_ids)
+
+    # 1. 进程内缓存
+    snapshots = local_cache.get_many(sku_ids)
+    missing = sku_ids - snapshots.keys()
+
+    if not missing:
+        return snapshots
+
+    # 2. redis缓存
+    cached = cache.get_many([_cache_key(sku_id) for sku_id in missing])
+    redis_snapshots = {snapshot['id']: snapshot for snapshot in cached.values()}
+    missing -= redis_snapshots.keys()
+
+    # 3. 数据库
+    # select * from tb_sku where id in (...);
+    db_snapshots = {}
+    if missing:
+        for sku in SKU.objects.filter(id__in=missing):
+            db_snapshots[sku.id] = make_sku_snapshot(sku)
+
+        cache.set_many({_cache_key(sku_id): snapshot for sku_id, snapshot in db_snapshots.items()},
+                       constants.SKU_SNAPSHOT_CACHE_EXPIRES)
+
+    redis_snapshots.update(db_snapshots)
+    local_cache.set_many(redis_snapshots)
+
+    snapshots.update(redis_snapshots)
+    return snapshots
+
+
+def get_sku_snapshot(sku_id):
+    """获取单个商品的快照，商品不存在时返回None"""
+    return get_sku_snapshots([sku_id]).get(int(sku_id))
+
+
+def invalidate_sku_snapshots(sku_ids):
+    """清除商品的快照缓存"""
+    sku_ids = [int(sku_id) for sku_id in sku_ids]
+    if not sku_ids:
+        return
+
+    local_cache.delete_many(sku_ids)
+    cache.delete_many([_cache_key(sku_id) for sku_id in sku_ids])
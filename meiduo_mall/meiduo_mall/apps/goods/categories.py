@@ -0,0 +1,71 @@
+# 商品分类服务: 在进程内保存商品分类数据的快照，商品分类或频道发生变化时刷新
+# 分类树和面包屑导航都直接从快照中读取，不需要查询数据库
+import hashlib
+import json
+import threading
+
+from goods.utils import get_categories, get_categories_version
+
+
+class CategorySnapshot(object):
+    """
+    商品分类数据快照:
+    version: 商品分类数据的版本号
+    tree: 分类树 [{'group_id': '<频道组id>', 'channels': [...], 'sub_cats': [...]}, ...]
+    breadcrumbs: 三级分类的面包屑导航 {<cat3_id>: {'cat1': {...}, 'cat2': {...}, 'cat3': {...}}, ...}
+    etag: 分类数据内容的摘要
+    """
+    def __init__(self, version, categories):
+        self.version = version
+
+        self.tree = [dict(group, group_id=group_id) for group_id, group in categories.items()]
+
+        # 一级分类对应的频道: {<cat1_id>: {'id': '<cat1_id>', 'name': '<名称>', 'url': '<频道页面地址>'}}
+        channels = {}
+        for group in categories.values():
+            for channel in group['channels']:
+                channels[channel['id']] = channel
+
+        self.breadcrumbs = {}
+        for group in categories.values():
+            for cat2 in group['sub_cats']:
+                cat1 = channels[cat2['parent_id']]
+                for cat3 in cat2['sub_cats']:
+                    self.breadcrumbs[cat3['id']] = {
+                        'cat1': {
+                            'name': cat1['name'],
+                            'url': cat1['url']
+                        },
+                        'cat2': {
+                            'name': cat2['name']
+                        },
+                        'cat3': {
+                            'name': cat3['name']
+                        }
+                    }
+
+        self.etag = hashlib.md5(json.dumps(self.tree, sort_keys=True).encode()).hexdigest()
+
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+def get_category_snapshot():
+    """
+    返回商品分类数据快照:
+    每次调用只从redis中获取一次版本号，版本号变化时重新加载快照
+    """
+    global _snapshot
+
+    version = get_categories_version()
+
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+
+    with _lock:
+        if _snapshot is None or _snapshot.version != version:
+            _snapshot = CategorySnapshot(version, get_categories())
+
+        return _snapshot
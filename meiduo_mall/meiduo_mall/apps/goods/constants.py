@@ -0,0 +1,52 @@
+# 商品快照redis缓存的有效期: s
+SKU_SNAPSHOT_CACHE_EXPIRES = 300
+
+# 商品快照进程内缓存的有效期: s
+# 进程内缓存无法被其他进程清除，有效期需要设置得较短
+SKU_SNAPSHOT_LOCAL_EXPIRES = 5
+
+# 商品快照进程内缓存的最大数量
+SKU_SNAPSHOT_LOCAL_MAX_SIZE = 2000
+
+# 商品分类数据缓存的版本号key，商品分类或频道发生变化时更新
+CATEGORIES_VERSION_KEY = 'goods_categories_version'
+
+# 商品分类数据缓存的有效期: s
+CATEGORIES_CACHE_EXPIRES = 24 * 3600
+
+# 已生成的商品详情页面依赖数据的指纹(redis hash): {<sku_id>: <fingerprint>}
+SKU_DETAIL_FINGERPRINTS_KEY = 'sku_detail_fingerprints'
+
+# 规格信息不完整、不生成详情页面的商品保存的指纹前缀，指纹不变时不需要重新检查
+SKU_DETAIL_SKIPPED_FINGERPRINT_PREFIX = 'skipped:'
+
+# SPU规格矩阵缓存的有效期: s
+SPU_SPEC_MATRIX_CACHE_EXPIRES = 3600
+
+# 后台修改商品之后重新生成SPU静态详情页面的防抖时间: s
+# 这段时间内同一SPU的多次修改只会发出一次生成页面的任务
+SPU_PAGES_DEBOUNCE_SECONDS = 10
+
+# 分类商品列表缓存的有效期: s
+SKU_LIST_CACHE_EXPIRES = 24 * 3600
+
+# 分类商品列表的一页中有已删除或已下架的商品时，移除之后重新获取这一页的最大次数
+SKU_LIST_READ_RETRIES = 2
+
+# 分类热销商品的数量
+HOT_SKUS_COUNT = 2
+
+# 库存回写和热库存加载时商品锁的有效期: s
+SKU_STOCK_LOCK_EXPIRES = 30
+
+# 预占库存时热库存未加载(商品正在回写或对账)的重试次数
+SKU_STOCK_RESERVE_RETRIES = 3
+
+# 预占库存时等待商品锁释放的间隔: s
+SKU_STOCK_RESERVE_RETRY_INTERVAL = 0.05
+
+# 商品被锁定时库存回写任务重试的间隔: s
+SKU_STOCK_WRITE_BACK_RETRY_COUNTDOWN = 1
+
+# 库存回写记录的保留时间: s，超过这个时间的记录在对账时删除
+SKU_STOCK_WRITE_BACK_KEEP = 7 * 24 * 3600
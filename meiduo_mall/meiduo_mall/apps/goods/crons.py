@@ -0,0 +1,46 @@
+# 定义商品相关的定时任务
+import time
+from datetime import timedelta
+
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from goods import constants
+from goods.listing import CategoryListing, loaded_category_ids
+from goods.models import SKUStockWriteBack
+from goods.stock import StockReservation, write_back_reservation
+
+
+def reconcile_sku_stock():
+    """redis热库存对账：使用数据库中的库存修正redis中的热库存"""
+    print('reconcile_sku_stock: %s' % time.ctime())
+
+    reservation = StockReservation()
+
+    # 回写任务发送失败的预占，在对账之前回写(重复回写时只回写一次)
+    for reservation_id, sku_counts in reservation.deferred_write_backs().items():
+        if write_back_reservation(reservation_id, sku_counts):
+            reservation.clear_deferred_write_back(reservation_id)
+
+    # 只对已经加载过热库存的商品进行对账
+    sku_ids = reservation.loaded_sku_ids()
+
+    # 分批进行对账，避免一次查询的商品过多
+    # 正在回写库存的商品会被跳过，在下一次对账时修正
+    batch_size = 500
+    for i in range(0, len(sku_ids), batch_size):
+        reservation.load(sku_ids[i:i + batch_size], overwrite=True)
+
+    # 删除过期的库存回写记录(只用于避免重复投递的回写任务重复回写)
+    expired = timezone.now() - timedelta(seconds=constants.SKU_STOCK_WRITE_BACK_KEEP)
+    SKUStockWriteBack.objects.filter(create_time__lt=expired).delete()
+
+
+def reconcile_sku_listing():
+    """分类商品列表和热销排行对账：使用数据库中的商品数据(销量等)重新加载已加载的分类商品列表缓存"""
+    print('reconcile_sku_listing: %s' % time.ctime())
+
+    redis_conn = get_redis_connection('default')
+
+    for category_id in loaded_category_ids(redis_conn):
+        CategoryListing(category_id, 'sales', redis_conn).load(force=True)
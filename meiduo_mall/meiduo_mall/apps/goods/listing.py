@@ -0,0 +1,218 @@
+# 分类商品列表缓存: 在redis中按照分类和排序字段保存已上架商品的有序sku_id
+# zset: sku_list_<category_id>_<排序字段> member为sku_id，score为排序字段的值
+# string: sku_list_loaded_<category_id> 分类的列表缓存已加载的标记
+# 商品数据修改时增量更新，未加载的分类在第一次访问时从数据库加载
+from django_redis import get_redis_connection
+
+from goods import constants
+from goods.cache import get_sku_snapshots, make_sku_snapshot
+from goods.models import SKU
+
+# 列表缓存支持的排序字段
+SORT_FIELDS = ('create_time', 'price', 'sales')
+
+# 分类的列表缓存已加载时，更新商品在各个排序zset中的分数
+# KEYS[1]: 加载标记 KEYS[2...]: 各个排序字段的zset
+# ARGV[1]: sku_id ARGV[2...]: 各个排序字段的分数
+UPDATE_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 0 then
+    return 0
+end
+for i = 2, #KEYS do
+    redis.call('zadd', KEYS[i], ARGV[i], ARGV[1])
+end
+return 1
+"""
+
+# 分类的列表缓存已加载时，增加商品的销量
+# KEYS[1]: 加载标记 KEYS[2]: 销量zset
+# ARGV[1]: sku_id ARGV[2]: 增加的销量
+INCR_SALES_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 0 then
+    return 0
+end
+if redis.call('zscore', KEYS[2], ARGV[1]) then
+    redis.call('zincrby', KEYS[2], ARGV[2], ARGV[1])
+end
+return 1
+"""
+
+
+def _loaded_key(category_id):
+    return 'sku_list_loaded_%s' % category_id
+
+
+def _sort_key(category_id, field):
+    return 'sku_list_%s_%s' % (category_id, field)
+
+
+def _scores(create_time, price, sales):
+    """返回各个排序字段的分数，顺序和SORT_FIELDS一致"""
+    return [create_time.timestamp(), float(price), sales]
+
+
+class CategoryListing(object):
+    """
+    分类商品列表，可以直接交给分页类进行分页:
+    count(): 商品数量(ZCARD)
+    [start:stop]: 按照排序获取一页商品的快照(ZRANGE + 批量获取商品快照)
+    """
+    def __init__(self, category_id, ordering, redis_conn=None):
+        if redis_conn is None:
+            redis_conn = get_redis_connection('default')
+
+        self.redis_conn = redis_conn
+        self.category_id = category_id
+        self.field = ordering.lstrip('-')
+        self.desc = ordering.startswith('-')
+
+        self.load()
+
+    def load(self, force=False):
+        """
+        分类的列表缓存未加载时，从数据库中加载
+        force: 已加载时也重新加载，用于使用数据库中的数据修正缓存
+        """
+        if not force and self.redis_conn.exists(_loaded_key(self.category_id)):
+            return
+
+        # select id, create_time, price, sales from tb_sku where category_id=<category_id> and is_launched=1;
+        skus = SKU.objects.filter(category_id=self.category_id, is_launched=True).values_list(
+            'id', 'create_time', 'price', 'sales')
+
+        pl = self.redis_conn.pipeline()
+        for field in SORT_FIELDS:
+            pl.delete(_sort_key(self.category_id, field))
+
+        for sku_id, create_time, price, sales in skus:
+            for field, score in zip(SORT_FIELDS, _scores(create_time, price, sales)):
+                pl.zadd(_sort_key(self.category_id, field), score, sku_id)
+
+        # 设置有效期，增量更新遗漏的修改在过期之后重新加载时修正
+        for field in SORT_FIELDS:
+            pl.expire(_sort_key(self.category_id, field), constants.SKU_LIST_CACHE_EXPIRES)
+        pl.set(_loaded_key(self.category_id), 1, constants.SKU_LIST_CACHE_EXPIRES)
+        pl.execute()
+
+    def count(self):
+        return self.redis_conn.zcard(_sort_key(self.category_id, self.field))
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            raise TypeError('CategoryListing只支持切片')
+
+        start = item.start or 0
+        stop = item.stop if item.stop is not None else 0
+
+        key = _sort_key(self.category_id, self.field)
+        for i in range(constants.SKU_LIST_READ_RETRIES + 1):
+            if self.desc:
+                sku_ids = [int(sku_id) for sku_id in self.redis_conn.zrevrange(key, start, stop - 1)]
+            else:
+                sku_ids = [int(sku_id) for sku_id in self.redis_conn.zrange(key, start, stop - 1)]
+
+            snapshots = get_sku_snapshots(sku_ids)
+
+            # 快照显示已删除或已下架的商品，确认之后从列表缓存中移除，再重新获取这一页，保证每页的数量和count()一致
+            stale = [sku_id for sku_id in sku_ids
+                     if sku_id not in snapshots or not snapshots[sku_id]['is_launched']]
+            if not stale:
+                break
+
+            valid = self.remove_stale(stale)
+            snapshots.update(valid)
+
+            # 都是快照缓存还未更新的有效商品，没有移除商品，不需要重新获取
+            if len(valid) == len(stale):
+                break
+
+        # 按照排序返回商品快照
+        return [snapshots[sku_id] for sku_id in sku_ids
+                if sku_id in snapshots and snapshots[sku_id]['is_launched']]
+
+    def remove_stale(self, sku_ids):
+        """
+        从列表缓存中移除数据库中已删除、已下架或者已修改分类的商品:
+        快照缓存中的数据可能还未更新，返回数据库中仍然有效的商品的快照
+        """
+        # select * from tb_sku where id in (...) and category_id=<category_id> and is_launched=1;
+        valid = {sku.id: make_sku_snapshot(sku) for sku in SKU.objects.filter(
+            id__in=sku_ids, category_id=self.category_id, is_launched=True)}
+
+        removed = [sku_id for sku_id in sku_ids if sku_id not in valid]
+        if removed:
+            pl = self.redis_conn.pipeline()
+            for field in SORT_FIELDS:
+                pl.zrem(_sort_key(self.category_id, field), *removed)
+            pl.execute()
+
+        return valid
+
+
+def get_hot_skus(category_id, count=constants.HOT_SKUS_COUNT):
+    """
+    返回分类的热销商品快照，按照销量从高到低排列:
+    直接读取列表缓存中的销量zset，下单时增量更新，定时使用数据库中的销量修正
+    """
+    return CategoryListing(category_id, '-sales')[0:count]
+
+
+def loaded_category_ids(redis_conn=None):
+    """返回列表缓存已加载的分类id"""
+    if redis_conn is None:
+        redis_conn = get_redis_connection('default')
+
+    prefix = _loaded_key('')
+    return [int(key.decode()[len(prefix):]) for key in redis_conn.scan_iter(match=prefix + '*', count=1000)]
+
+
+def update_sku_listing(sku, old_category_id=None):
+    """SKU保存之后更新列表缓存: 已上架的商品添加或更新分数，未上架的商品移除"""
+    redis_conn = get_redis_connection('default')
+
+    # 商品修改了分类，从原分类中移除
+    if old_category_id is not None and old_category_id != sku.category_id:
+        remove_sku_listing(sku.id, old_category_id, redis_conn)
+
+    if not sku.is_launched:
+        remove_sku_listing(sku.id, sku.category_id, redis_conn)
+        return
+
+    script = redis_conn.register_script(UPDATE_SCRIPT)
+    script(keys=[_loaded_key(sku.category_id)] + [_sort_key(sku.category_id, field) for field in SORT_FIELDS],
+           args=[sku.id] + _scores(sku.create_time, sku.price, sku.sales))
+
+
+def remove_sku_listing(sku_id, category_id, redis_conn=None):
+    """从分类的列表缓存中移除商品"""
+    if redis_conn is None:
+        redis_conn = get_redis_connection('default')
+
+    pl = redis_conn.pipeline()
+    for field in SORT_FIELDS:
+        pl.zrem(_sort_key(category_id, field), sku_id)
+    pl.execute()
+
+
+def incr_sku_listing_sales(sku_counts):
+    """
+    商品销量增加之后更新列表缓存中的销量:
+    sku_counts: {<sku_id>: <增加的销量>, ...}
+    """
+    if not sku_counts:
+        return
+
+    redis_conn = get_redis_connection('default')
+    script = redis_conn.register_script(INCR_SALES_SCRIPT)
+
+    # select id, category_id from tb_sku where id in (...);
+    categories = SKU.objects.filter(id__in=sku_counts.keys()).values_list('id', 'category_id')
+
+    pl = redis_conn.pipeline()
+    for sku_id, category_id in categories:
+        script(keys=[_loaded_key(category_id), _sort_key(category_id, 'sales')],
+               args=[sku_id, sku_counts[sku_id]], client=pl)
+    pl.execute()
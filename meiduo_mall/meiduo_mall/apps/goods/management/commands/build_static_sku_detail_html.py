@@ -0,0 +1,110 @@
+# 多进程生成所有商品的静态详情页面
+# 用法: python manage.py build_static_sku_detail_html [--processes N] [--chunk-size N] [--full]
+# 主进程计算需要重新生成的商品，将sku_id分片后交给进程池渲染，
+# 商品分类数据在创建进程池之前加载，子进程直接共用，每个子进程使用自己的数据库连接
+import multiprocessing
+import os
+import time
+import traceback
+
+from django import db
+from django.core.management.base import BaseCommand, CommandError
+
+from goods.utils import get_categories, get_stale_sku_detail_fingerprints, save_sku_detail_fingerprints, \
+    save_sku_detail_html, skipped_sku_detail_fingerprint
+from meiduo_mall.utils.publisher import StaticFilePublisher
+
+# 子进程共用的商品分类数据，在创建进程池之前设置
+_categories = None
+
+
+def _build_chunk(sku_ids):
+    """
+    子进程: 生成一批商品的静态详情页面
+    返回: ({已生成的sku_id: 是否因规格信息不完整没有生成页面}, 写入的页面数量, 写入的字节数, 跳过的字节数,
+          [(sku_id, 错误信息), ...])
+    """
+    done = {}
+    failures = []
+    publisher = StaticFilePublisher()
+
+    for sku_id in sku_ids:
+        try:
+            skipped = save_sku_detail_html(sku_id, _categories, publisher) is None
+        except Exception:
+            failures.append((sku_id, traceback.format_exc(limit=3)))
+        else:
+            done[sku_id] = skipped
+
+    return done, publisher.written_files, publisher.written_bytes, publisher.skipped_bytes, failures
+
+
+class Command(BaseCommand):
+    help = '使用进程池增量生成所有商品的静态详情页面'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count(), help='进程数量，默认为CPU核数')
+        parser.add_argument('--chunk-size', type=int, default=100, help='每个任务处理的商品数量')
+        parser.add_argument('--full', action='store_true', help='忽略已保存的指纹，重新生成所有页面')
+
+    def handle(self, *args, **options):
+        global _categories
+
+        # 商品分类菜单: 所有页面共用，只获取一次
+        _categories = get_categories()
+
+        # 需要重新生成页面的商品
+        stale = get_stale_sku_detail_fingerprints(_categories, options['full'])
+        total = len(stale)
+        if not total:
+            self.stdout.write('没有需要生成的页面')
+            return
+
+        sku_ids = sorted(stale)
+        chunk_size = options['chunk_size']
+        chunks = [sku_ids[i:i + chunk_size] for i in range(0, total, chunk_size)]
+
+        # 关闭主进程的数据库连接，子进程不会继承已打开的连接，第一次查询时各自建立连接
+        db.connections.close_all()
+
+        self.stdout.write('页面数量: %s 进程数量: %s' % (total, options['processes']))
+
+        start = time.time()
+        rendered = written = written_bytes = skipped_bytes = 0
+        failures = []
+
+        pool = multiprocessing.get_context('fork').Pool(options['processes'])
+        try:
+            for done, chunk_written, chunk_written_bytes, chunk_skipped_bytes, chunk_failures in \
+                    pool.imap_unordered(_build_chunk, chunks):
+                # 保存已生成页面的商品指纹，命令中断之后已生成的页面不需要重新渲染
+                # 规格信息不完整的商品保存特殊的指纹，依赖数据未变化时下次不再检查
+                save_sku_detail_fingerprints({
+                    sku_id: skipped_sku_detail_fingerprint(stale[sku_id]) if skipped else stale[sku_id]
+                    for sku_id, skipped in done.items()
+                })
+
+                rendered += len(done) + len(chunk_failures)
+                written += chunk_written
+                written_bytes += chunk_written_bytes
+                skipped_bytes += chunk_skipped_bytes
+                failures.extend(chunk_failures)
+
+                elapsed = time.time() - start
+                self.stdout.write('\r进度: %s/%s 写入: %s 失败: %s 速度: %.1f 页/秒' % (
+                    rendered, total, written, len(failures), rendered / elapsed), ending='')
+                self.stdout.flush()
+        finally:
+            pool.close()
+            pool.join()
+
+        self.stdout.write('')
+        self.stdout.write('写入: %s 字节 跳过: %s 字节' % (written_bytes, skipped_bytes))
+
+        for sku_id, error in failures:
+            self.stderr.write('sku %s 生成失败:\n%s' % (sku_id, error))
+
+        if failures:
+            raise CommandError('%s个页面生成失败' % len(failures))
+
+        self.stdout.write(self.style.SUCCESS('已生成页面数量: %s 用时: %.1f秒' % (total, time.time() - start)))
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0002_auto_20190410_1511'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='sku',
+            index_together=set([
+                ('category', 'is_launched', 'create_time', 'id'),
+                ('category', 'is_launched', 'update_time', 'id'),
+                ('category', 'is_launched', 'price', 'id'),
+                ('category', 'is_launched', 'sales', 'id'),
+            ]),
+        ),
+    ]
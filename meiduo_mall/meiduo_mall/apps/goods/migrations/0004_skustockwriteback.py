@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0003_sku_index_together'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SKUStockWriteBack',
+            fields=[
+                ('create_time', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('update_time', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('id', models.CharField(max_length=32, primary_key=True, serialize=False, verbose_name='回写id')),
+            ],
+            options={
+                'db_table': 'tb_sku_stock_write_back',
+                'verbose_name': '库存回写记录',
+                'verbose_name_plural': '库存回写记录',
+            },
+        ),
+    ]
@@ -135,6 +135,13 @@ class SKU(BaseModel):
         db_table = 'tb_sku'
         verbose_name = '商品SKU'
         verbose_name_plural = verbose_name
+        # 分类商品列表键集分页使用的联合索引: (分类, 是否上架, 排序字段, id)
+        index_together = [
+            ('category', 'is_launched', 'create_time', 'id'),
+            ('category', 'is_launched', 'update_time', 'id'),
+            ('category', 'is_launched', 'price', 'id'),
+            ('category', 'is_launched', 'sales', 'id'),
+        ]
 
     def __str__(self):
         return '%s: %s' % (self.id, self.name)
@@ -171,3 +178,15 @@ class SKUSpecification(BaseModel):
 
     def __str__(self):
         return '%s: %s - %s' % (self.sku, self.spec.name, self.option.value)
+
+
+class SKUStockWriteBack(BaseModel):
+    """
+    已回写到数据库的库存预占记录，和库存更新在同一事务中添加，保证同一次预占只回写一次
+    """
+    id = models.CharField(max_length=32, primary_key=True, verbose_name='回写id')
+
+    class Meta:
+        db_table = 'tb_sku_stock_write_back'
+        verbose_name = '库存回写记录'
+        verbose_name_plural = verbose_name
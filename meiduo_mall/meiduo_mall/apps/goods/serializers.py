@@ -12,6 +12,19 @@ class SKUSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'price', 'default_image', 'comments')
 
 
+class SKUSnapshotSerializer(serializers.Serializer):
+    """SKU商品快照序列化器类(商品快照参考goods.cache)"""
+    id = serializers.IntegerField(label='商品id')
+    name = serializers.CharField(label='名称')
+    price = serializers.DecimalField(label='单价', max_digits=10, decimal_places=2)
+    default_image = serializers.CharField(label='默认图片')
+
+
+class SKUListSerializer(SKUSnapshotSerializer):
+    """分类商品列表序列化器类(数据来自商品快照，字段和SKUSerializer一致)"""
+    comments = serializers.IntegerField(label='评价数')
+
+
 class SKUIndexSerializer(HaystackSerializer):
     """搜索结果序列化器类"""
     object = SKUSerializer(label='商品')
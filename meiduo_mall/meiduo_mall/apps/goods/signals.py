@@ -0,0 +1,76 @@
+# 商品相关的信号处理函数
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from goods.cache import invalidate_sku_snapshots
+from goods.listing import update_sku_listing, remove_sku_listing
+from goods.models import SKU, GoodsCategory, GoodsChannel, GoodsSpecification, SpecificationOption, \
+    SKUSpecification
+from goods.utils import bump_categories_version, invalidate_spu_spec_matrix
+
+
+@receiver([post_save, post_delete], sender=SKU)
+def clear_sku_snapshot(sender, instance, **kwargs):
+    """SKU商品数据修改或删除之后，清除商品快照缓存"""
+    # 事务提交之后再清除，避免其他请求在提交之前重新缓存修改之前的数据
+    # 删除之后instance.id会被设置为None，先保存sku_id
+    sku_id = instance.id
+    transaction.on_commit(lambda: invalidate_sku_snapshots([sku_id]))
+
+    # SPU下的SKU发生了变化，清除规格矩阵缓存
+    spu_id = instance.spu_id
+    transaction.on_commit(lambda: invalidate_spu_spec_matrix(spu_id))
+
+
+@receiver(pre_save, sender=SKU)
+def remember_sku_category(sender, instance, **kwargs):
+    """SKU商品数据保存之前，记录商品原来的分类，用于更新分类商品列表缓存"""
+    if instance.id is None:
+        instance._old_category_id = None
+    else:
+        instance._old_category_id = SKU.objects.filter(id=instance.id).values_list('category_id', flat=True).first()
+
+
+@receiver(post_save, sender=SKU)
+def update_sku_list(sender, instance, **kwargs):
+    """SKU商品数据保存之后，更新分类商品列表缓存(事务提交之后，在清除商品快照缓存之后执行)"""
+    old_category_id = getattr(instance, '_old_category_id', None)
+    transaction.on_commit(lambda: update_sku_listing(instance, old_category_id))
+
+
+@receiver(post_delete, sender=SKU)
+def remove_sku_list(sender, instance, **kwargs):
+    """SKU商品删除之后，从分类商品列表缓存中移除"""
+    sku_id, category_id = instance.id, instance.category_id
+    transaction.on_commit(lambda: remove_sku_listing(sku_id, category_id))
+
+
+@receiver([post_save, post_delete], sender=GoodsCategory)
+@receiver([post_save, post_delete], sender=GoodsChannel)
+def clear_categories(sender, **kwargs):
+    """商品分类或频道修改或删除之后，更新商品分类数据的版本号"""
+    # 事务提交之后再更新，避免在提交之前使用修改之前的数据生成新版本的缓存
+    transaction.on_commit(bump_categories_version)
+
+
+@receiver([post_save, post_delete], sender=GoodsSpecification)
+def clear_spec_matrix_by_spec(sender, instance, **kwargs):
+    """规格修改或删除之后，清除SPU的规格矩阵缓存"""
+    # 事务提交之后再清除，避免其他请求在提交之前使用修改之前的数据重新缓存规格矩阵
+    spu_id = instance.spu_id
+    transaction.on_commit(lambda: invalidate_spu_spec_matrix(spu_id))
+
+
+@receiver([post_save, post_delete], sender=SpecificationOption)
+def clear_spec_matrix_by_option(sender, instance, **kwargs):
+    """规格选项修改或删除之后，清除SPU的规格矩阵缓存"""
+    spu_id = instance.spec.spu_id
+    transaction.on_commit(lambda: invalidate_spu_spec_matrix(spu_id))
+
+
+@receiver([post_save, post_delete], sender=SKUSpecification)
+def clear_spec_matrix_by_sku_spec(sender, instance, **kwargs):
+    """SKU规格修改或删除之后，清除SPU的规格矩阵缓存"""
+    spu_id = instance.sku.spu_id
+    transaction.on_commit(lambda: invalidate_spu_spec_matrix(spu_id))
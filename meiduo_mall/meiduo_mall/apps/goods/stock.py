@@ -0,0 +1,291 @@
+# 封装基于redis的商品库存预占(热库存)
+import json
+import time
+import uuid
+
+from django.db import transaction
+from django.db.models import F
+from django_redis import get_redis_connection
+
+from goods import constants
+from goods.cache import invalidate_sku_snapshots
+from goods.models import SKU, SKUStockWriteBack
+
+# redis hash: 商品的热库存 {'<sku_id>': '<stock>', ...}
+SKU_STOCK_KEY = 'sku_stock'
+# redis hash: 已经预占但还未回写到数据库的数量 {'<sku_id>': '<count>', ...}
+SKU_STOCK_PENDING_KEY = 'sku_stock_pending'
+# redis hash: 还未回写到数据库的预占记录 {'<预占id>': '[sku_id1, count1, sku_id2, count2, ...]', ...}
+SKU_STOCK_RESERVATIONS_KEY = 'sku_stock_reservations'
+# redis hash: 回写任务发送失败的预占，由对账定时任务回写 {'<预占id>': '[[sku_id, count], ...]', ...}
+SKU_STOCK_WRITE_BACK_FAILED_KEY = 'sku_stock_write_back_failed'
+
+# 预占库存：所有商品的库存都足够时才一起扣减，否则一个都不扣减
+# KEYS[1]: 热库存hash KEYS[2]: 待回写hash KEYS[3]: 预占记录hash
+# ARGV[1]: 预占id ARGV[2...]: sku_id1, count1, sku_id2, count2, ...
+# 返回: {1, ''}: 预占成功 {0, sku_id}: 库存不足 {-1, sku_id}: 热库存未加载
+RESERVE_SCRIPT = """
+for i = 2, #ARGV, 2 do
+    local stock = redis.call('hget', KEYS[1], ARGV[i])
+    if not stock then
+        return {-1, ARGV[i]}
+    end
+    if tonumber(stock) < tonumber(ARGV[i + 1]) then
+        return {0, ARGV[i]}
+    end
+end
+local counts = {}
+for i = 2, #ARGV, 2 do
+    redis.call('hincrby', KEYS[1], ARGV[i], -tonumber(ARGV[i + 1]))
+    redis.call('hincrby', KEYS[2], ARGV[i], ARGV[i + 1])
+    table.insert(counts, ARGV[i])
+    table.insert(counts, ARGV[i + 1])
+end
+redis.call('hset', KEYS[3], ARGV[1], cjson.encode(counts))
+return {1, ''}
+"""
+
+# 释放预占的库存(下单失败时归还)，预占记录不存在时不做任何操作
+# KEYS[1]: 热库存hash KEYS[2]: 待回写hash KEYS[3]: 预占记录hash
+# ARGV[1]: 预占id
+RELEASE_SCRIPT = """
+local counts = redis.call('hget', KEYS[3], ARGV[1])
+if not counts then
+    return 0
+end
+counts = cjson.decode(counts)
+for i = 1, #counts, 2 do
+    redis.call('hincrby', KEYS[1], counts[i], counts[i + 1])
+    redis.call('hincrby', KEYS[2], counts[i], -tonumber(counts[i + 1]))
+end
+redis.call('hdel', KEYS[3], ARGV[1])
+return 1
+"""
+
+# 预占的库存已经回写到数据库，减少待回写数量，预占记录不存在(已经处理过)时不做任何操作
+# KEYS[1]: 待回写hash KEYS[2]: 预占记录hash
+# ARGV[1]: 预占id
+COMMIT_SCRIPT = """
+local counts = redis.call('hget', KEYS[2], ARGV[1])
+if not counts then
+    return 0
+end
+counts = cjson.decode(counts)
+for i = 1, #counts, 2 do
+    redis.call('hincrby', KEYS[1], counts[i], -tonumber(counts[i + 1]))
+end
+redis.call('hdel', KEYS[2], ARGV[1])
+return 1
+"""
+
+# 使用数据库库存设置热库存：热库存 = 数据库库存 - 待回写数量
+# ARGV: sku_id1, stock1, sku_id2, stock2, ...
+# ARGV[#ARGV]: 1: 覆盖已有的热库存(对账) 0: 只加载不存在的热库存
+LOAD_SCRIPT = """
+local overwrite = ARGV[#ARGV] == '1'
+for i = 1, #ARGV - 1, 2 do
+    local pending = tonumber(redis.call('hget', KEYS[2], ARGV[i]) or 0)
+    local stock = tonumber(ARGV[i + 1]) - pending
+    if overwrite then
+        redis.call('hset', KEYS[1], ARGV[i], stock)
+    else
+        redis.call('hsetnx', KEYS[1], ARGV[i], stock)
+    end
+end
+return 1
+"""
+
+# 加锁: 返回加锁成功的key的序号
+# KEYS: 各个商品的锁
+# ARGV[1]: 锁的值(token) ARGV[2]: 锁的有效期(ms) ARGV[3]: 1: 全部加锁成功或者全部不加锁 0: 跳过已被锁定的商品
+LOCK_SCRIPT = """
+if ARGV[3] == '1' then
+    for i, key in ipairs(KEYS) do
+        if redis.call('exists', key) == 1 then
+            return {}
+        end
+    end
+end
+local locked = {}
+for i, key in ipairs(KEYS) do
+    if redis.call('set', key, ARGV[1], 'PX', ARGV[2], 'NX') then
+        table.insert(locked, i)
+    end
+end
+return locked
+"""
+
+# 解锁: 只删除值为token的锁
+UNLOCK_SCRIPT = """
+for i, key in ipairs(KEYS) do
+    if redis.call('get', key) == ARGV[1] then
+        redis.call('del', key)
+    end
+end
+return 1
+"""
+
+
+class StockNotLoaded(Exception):
+    """商品的热库存没有加载(正在回写或对账)，不能判断库存是否足够"""
+    def __init__(self, sku_id):
+        super().__init__('商品%s的热库存没有加载' % sku_id)
+        self.sku_id = sku_id
+
+
+def _flatten(sku_counts):
+    """{sku_id: count, ...} -> [sku_id, count, ...]"""
+    args = []
+    for sku_id, count in sku_counts.items():
+        args.extend([sku_id, count])
+    return args
+
+
+def _lock_keys(sku_ids):
+    return ['sku_stock_lock_%s' % sku_id for sku_id in sku_ids]
+
+
+class StockReservation(object):
+    """
+    商品库存预占:
+    1. 下单时在redis中一次性扣减所有商品的热库存(lua脚本保证原子性)，记录本次预占
+    2. 订单保存成功之后，异步将库存和销量的变化回写到数据库(tb_sku)
+    3. 定时任务对比数据库库存，修正redis中的热库存
+    回写和加载(对账)都需要先获取商品的锁，保证加载时数据库库存和待回写数量是一致的
+    """
+    def __init__(self):
+        self.redis_conn = get_redis_connection('stock')
+        self._reserve = self.redis_conn.register_script(RESERVE_SCRIPT)
+        self._release = self.redis_conn.register_script(RELEASE_SCRIPT)
+        self._commit = self.redis_conn.register_script(COMMIT_SCRIPT)
+        self._load = self.redis_conn.register_script(LOAD_SCRIPT)
+        self._lock = self.redis_conn.register_script(LOCK_SCRIPT)
+        self._unlock = self.redis_conn.register_script(UNLOCK_SCRIPT)
+
+    def reserve(self, sku_counts):
+        """
+        预占商品库存:
+        sku_counts: {sku_id: count, ...}
+        返回预占id，有商品库存不足时返回None，多次重试之后热库存仍未加载时抛出StockNotLoaded
+        """
+        reservation_id = uuid.uuid4().hex
+        keys = [SKU_STOCK_KEY, SKU_STOCK_PENDING_KEY, SKU_STOCK_RESERVATIONS_KEY]
+        args = [reservation_id] + _flatten(sku_counts)
+
+        res, sku_id = self._reserve(keys=keys, args=args)
+
+        # 热库存未加载时，从数据库加载之后再次进行预占
+        # 商品正在回写或对账(已被锁定)时加载会跳过该商品，等待锁释放之后重试
+        retries = 0
+        while res == -1:
+            if retries == constants.SKU_STOCK_RESERVE_RETRIES:
+                raise StockNotLoaded(int(sku_id))
+
+            if retries > 0:
+                time.sleep(constants.SKU_STOCK_RESERVE_RETRY_INTERVAL)
+            retries += 1
+
+            self.load(sku_counts.keys())
+            res, sku_id = self._reserve(keys=keys, args=args)
+
+        return reservation_id if res == 1 else None
+
+    def release(self, reservation_id):
+        """归还预占的商品库存"""
+        self._release(keys=[SKU_STOCK_KEY, SKU_STOCK_PENDING_KEY, SKU_STOCK_RESERVATIONS_KEY],
+                      args=[reservation_id])
+
+    def commit(self, reservation_id):
+        """预占的库存已经回写到数据库，减少待回写数量，重复调用时不做任何操作"""
+        self._commit(keys=[SKU_STOCK_PENDING_KEY, SKU_STOCK_RESERVATIONS_KEY], args=[reservation_id])
+
+    def lock(self, sku_ids, partial=False):
+        """
+        对商品加锁，返回(token, 加锁成功的sku_id):
+        partial: False: 全部加锁成功或者全部不加锁 True: 跳过已被锁定的商品
+        """
+        sku_ids = sorted(sku_ids)
+        token = uuid.uuid4().hex
+        indexes = self._lock(keys=_lock_keys(sku_ids),
+                             args=[token, constants.SKU_STOCK_LOCK_EXPIRES * 1000, 0 if partial else 1])
+        return token, [sku_ids[i - 1] for i in indexes]
+
+    def unlock(self, sku_ids, token):
+        self._unlock(keys=_lock_keys(sku_ids), args=[token])
+
+    def load(self, sku_ids, overwrite=False):
+        """
+        使用数据库中的库存设置商品的热库存，正在回写的商品跳过，返回加载的sku_id:
+        overwrite: False: 只加载还没有热库存的商品 True: 覆盖已有的热库存(对账)
+        """
+        token, sku_ids = self.lock(sku_ids, partial=True)
+        if not sku_ids:
+            return []
+
+        try:
+            # select id, stock from tb_sku where id in (...);
+            sku_stocks = dict(SKU.objects.filter(id__in=sku_ids).values_list('id', 'stock'))
+
+            if sku_stocks:
+                args = _flatten(sku_stocks)
+                args.append(1 if overwrite else 0)
+                self._load(keys=[SKU_STOCK_KEY, SKU_STOCK_PENDING_KEY], args=args)
+        finally:
+            self.unlock(sku_ids, token)
+
+        return sku_ids
+
+    def loaded_sku_ids(self):
+        """返回redis中已加载热库存的商品sku_id"""
+        return [int(sku_id) for sku_id in self.redis_conn.hkeys(SKU_STOCK_KEY)]
+
+    def defer_write_back(self, reservation_id, sku_counts):
+        """回写任务发送失败时记录预占，由对账定时任务回写"""
+        self.redis_conn.hset(SKU_STOCK_WRITE_BACK_FAILED_KEY, reservation_id,
+                             json.dumps(list(sku_counts.items())))
+
+    def deferred_write_backs(self):
+        """返回回写任务发送失败的预占 {预占id: {sku_id: count, ...}, ...}"""
+        deferred = self.redis_conn.hgetall(SKU_STOCK_WRITE_BACK_FAILED_KEY)
+        return {reservation_id.decode(): {sku_id: count for sku_id, count in json.loads(sku_counts.decode())}
+                for reservation_id, sku_counts in deferred.items()}
+
+    def clear_deferred_write_back(self, reservation_id):
+        self.redis_conn.hdel(SKU_STOCK_WRITE_BACK_FAILED_KEY, reservation_id)
+
+
+def write_back_reservation(reservation_id, sku_counts):
+    """
+    将一次预占的库存回写到数据库，商品被锁定时返回False(稍后重试)，否则返回True:
+    reservation_id: 预占id，同一次预占重复回写时只回写一次
+    sku_counts: {sku_id: count, ...}
+    """
+    reservation = StockReservation()
+
+    # 对商品加锁，避免对账时读取到已经回写到数据库但还未减少待回写数量的库存
+    token, locked = reservation.lock(sku_counts.keys())
+    if not locked:
+        return False
+
+    try:
+        with transaction.atomic():
+            # 回写记录和库存更新在同一事务中保存，已有回写记录时说明已经回写过
+            _, created = SKUStockWriteBack.objects.get_or_create(id=reservation_id)
+
+            if created:
+                for sku_id, count in sku_counts.items():
+                    # update tb_sku
+                    # set stock=stock-<count>, sales=sales+<count>
+                    # where id=<sku_id>;
+                    SKU.objects.filter(id=sku_id).update(stock=F('stock') - count, sales=F('sales') + count)
+
+        # 回写成功之后，减少redis中待回写的数量(重复调用时不做任何操作)
+        reservation.commit(reservation_id)
+    finally:
+        reservation.unlock(locked, token)
+
+    if created:
+        # 商品库存和销量发生了变化，清除商品快照缓存(分类商品列表缓存中的销量在下单时已经更新)
+        invalidate_sku_snapshots(sku_counts.keys())
+
+    return True
@@ -1,3 +1,119 @@
+from unittest import mock
+
+import redis
 from django.test import TestCase
+from django_redis import get_redis_connection
+
+from celery_tasks.stock.tasks import write_back_sku_stock
+from goods.crons import reconcile_sku_stock
+from goods.models import GoodsCategory, Brand, SPU, SKU
+from goods.stock import StockReservation, StockNotLoaded, SKU_STOCK_KEY, SKU_STOCK_PENDING_KEY
+
+
+class StockReservationTest(TestCase):
+    """redis热库存预占的测试，使用redis的15号库，测试开始和结束时会清空该库"""
+
+    def setUp(self):
+        category = GoodsCategory.objects.create(name='手机')
+        brand = Brand.objects.create(name='华为', logo='logo.png', first_letter='H')
+        spu = SPU.objects.create(name='华为手机', brand=brand, category1=category,
+                                 category2=category, category3=category)
+        self.sku = SKU.objects.create(name='华为手机', caption='', spu=spu, category=category,
+                                      price=1000, cost_price=900, market_price=1100, stock=5)
+
+        connection_kwargs = get_redis_connection('stock').connection_pool.connection_kwargs
+        self.redis_conn = redis.StrictRedis(**dict(connection_kwargs, db=15))
+        self.redis_conn.flushdb()
+        self.addCleanup(self.redis_conn.flushdb)
+
+        # 热库存使用15号库，不清除商品快照缓存
+        for target, kwargs in (('goods.stock.get_redis_connection', {'return_value': self.redis_conn}),
+                               ('goods.stock.invalidate_sku_snapshots', {})):
+            patcher = mock.patch(target, **kwargs)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.reservation = StockReservation()
+
+    def hot_stock(self):
+        return int(self.redis_conn.hget(SKU_STOCK_KEY, self.sku.id))
+
+    def pending(self):
+        return int(self.redis_conn.hget(SKU_STOCK_PENDING_KEY, self.sku.id) or 0)
+
+    def db_stock(self):
+        return SKU.objects.get(id=self.sku.id).stock
+
+    def test_reserve_more_than_stock(self):
+        """库存不足时不预占"""
+        self.assertIsNone(self.reservation.reserve({self.sku.id: 6}))
+
+        self.assertEqual(self.hot_stock(), 5)
+        self.assertEqual(self.pending(), 0)
+
+    def test_release(self):
+        """归还预占的库存，重复归还时不做任何操作"""
+        reservation_id = self.reservation.reserve({self.sku.id: 3})
+        self.assertEqual(self.hot_stock(), 2)
+        self.assertEqual(self.pending(), 3)
+
+        self.reservation.release(reservation_id)
+        self.reservation.release(reservation_id)
+
+        self.assertEqual(self.hot_stock(), 5)
+        self.assertEqual(self.pending(), 0)
+
+    def test_commit_twice(self):
+        """重复减少待回写数量时不做任何操作"""
+        reservation_id = self.reservation.reserve({self.sku.id: 3})
+
+        self.reservation.commit(reservation_id)
+        self.reservation.commit(reservation_id)
+
+        self.assertEqual(self.hot_stock(), 2)
+        self.assertEqual(self.pending(), 0)
+
+    def test_write_back_twice(self):
+        """回写任务重复投递时只回写一次"""
+        reservation_id = self.reservation.reserve({self.sku.id: 2})
+
+        write_back_sku_stock.apply(args=(reservation_id, [[self.sku.id, 2]]))
+        write_back_sku_stock.apply(args=(reservation_id, [[self.sku.id, 2]]))
+
+        self.assertEqual(self.db_stock(), 3)
+        self.assertEqual(self.hot_stock(), 3)
+        self.assertEqual(self.pending(), 0)
+
+    def test_reconcile_keeps_pending(self):
+        """对账时热库存 = 数据库库存 - 待回写数量，不覆盖还未回写的预占"""
+        self.reservation.reserve({self.sku.id: 3})
+        self.redis_conn.hset(SKU_STOCK_KEY, self.sku.id, 100)
+
+        reconcile_sku_stock()
+
+        self.assertEqual(self.db_stock(), 5)
+        self.assertEqual(self.hot_stock(), 2)
+        self.assertEqual(self.pending(), 3)
+
+    def test_reconcile_replays_deferred_write_back(self):
+        """回写任务发送失败的预占在对账时回写"""
+        reservation_id = self.reservation.reserve({self.sku.id: 2})
+        self.reservation.defer_write_back(reservation_id, {self.sku.id: 2})
+
+        reconcile_sku_stock()
+
+        self.assertEqual(self.db_stock(), 3)
+        self.assertEqual(self.hot_stock(), 3)
+        self.assertEqual(self.pending(), 0)
+        self.assertEqual(self.reservation.deferred_write_backs(), {})
+
+    def test_reserve_locked_sku(self):
+        """商品一直被锁定(正在回写或对账)、热库存无法加载时不当作库存不足"""
+        token, locked = self.reservation.lock([self.sku.id])
+        self.assertEqual(locked, [self.sku.id])
+
+        with self.assertRaises(StockNotLoaded):
+            self.reservation.reserve({self.sku.id: 1})
 
-# Create your tests here.
+        self.reservation.unlock(locked, token)
+        self.assertIsNotNone(self.reservation.reserve({self.sku.id: 1}))
@@ -2,8 +2,10 @@ from django.conf.urls import url
 from goods import views
 
 urlpatterns = [
+    url(r'^categories/$', views.CategoryTreeView.as_view()),
     url(r'^categories/(?P<category_id>\d+)/skus/$', views.SKUListView.as_view()),
     url(r'^categories/(?P<category_id>\d+)/$', views.BreadCrumbView.as_view()),
+    url(r'^categories/(?P<category_id>\d+)/hotskus/$', views.CategoryHotSKUView.as_view()),
     url(r'^skus/hot/$', views.SKUHotView.as_view()),
 ]
 
@@ -1,14 +1,69 @@
+import hashlib
+import json
+import os
+import time
 from collections import OrderedDict
 
-from goods.models import GoodsChannel
+from django.conf import settings
+from django.core.cache import cache
+from django.template import loader
+from django_redis import get_redis_connection
 
+from goods import constants
+from goods.models import GoodsChannel, GoodsCategory, SPU, SKU, SKUImage, SKUSpecification, \
+    GoodsSpecification, SpecificationOption
+from meiduo_mall.utils.publisher import StaticFilePublisher
+
+
+def get_categories_version():
+    """返回商品分类数据当前的版本号"""
+    version = cache.get(constants.CATEGORIES_VERSION_KEY)
+    if version is None:
+        version = bump_categories_version()
+
+    return version
+
+
+def _categories_cache_key():
+    """返回当前版本的商品分类数据缓存key"""
+    return 'goods_categories_%s' % get_categories_version()
+
+
+def bump_categories_version():
+    """商品分类或频道发生变化时，更新商品分类数据的版本号，旧版本的缓存数据不再使用"""
+    version = int(time.time() * 1000)
+    cache.set(constants.CATEGORIES_VERSION_KEY, version, None)
+    return version
+
+
+def build_categories():
+    """
+    从数据库中查询商品分类数据，只进行两次查询，在内存中组装分类数据:
+    {
+        '<group_id>': {
+            'channels': [{'id': '一级分类id', 'name': '一类分类名称', 'url': '频道页面地址'}, {}, ...],
+            'sub_cats': [{'id': '二级分类id', 'name': '二级分类名称', 'parent_id': '一级分类id',
+                          'sub_cats': [{'id': '三级分类id', 'name': '三级分类名称'}, {}, ...]},
+                         {},
+                         ...]
+        },
+        ...
+    }
+    """
+    # select id, name, parent_id from tb_goods_category order by id;
+    # {
+    #     '<parent_id>': [{'id': '<id>', 'name': '<name>'}, ...],
+    #     ...
+    # }
+    children = {}
+    for cat_id, name, parent_id in GoodsCategory.objects.order_by('id').values_list('id', 'name', 'parent_id'):
+        children.setdefault(parent_id, []).append({'id': cat_id, 'name': name})
 
-def get_categories():
-    """返回商品分类数据"""
     categories = OrderedDict()  # 有序字典
 
     # 获取`频道`数据
-    channels = GoodsChannel.objects.order_by('group_id', 'sequence')
+    # select ... from tb_goods_channel inner join tb_goods_category ... order by group_id, sequence;
+    channels = GoodsChannel.objects.select_related('category').order_by('group_id', 'sequence')
 
     for channel in channels:
         # 获取频道组id
@@ -26,13 +81,342 @@ def get_categories():
             'url': channel.url
         })
 
-        # 获取和一级分类关联的二级分类
-        for cat2 in cat1.goodscategory_set.all():
-            cat2.sub_cats = []
-            # 获取和二级分类关联的三级分类
-            for cat3 in cat2.goodscategory_set.all():
-                cat2.sub_cats.append(cat3)
+        # 获取和一级分类关联的二级分类，以及和二级分类关联的三级分类
+        for cat2 in children.get(cat1.id, []):
+            categories[group_id]['sub_cats'].append({
+                'id': cat2['id'],
+                'name': cat2['name'],
+                'parent_id': cat1.id,
+                'sub_cats': children.get(cat2['id'], [])
+            })
+
+    return categories
 
-            categories[group_id]['sub_cats'].append(cat2)
+
+def get_categories():
+    """返回商品分类数据，数据缓存在redis中，商品分类或频道发生变化时失效"""
+    cache_key = _categories_cache_key()
+
+    categories = cache.get(cache_key)
+    if categories is None:
+        categories = build_categories()
+        cache.set(cache_key, categories, constants.CATEGORIES_CACHE_EXPIRES)
 
     return categories
+
+
+def build_spu_spec_matrix(spu_id):
+    """
+    查询SPU的规格、规格选项以及每个SKU的规格，只进行三次查询:
+    {
+        'specs': [{'id': '规格id', 'name': '规格名称', 'options': [{'id': '选项id', 'value': '选项值'}, ...]}, ...],
+        'sku_keys': {'<sku_id>': [规格1参数id, 规格2参数id, ...], ...}
+    }
+    """
+    # select id, name from tb_spu_specification where spu_id=<spu_id> order by id;
+    specs = []
+    spec_index = {}
+    for spec_id, name in GoodsSpecification.objects.filter(spu_id=spu_id).order_by('id').values_list('id', 'name'):
+        spec_index[spec_id] = len(specs)
+        specs.append({'id': spec_id, 'name': name, 'options': []})
+
+    # select id, spec_id, value from tb_specification_option where spec_id in (...) order by id;
+    options = SpecificationOption.objects.filter(spec__spu_id=spu_id).order_by('id').values_list('id', 'spec_id', 'value')
+    for option_id, spec_id, value in options:
+        specs[spec_index[spec_id]]['options'].append({'id': option_id, 'value': value})
+
+    # 构建每个SKU的规格键
+    # sku_keys = {
+    #     <sku_id>: [规格1参数id， 规格2参数id， 规格3参数id, ...],
+    #     ...
+    # }
+    sku_keys = {}
+    sku_specs = SKUSpecification.objects.filter(sku__spu_id=spu_id).order_by('sku_id', 'spec_id').values_list(
+        'sku_id', 'option_id')
+    for sku_id, option_id in sku_specs:
+        sku_keys.setdefault(sku_id, []).append(option_id)
+
+    return {
+        'specs': specs,
+        'sku_keys': sku_keys
+    }
+
+
+def get_spu_spec_matrix(spu_id):
+    """返回SPU的规格矩阵，数据缓存在redis中，同一SPU下所有SKU的详情页面共用"""
+    cache_key = 'spu_spec_matrix_%s' % spu_id
+
+    matrix = cache.get(cache_key)
+    if matrix is None:
+        matrix = build_spu_spec_matrix(spu_id)
+        cache.set(cache_key, matrix, constants.SPU_SPEC_MATRIX_CACHE_EXPIRES)
+
+    return matrix
+
+
+def invalidate_spu_spec_matrix(spu_id):
+    """清除SPU的规格矩阵缓存"""
+    cache.delete('spu_spec_matrix_%s' % spu_id)
+
+
+def _detail_skus():
+    """商品详情页面使用的SKU查询集，同时查询面包屑导航中的SPU、分类和频道"""
+    return SKU.objects.select_related('spu__category1__goodschannel', 'spu__category2', 'spu__category3')
+
+
+def get_sku_detail_context(sku_id, categories=None):
+    """
+    获取sku_id对应商品详情页面的模板数据，商品的规格信息不完整时返回None
+    categories: 商品分类数据，批量生成详情页面时由调用者传入，避免重复获取
+    """
+    # 商品分类菜单
+    if categories is None:
+        categories = get_categories()
+
+    # 获取当前sku的信息
+    sku = _detail_skus().get(id=sku_id)
+
+    return build_sku_detail_context(sku, categories, get_spu_spec_matrix(sku.spu_id))
+
+
+def build_sku_detail_context(sku, categories, matrix):
+    """
+    根据已查询的数据构建商品详情页面的模板数据，商品的规格信息不完整时返回None
+    sku: 通过_detail_skus()查询的SKU对象 categories: 商品分类数据 matrix: SPU的规格矩阵
+    """
+    # 获取和商品关联的图片
+    sku.images = sku.skuimage_set.all()
+
+    # 面包屑导航信息中的频道
+    # 获取和sku对象关联SPU对象
+    goods = sku.spu
+    # goods.category1：获取和SPU对象关联的一级分类
+    # category1.goodschannel：获取和一级分类关联的频道对象
+    goods.channel = goods.category1.goodschannel
+
+    # 当前商品的规格键
+    # sku_key = [规格1参数id， 规格2参数id， 规格3参数id, ...]
+    sku_key = matrix['sku_keys'].get(sku.id, [])
+
+    # 构建不同规格参数（选项）的sku字典
+    # spec_sku_map = {
+    #     (规格1参数id, 规格2参数id, 规格3参数id, ...): sku_id,
+    #     (规格1参数id, 规格2参数id, 规格3参数id, ...): sku_id,
+    #     ...
+    # }
+    spec_sku_map = {tuple(key): s_id for s_id, key in matrix['sku_keys'].items()}
+
+    # 获取当前商品的规格信息
+    # specs = [
+    #    {
+    #        'name': '屏幕尺寸',
+    #        'options': [
+    #            {'value': '13.3寸', 'sku_id': xxx},
+    #            {'value': '15.4寸', 'sku_id': xxx},
+    #        ]
+    #    },
+    #    ...
+    # ]
+    # 若当前sku的规格信息不完整，则不再继续
+    if len(sku_key) < len(matrix['specs']):
+        return None
+
+    specs = []
+    for index, spec in enumerate(matrix['specs']):
+        # 复制当前sku的规格键
+        key = sku_key[:]
+        options = []
+        for option in spec['options']:
+            # 在规格参数sku字典中查找符合当前规格的sku
+            key[index] = option['id']
+            options.append({
+                'id': option['id'],
+                'value': option['value'],
+                'sku_id': spec_sku_map.get(tuple(key))
+            })
+
+        specs.append({'id': spec['id'], 'name': spec['name'], 'options': options})
+
+    return {
+        'categories': categories,
+        'goods': goods,
+        'specs': specs,
+        'sku': sku
+    }
+
+
+def _render_detail_html(context):
+    """渲染商品详情页面"""
+    # 加载模板
+    temp = loader.get_template('detail.html')
+
+    # 模板渲染
+    return temp.render(context)
+
+
+def _publish_detail_html(sku_id, res_html, publisher=None):
+    """发布商品的静态详情页面，页面内容未变化时不再写入"""
+    if publisher is None:
+        publisher = StaticFilePublisher()
+
+    return publisher.publish('goods/%s.html' % sku_id, res_html)
+
+
+def render_sku_detail_html(sku_id, categories=None):
+    """渲染sku_id对应商品的详情页面，商品的规格信息不完整时返回None"""
+    context = get_sku_detail_context(sku_id, categories)
+    if context is None:
+        return None
+
+    return _render_detail_html(context)
+
+
+def save_sku_detail_html(sku_id, categories=None, publisher=None):
+    """
+    生成sku_id对应商品的静态详情页面，页面内容未变化时不再写入:
+    publisher: 静态文件发布器，批量生成页面时由调用者传入，用于统计写入和跳过的数据量
+    返回True表示写入了页面文件，商品的规格信息不完整、不生成页面时返回None
+    """
+    res_html = render_sku_detail_html(sku_id, categories)
+    # 若当前sku的规格信息不完整，则不生成页面
+    if res_html is None:
+        return None
+
+    return _publish_detail_html(sku_id, res_html, publisher)
+
+
+def save_spu_detail_html(spu_id, categories=None, publisher=None):
+    """
+    生成SPU下所有SKU的静态详情页面，所有页面共用一次查询的SKU数据、规格矩阵和商品分类数据:
+    返回写入的页面数量
+    """
+    # 商品分类菜单
+    if categories is None:
+        categories = get_categories()
+
+    if publisher is None:
+        publisher = StaticFilePublisher()
+
+    # 获取SPU的规格矩阵，所有SKU共用
+    matrix = get_spu_spec_matrix(spu_id)
+
+    written = 0
+    for sku in _detail_skus().filter(spu_id=spu_id):
+        context = build_sku_detail_context(sku, categories, matrix)
+        # 若当前sku的规格信息不完整，则不生成页面
+        if context is None:
+            continue
+
+        if _publish_detail_html(sku.id, _render_detail_html(context), publisher):
+            written += 1
+
+    return written
+
+
+def _digest(data):
+    """计算数据的md5摘要"""
+    return hashlib.md5(repr(data).encode('utf8')).hexdigest()
+
+
+def get_sku_detail_fingerprints(categories, sku_ids=None):
+    """
+    计算商品详情页面所依赖数据的指纹，指纹不变时页面内容不变:
+    依赖数据: SKU、SPU、频道、规格和选项、同一SPU下所有SKU的规格、SKU图片、商品分类数据
+    sku_ids: 只计算指定商品的指纹，默认计算所有商品
+    返回: {<sku_id>: <fingerprint>, ...}
+
+    每种依赖数据只查询一次，不会逐个商品查询数据库
+    """
+    skus = SKU.objects.order_by('id')
+    if sku_ids is not None:
+        skus = skus.filter(id__in=sku_ids)
+
+    skus = list(skus.values_list('id', 'spu_id', 'name', 'caption', 'price', 'market_price',
+                                 'comments', 'default_image', 'update_time'))
+    spu_ids = {sku[1] for sku in skus}
+
+    # 商品分类数据: 所有商品详情页面共用
+    categories_digest = _digest(json.dumps(categories, sort_keys=True))
+
+    # SPU和频道: {<spu_id>: [...]}
+    spu_parts = {}
+    channel_urls = dict(GoodsChannel.objects.values_list('category_id', 'url'))
+    for spu in SPU.objects.filter(id__in=spu_ids).values_list(
+            'id', 'category1_id', 'category2_id', 'category3_id', 'update_time'):
+        spu_parts[spu[0]] = [spu, channel_urls.get(spu[1])]
+
+    # 规格和规格选项
+    for spec in GoodsSpecification.objects.filter(spu_id__in=spu_ids).order_by('id').values_list(
+            'spu_id', 'id', 'name', 'update_time'):
+        spu_parts[spec[0]].append(spec)
+
+    for option in SpecificationOption.objects.filter(spec__spu_id__in=spu_ids).order_by('id').values_list(
+            'spec__spu_id', 'id', 'spec_id', 'value', 'update_time'):
+        spu_parts[option[0]].append(option)
+
+    # 同一SPU下所有SKU的规格，决定了规格选项对应的sku_id
+    for sku_spec in SKUSpecification.objects.filter(sku__spu_id__in=spu_ids).order_by('id').values_list(
+            'sku__spu_id', 'sku_id', 'spec_id', 'option_id', 'update_time'):
+        spu_parts[sku_spec[0]].append(sku_spec)
+
+    spu_digests = {spu_id: _digest(parts) for spu_id, parts in spu_parts.items()}
+
+    # SKU图片: {<sku_id>: [...]}
+    sku_images = {}
+    images = SKUImage.objects.order_by('id')
+    if sku_ids is not None:
+        images = images.filter(sku_id__in=sku_ids)
+    for image in images.values_list('sku_id', 'id', 'image', 'update_time'):
+        sku_images.setdefault(image[0], []).append(image)
+
+    fingerprints = {}
+    for sku in skus:
+        fingerprints[sku[0]] = _digest((categories_digest, spu_digests.get(sku[1]), sku, sku_images.get(sku[0])))
+
+    return fingerprints
+
+
+def get_stale_sku_detail_fingerprints(categories, full=False):
+    """
+    返回需要重新生成详情页面的商品及其当前指纹: {<sku_id>: <fingerprint>, ...}
+    指纹和上次生成页面时保存的指纹相同并且页面文件存在的商品不需要重新生成
+    full: 忽略已保存的指纹，返回所有商品
+    """
+    redis_conn = get_redis_connection('default')
+
+    fingerprints = get_sku_detail_fingerprints(categories)
+    saved = {} if full else redis_conn.hgetall(constants.SKU_DETAIL_FINGERPRINTS_KEY)
+
+    # 清除已删除商品的指纹
+    removed = set(saved) - {str(sku_id).encode() for sku_id in fingerprints}
+    if removed:
+        redis_conn.hdel(constants.SKU_DETAIL_FINGERPRINTS_KEY, *removed)
+
+    stale = {}
+    for sku_id, fingerprint in fingerprints.items():
+        saved_fingerprint = saved.get(str(sku_id).encode())
+
+        # 规格信息不完整的商品没有页面文件，依赖数据未变化时不需要重新检查
+        if saved_fingerprint == skipped_sku_detail_fingerprint(fingerprint).encode():
+            continue
+
+        save_path = os.path.join(settings.GENERATED_STATIC_HTML_FILES_DIR, 'goods/%s.html' % sku_id)
+
+        if saved_fingerprint == fingerprint.encode() and os.path.exists(save_path):
+            continue
+
+        stale[sku_id] = fingerprint
+
+    return stale
+
+
+def skipped_sku_detail_fingerprint(fingerprint):
+    """规格信息不完整、不生成页面的商品保存的指纹"""
+    return constants.SKU_DETAIL_SKIPPED_FINGERPRINT_PREFIX + fingerprint
+
+
+def save_sku_detail_fingerprints(fingerprints):
+    """保存已生成详情页面的商品的指纹: {<sku_id>: <fingerprint>, ...}"""
+    if fingerprints:
+        redis_conn = get_redis_connection('default')
+        redis_conn.hmset(constants.SKU_DETAIL_FINGERPRINTS_KEY, fingerprints)
@@ -1,34 +1,50 @@
+from django.http import Http404
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import etag
 from rest_framework.generics import ListAPIView
 from rest_framework.filters import OrderingFilter
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from drf_haystack.viewsets import HaystackViewSet
 
-from goods.models import SKU, GoodsCategory, GoodsChannel
-from goods.serializers import SKUSerializer, SKUIndexSerializer
+from goods import constants
+from goods.categories import get_category_snapshot
+from goods.listing import CategoryListing, SORT_FIELDS, get_hot_skus
+from goods.models import SKU
+from goods.serializers import SKUSerializer, SKUIndexSerializer, SKUListSerializer
+from meiduo_mall.utils.pagination import StandardResultOrKeysetPagination
+
+
+def category_etag(request, *args, **kwargs):
+    """
+    返回商品分类数据的ETag，分类数据未变化时返回304
+    请求的category_id不存在时返回None，不进行条件判断，由视图返回404
+    """
+    snapshot = get_category_snapshot()
+
+    category_id = kwargs.get('category_id')
+    if category_id is not None and int(category_id) not in snapshot.breadcrumbs:
+        return None
+
+    return snapshot.etag
+
+
+# GET /categories/
+class CategoryTreeView(APIView):
+    @method_decorator(etag(category_etag))
+    def get(self, request):
+        """获取商品分类树，数据从进程内的分类数据快照中读取"""
+        return Response(get_category_snapshot().tree)
 
 
 # GET /categories/(?P<category_id>\d+)/
 class BreadCrumbView(APIView):
+    @method_decorator(etag(category_etag))
     def get(self, request, category_id):
-        # 获取对应的三级分类数据
-        cat3 = GoodsCategory.objects.get(id=category_id)
-        cat2 = cat3.parent
-        cat1 = GoodsChannel.objects.get(id=cat2.parent_id)
-
-        # 组织相应数据
-        response_data = {
-            'cat1': {
-                'name': cat1.category.name,
-                'url': cat1.url
-            },
-            'cat2': {
-                'name': cat2.name
-            },
-            'cat3': {
-                'name': cat3.name
-            }
-        }
+        """获取三级分类的面包屑导航，数据从进程内的分类数据快照中读取"""
+        response_data = get_category_snapshot().breadcrumbs.get(int(category_id))
+        if response_data is None:
+            raise Http404
 
         return Response(response_data)
 
@@ -48,7 +64,30 @@ class SKUListView(ListAPIView):
     # 设置排序
     filter_backends = [OrderingFilter]
     # 设置排序字段
-    ordering_fields = ('update_time', 'price', 'sales')
+    ordering_fields = ('create_time', 'update_time', 'price', 'sales')
+    # 默认排序
+    ordering = '-create_time'
+
+    # 指定分页类: 请求中携带cursor参数时使用键集分页
+    # ?cursor=&ordering=price: 第一页，之后使用响应中的next地址获取下一页
+    pagination_class = StandardResultOrKeysetPagination
+
+    def list(self, request, *args, **kwargs):
+        """
+        获取分类SKU商品的数据:
+        按照create_time、price、sales排序时，从redis的分类商品列表缓存中获取一页sku_id，再批量获取商品快照
+        其他排序方式和键集分页时查询数据库
+        """
+        ordering = OrderingFilter().get_ordering(request, self.get_queryset(), self)[0]
+
+        if 'cursor' in request.query_params or ordering.lstrip('-') not in SORT_FIELDS:
+            return super().list(request, *args, **kwargs)
+
+        skus = CategoryListing(self.kwargs['category_id'], ordering)
+
+        page = self.paginate_queryset(skus)
+        serializer = SKUListSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     # def get(self, request, category_id):
     #     """
@@ -78,9 +117,18 @@ class SKUSearchViewSet(HaystackViewSet):
     serializer_class = SKUIndexSerializer
 
 
+# GET /categories/(?P<category_id>\d+)/hotskus/
+class CategoryHotSKUView(APIView):
+    def get(self, request, category_id):
+        """获取分类的热销商品，数据从redis的销量排行中读取"""
+        serializer = SKUListSerializer(get_hot_skus(category_id), many=True)
+        return Response(serializer.data)
+
+
 # GET /skus/hot/
 class SKUHotView(ListAPIView):
-    queryset = SKU.objects.order_by('sales')[:2]
+    # 全站销量最高的商品
+    queryset = SKU.objects.filter(is_launched=True).order_by('-sales')[:constants.HOT_SKUS_COUNT]
     serializer_class = SKUSerializer
 
     # 关闭分页
@@ -0,0 +1,36 @@
+# 异步下单任务状态的有效期: s
+ORDER_JOB_EXPIRES = 24 * 3600
+
+# 异步下单时同时处理的包含同一商品的下单任务数量上限
+ORDER_SKU_CONCURRENCY = 4
+
+# 下单任务占用商品并发数的最长时间: s，任务异常退出时占用的并发数在这个时间之后自动释放
+ORDER_SKU_SLOT_EXPIRES = 60
+
+# 商品并发数达到上限时，下单任务重试的间隔: s
+ORDER_JOB_RETRY_COUNTDOWN = 1
+
+# 商品并发数达到上限时，下单任务重试的最大次数，超过之后下单失败
+ORDER_JOB_MAX_RETRIES = 60
+
+# 用户同时只处理一个下单任务的最长时间: s，超过重试时间，任务异常退出时在这个时间之后可以再次下单
+ORDER_JOB_USER_EXPIRES = 2 * 60
+
+
+# 订单编号时间戳的起始时间: 2018-01-01 00:00:00 UTC，毫秒
+ORDER_ID_EPOCH = 1514764800000
+
+# 扣减库存时数据库死锁或锁等待超时的重试次数
+ORDER_INVENTORY_MAX_RETRIES = 3
+
+# 用户订单摘要的有效期: s，增量更新之外的订单修改(如后台发货)最多在这个时间之后生效
+ORDER_SUMMARY_EXPIRES = 10 * 60
+
+# 加载用户订单摘要期间发生增量更新时重新加载的次数
+ORDER_SUMMARY_LOAD_RETRIES = 2
+
+# 订单摘要中保存的订单商品数量
+ORDER_SUMMARY_SKUS_COUNT = 3
+
+# 订单编号worker id租约的有效期: s，进程退出之后worker id在这个时间之后可以被其他进程使用
+ORDER_ID_WORKER_LEASE = 60
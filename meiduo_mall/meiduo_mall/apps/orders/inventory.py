@@ -0,0 +1,234 @@
+# 下单时扣减商品库存的策略，通过配置文件中的ORDER_INVENTORY_STRATEGY选择
+# orders.inventory.OptimisticStrategy: 数据库条件更新(乐观锁)
+# orders.inventory.PessimisticStrategy: select ... for update(悲观锁)
+# orders.inventory.ReservationStrategy: redis热库存预占，异步回写数据库
+from django.conf import settings
+from django.db import transaction, OperationalError
+from django.db.models import Q, F, Case, When
+from django.utils.module_loading import import_string
+from rest_framework import serializers
+
+from goods.cache import invalidate_sku_snapshots
+from goods.listing import incr_sku_listing_sales
+from goods.models import SKU
+from goods.stock import StockReservation, StockNotLoaded
+from orders import constants
+from orders.models import OrderInfo, OrderGoods
+
+
+def _deduct_stock(skus, cart, check_stock=True):
+    """
+    一条UPDATE语句扣减所有商品的库存并增加销量，返回被更新的行数:
+    check_stock: 是否在UPDATE语句中判断库存是否足够
+    """
+    # update tb_sku
+    # set stock=case id when <sku_id> then stock-<count> ... end,
+    #     sales=case id when <sku_id> then sales+<count> ... end
+    # where id in (...) and ((id=<sku_id> and stock>=<count>) or ...);
+    enough_stock = Q()
+    new_stock = []
+    new_sales = []
+    for sku in skus:
+        count = cart[sku.id]
+        enough_stock |= Q(id=sku.id, stock__gte=count)
+        new_stock.append(When(id=sku.id, then=F('stock') - count))
+        new_sales.append(When(id=sku.id, then=F('sales') + count))
+
+    queryset = SKU.objects.filter(id__in=cart.keys())
+    if check_stock:
+        queryset = queryset.filter(enough_stock)
+
+    return queryset.update(
+        stock=Case(*new_stock, default=F('stock')),
+        sales=Case(*new_sales, default=F('sales'))
+    )
+
+
+def _create_order(order_data, skus, cart):
+    """添加订单基本信息和订单商品记录，返回订单对象"""
+    # 1）向订单基本信息表添加一条记录
+    order = OrderInfo.objects.create(**order_data)
+
+    # 2）订单中包含几个商品，就向订单商品表中添加几条记录
+    order_goods = []
+    for sku in skus:
+        count = cart[sku.id]
+        order_goods.append(OrderGoods(
+            order=order,
+            sku=sku,
+            count=count,
+            price=sku.price
+        ))
+
+        # 累加计算订单商品的总数量和总金额
+        order.total_count += count
+        order.total_amount += count*sku.price
+
+    # 向订单商品表中批量添加记录
+    OrderGoods.objects.bulk_create(order_goods)
+
+    # 实付款
+    order.total_amount += order.freight
+    order.save()
+
+    return order
+
+
+class InventoryStrategy(object):
+    """
+    库存扣减策略:
+    save_order(order_data, cart): 扣减库存并保存订单数据，返回订单对象，库存不足时抛出ValidationError
+    数据库死锁或锁等待超时(OperationalError)时整体重试，retries记录重试的次数
+    """
+    def __init__(self):
+        self.retries = 0
+
+    def save_order(self, order_data, cart):
+        """
+        扣减库存并保存订单数据:
+        order_data: 订单基本信息 cart: 要购买的商品 {<sku_id>: <count>, ...}
+        """
+        for i in range(constants.ORDER_INVENTORY_MAX_RETRIES + 1):
+            try:
+                order = self.deduct_and_save(order_data, cart)
+                break
+            except OperationalError:
+                if i == constants.ORDER_INVENTORY_MAX_RETRIES:
+                    raise serializers.ValidationError('下单失败')
+                self.retries += 1
+
+        # 下单成功之后立即更新分类商品列表缓存中的销量(热销排行)，不等待库存异步回写
+        incr_sku_listing_sales(cart)
+
+        return order
+
+    def deduct_and_save(self, order_data, cart):
+        raise NotImplementedError
+
+
+class OptimisticStrategy(InventoryStrategy):
+    """
+    数据库条件更新(乐观锁):
+    1. 一次查询出所有要购买的商品(按照id排序，保证加锁顺序一致)
+    2. 一条条件UPDATE语句扣减所有商品的库存并增加销量，库存在查询之后被扣减到不足时更新行数不一致
+    3. 批量添加订单商品记录
+    """
+    check_stock = True
+
+    def lock_skus(self, cart):
+        # select * from tb_sku where id in (...) order by id;
+        return list(SKU.objects.filter(id__in=cart.keys()).order_by('id'))
+
+    def deduct_and_save(self, order_data, cart):
+        with transaction.atomic():
+            # with语句块中的代码，凡是涉及到数据库的操作，在进行数据库操作时会放在同一事务中
+
+            # 设置一个事务的保存点
+            sid = transaction.savepoint()
+
+            try:
+                skus = self.lock_skus(cart)
+
+                if len(skus) != len(cart):
+                    # 回滚事务到sid保存点，将sid保存点之后的sql语句的执行结果撤销
+                    transaction.savepoint_rollback(sid)
+                    raise serializers.ValidationError('商品不存在')
+
+                # 判断库存
+                for sku in skus:
+                    if cart[sku.id] > sku.stock:
+                        # 回滚事务到sid保存点，将sid保存点之后的sql语句的执行结果撤销
+                        transaction.savepoint_rollback(sid)
+                        raise serializers.ValidationError('商品库存不足')
+
+                # 销量增加，库存减少
+                res = _deduct_stock(skus, cart, self.check_stock)
+
+                if res != len(skus):
+                    # 有商品的库存在查询之后被其他订单扣减，库存已经不足
+                    # 回滚事务到sid保存点，将sid保存点之后的sql语句的执行结果撤销
+                    transaction.savepoint_rollback(sid)
+                    raise serializers.ValidationError('商品库存不足')
+
+                order = _create_order(order_data, skus, cart)
+            except (serializers.ValidationError, OperationalError):
+                # 继续向外抛出，OperationalError由save_order进行重试
+                raise
+            except Exception:
+                # 下单失败，回滚事务到sid保存点，将sid保存点之后的sql语句的执行结果撤销
+                transaction.savepoint_rollback(sid)
+                raise serializers.ValidationError('下单失败1')
+
+        # 商品库存和销量发生了变化，清除商品快照缓存
+        invalidate_sku_snapshots(cart.keys())
+
+        return order
+
+
+class PessimisticStrategy(OptimisticStrategy):
+    """
+    select ... for update(悲观锁):
+    查询商品时按照id顺序锁定所有要购买的商品，事务提交之前其他订单不能修改，扣减时不需要再判断库存
+    """
+    check_stock = False
+
+    def lock_skus(self, cart):
+        # select * from tb_sku where id in (...) order by id for update;
+        return list(SKU.objects.select_for_update().filter(id__in=cart.keys()).order_by('id'))
+
+
+class ReservationStrategy(InventoryStrategy):
+    """
+    redis热库存预占:
+    1. 在redis中一次性预占所有商品的库存
+    2. 保存订单基本信息和订单商品信息
+    3. 异步将库存和销量的变化回写到数据库
+    """
+    def deduct_and_save(self, order_data, cart):
+        # 1. 在redis中一次性预占所有商品的库存
+        reservation = StockReservation()
+
+        try:
+            reservation_id = reservation.reserve(cart)
+        except StockNotLoaded:
+            # 商品正在回写或对账，不能判断库存是否足够，不能提示库存不足
+            raise serializers.ValidationError('商品库存正在更新，请稍后重试')
+
+        if reservation_id is None:
+            raise serializers.ValidationError('商品库存不足')
+
+        # 2. 保存订单基本信息和订单商品信息
+        try:
+            with transaction.atomic():
+                # select * from tb_sku where id in (...);
+                skus = SKU.objects.filter(id__in=cart.keys())
+                order = _create_order(order_data, skus, cart)
+        except OperationalError:
+            # 归还预占的商品库存，由save_order进行重试
+            reservation.release(reservation_id)
+            raise
+        except Exception:
+            # 下单失败，归还预占的商品库存
+            reservation.release(reservation_id)
+            raise serializers.ValidationError('下单失败1')
+
+        # 3. 异步将库存和销量的变化回写到数据库
+        self.write_back(reservation_id, cart)
+
+        return order
+
+    def write_back(self, reservation_id, cart):
+        """发出库存回写任务消息，发送失败时记录预占，由对账定时任务回写"""
+        from celery_tasks.stock.tasks import write_back_sku_stock
+        try:
+            write_back_sku_stock.delay(reservation_id, list(cart.items()))
+        except Exception:
+            # 订单已经保存，消息发送失败(如broker不可用)时不能让预占一直处于待回写状态
+            StockReservation().defer_write_back(reservation_id, cart)
+
+
+def get_inventory_strategy():
+    """返回配置文件中指定的库存扣减策略(ORDER_INVENTORY_STRATEGY)的对象"""
+    strategy_class = import_string(getattr(settings, 'ORDER_INVENTORY_STRATEGY',
+                                           'orders.inventory.OptimisticStrategy'))
+    return strategy_class()
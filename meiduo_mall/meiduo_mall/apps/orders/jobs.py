@@ -0,0 +1,140 @@
+# 异步下单: 下单任务的状态和商品并发控制
+# hash: order_job_<token> 保存下单任务的状态 {'user_id': ..., 'status': ..., 'order_id': ..., 'message': ...}
+# zset: order_sku_slots_<sku_id> 正在处理的包含该商品的下单任务 member为任务的token，score为占用的截止时间(ms)
+# string: order_job_user_<user_id> 用户正在处理的下单任务的token，同一用户同时只处理一个下单任务
+import time
+import uuid
+
+from django_redis import get_redis_connection
+
+from orders import constants
+
+# 下单任务的状态
+JOB_QUEUED = 'queued'
+JOB_SUCCESS = 'success'
+JOB_FAILED = 'failed'
+
+# 所有商品的并发数都未达到上限时，一次性占用所有商品的并发数，否则不占用
+# 每个任务在zset中单独记录占用的截止时间，异常退出的任务占用的并发数在截止时间之后自动释放
+# KEYS: 各个商品的并发数key
+# ARGV[1]: 每个商品的并发数上限 ARGV[2]: 任务的token ARGV[3]: 当前时间(ms) ARGV[4]: 占用的截止时间(ms)
+ACQUIRE_SCRIPT = """
+for i, key in ipairs(KEYS) do
+    redis.call('zremrangebyscore', key, '-inf', ARGV[3])
+    if not redis.call('zscore', key, ARGV[2]) and redis.call('zcard', key) >= tonumber(ARGV[1]) then
+        return 0
+    end
+end
+for i, key in ipairs(KEYS) do
+    redis.call('zadd', key, ARGV[4], ARGV[2])
+    -- key的有效期只用于清理不再使用的key，只延长不缩短
+    if redis.call('pttl', key) < tonumber(ARGV[4]) - tonumber(ARGV[3]) then
+        redis.call('pexpireat', key, ARGV[4])
+    end
+end
+return 1
+"""
+
+# 释放任务占用的所有商品的并发数
+# KEYS: 各个商品的并发数key
+# ARGV[1]: 任务的token
+RELEASE_SCRIPT = """
+for i, key in ipairs(KEYS) do
+    redis.call('zrem', key, ARGV[1])
+end
+return 1
+"""
+
+
+# 创建下单任务: 用户没有正在处理的下单任务时创建，否则返回正在处理的任务
+# KEYS[1]: 用户正在处理的任务 KEYS[2]: 新任务的状态hash
+# ARGV[1]: 新任务的token ARGV[2]: user_id ARGV[3]: 用户同时只处理一个任务的时间(s) ARGV[4]: 任务状态的有效期(s)
+# 返回: {1, 新任务的token} 或 {0, 正在处理的任务的token}
+CREATE_SCRIPT = """
+local token = redis.call('get', KEYS[1])
+if token then
+    return {0, token}
+end
+redis.call('set', KEYS[1], ARGV[1], 'EX', ARGV[3])
+redis.call('hmset', KEYS[2], 'user_id', ARGV[2], 'status', 'queued')
+redis.call('expire', KEYS[2], ARGV[4])
+return {1, ARGV[1]}
+"""
+
+# 保存下单任务的结果，用户正在处理的任务是该任务时清除，用户可以再次下单
+# KEYS[1]: 任务的状态hash
+# ARGV[1]: 任务的token ARGV[2]: 任务的状态 ARGV[3]: 订单编号 ARGV[4]: 下单失败的原因
+FINISH_SCRIPT = """
+redis.call('hmset', KEYS[1], 'status', ARGV[2], 'order_id', ARGV[3], 'message', ARGV[4])
+local user_id = redis.call('hget', KEYS[1], 'user_id')
+if user_id then
+    local user_key = 'order_job_user_' .. user_id
+    if redis.call('get', user_key) == ARGV[1] then
+        redis.call('del', user_key)
+    end
+end
+return 1
+"""
+
+
+def _job_key(token):
+    return 'order_job_%s' % token
+
+
+def _user_job_key(user_id):
+    return 'order_job_user_%s' % user_id
+
+
+def create_order_job(user_id):
+    """
+    创建下单任务，返回(任务的token, 是否是新创建的任务):
+    用户已有正在处理的下单任务(重复点击或者重试请求)时不再创建，返回正在处理的任务
+    """
+    token = uuid.uuid4().hex
+
+    redis_conn = get_redis_connection('default')
+    script = redis_conn.register_script(CREATE_SCRIPT)
+    created, token = script(keys=[_user_job_key(user_id), _job_key(token)],
+                            args=[token, user_id, constants.ORDER_JOB_USER_EXPIRES, constants.ORDER_JOB_EXPIRES])
+
+    return token.decode(), created == 1
+
+
+def finish_order_job(token, status, order_id='', message=''):
+    """保存下单任务的结果，用户可以再次下单"""
+    redis_conn = get_redis_connection('default')
+    script = redis_conn.register_script(FINISH_SCRIPT)
+    script(keys=[_job_key(token)], args=[token, status, order_id, message])
+
+
+def get_order_job(token):
+    """获取下单任务的状态，任务不存在时返回None"""
+    redis_conn = get_redis_connection('default')
+    job = redis_conn.hgetall(_job_key(token))
+    if not job:
+        return None
+
+    return {key.decode(): value.decode() for key, value in job.items()}
+
+
+def _slot_keys(sku_ids):
+    # 按照sku_id排序，保证多个任务占用的顺序一致
+    return ['order_sku_slots_%s' % sku_id for sku_id in sorted(sku_ids)]
+
+
+def acquire_sku_slots(sku_ids, token):
+    """占用商品的并发数，返回False表示有商品的并发数已达到上限"""
+    now = int(time.time() * 1000)
+
+    redis_conn = get_redis_connection('default')
+    script = redis_conn.register_script(ACQUIRE_SCRIPT)
+    res = script(keys=_slot_keys(sku_ids),
+                 args=[constants.ORDER_SKU_CONCURRENCY, token, now, now + constants.ORDER_SKU_SLOT_EXPIRES * 1000])
+    return res == 1
+
+
+def release_sku_slots(sku_ids, token):
+    """释放任务占用的商品的并发数"""
+    redis_conn = get_redis_connection('default')
+    script = redis_conn.register_script(RELEASE_SCRIPT)
+    script(keys=_slot_keys(sku_ids), args=[token])
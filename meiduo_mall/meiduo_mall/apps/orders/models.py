@@ -50,6 +50,10 @@ class OrderInfo(BaseModel):
         db_table = "tb_order_info"
         verbose_name = '订单基本信息'
         verbose_name_plural = verbose_name
+        # 用户订单列表键集分页使用的联合索引: (用户, 下单时间, 订单编号)
+        index_together = [
+            ('user', 'create_time', 'order_id'),
+        ]
 
 
 class OrderGoods(BaseModel):
@@ -1,25 +1,22 @@
-from datetime import datetime
-
 from decimal import Decimal
 
 from django.db import transaction
 from django.utils import timezone
-from django_redis import get_redis_connection
 from rest_framework import serializers
 
-from goods.models import SKU
-from goods.serializers import SKUSerializer
+from cart.store import get_cart_store
+from goods.serializers import SKUSerializer, SKUSnapshotSerializer
+from orders.inventory import get_inventory_strategy
+from orders.jobs import create_order_job, finish_order_job, JOB_FAILED
 from orders.models import OrderInfo, OrderGoods
+from orders.summary import add_order_summary, update_order_summary_status
+from orders.utils import generate_order_id
 
 
-class OrderSKUSerializer(serializers.ModelSerializer):
+class OrderSKUSerializer(SKUSnapshotSerializer):
     """订单结算商品序列化器类"""
     count = serializers.IntegerField(label='结算数量')
 
-    class Meta:
-        model = SKU
-        fields = ('id', 'name', 'price', 'default_image', 'count')
-
 
 class OrderSerializer(serializers.ModelSerializer):
     """订单序列化器类"""
@@ -40,6 +37,14 @@ class OrderSerializer(serializers.ModelSerializer):
             }
         }
 
+    def validate_address(self, value):
+        # 只能使用当前登录用户未删除的收货地址
+        user = self.context['request'].user
+        if value.user_id != user.id or value.is_delete:
+            raise serializers.ValidationError('收货地址不存在')
+
+        return value
+
     def create(self, validated_data):
         """创建订单并保存订单数据"""
         # 获取address和pay_method
@@ -49,160 +54,63 @@ class OrderSerializer(serializers.ModelSerializer):
         # 获取登录用户
         user = self.context['request'].user
 
-        # 订单编号：年月日时分秒+用户id
-        order_id = datetime.now().strftime('%Y%m%d%H%M%S') + '%010d' % user.id
-
-        # 商品总数量和实付款
-        total_count = 0
-        total_amount = Decimal(0)
-
-        # 运费: 10
-        freight = Decimal(10.0)
-
-        # 订单状态
-        if pay_method == OrderInfo.PAY_METHODS_ENUM['CASH']: # 货到付款
-            status = OrderInfo.ORDER_STATUS_ENUM['UNSEND'] # 待发货
-        else:
-            status = OrderInfo.ORDER_STATUS_ENUM['UNPAID'] # 待支付
-
-        # redis链接
-        redis_conn = get_redis_connection('cart')
-
-        # 从redis set中获取用户购物车中被勾选的商品sku_id(勾选就是要购买的)
-        cart_selected_key = 'cart_selected_%s' % user.id
-
-        # Set(b'<sku_id>', b'<sku_id>', ...)
-        sku_ids = redis_conn.smembers(cart_selected_key)
-
-        # 从redis hash中获取用户购物车中所有商品sku_id和对应的数量count
-        cart_key = 'cart_%s' % user.id
+        # 从redis中获取用户购物车中被勾选的商品sku_id和对应的数量count(勾选就是要购买的)
         # {
-        #     b'<sku_id>': b'<count>',
+        #     <sku_id>: <count>,
         #     ...
         # }
-        cart_dict = redis_conn.hgetall(cart_key)
-
-        with transaction.atomic():
-            # with语句块中的代码，凡是涉及到数据库的操作，在进行数据库操作时会放在同一事务中
-
-            # 设置一个事务的保存点
-            sid = transaction.savepoint()
-
-            try:
-                # 1）向订单基本信息表添加一条记录
-                order = OrderInfo.objects.create(
-                    order_id=order_id,
-                    user=user,
-                    address=address,
-                    total_count=total_count,
-                    total_amount=total_amount,
-                    freight=freight,
-                    pay_method=pay_method,
-                    status=status
-                )
-
-                # 2）订单中包含几个商品，就向订单商品表中添加几条记录
-                for sku_id in sku_ids:
-                    # 获取购买的数量
-                    count = cart_dict[sku_id]
-                    count = int(count)
-
-                    for i in range(3):
-                        # 根据sku_id获取商品对象
-                        # select * from tb_sku where id=<sku_id>;
-                        sku = SKU.objects.get(id=sku_id)
-
-                        # 判断库存
-                        if count > sku.stock:
-                            # 回滚事务到sid保存点，将sid保存点之后的sql语句的执行结果撤销
-                            transaction.savepoint_rollback(sid)
-                            raise serializers.ValidationError('商品库存不足')
-
-                        # 记录查出的商品原始库存
-                        origin_stock = sku.stock
-                        new_stock = origin_stock - count
-                        new_sales = sku.sales + count
-
-                        # 模拟产生订单并发
-                        # print('users: %s times: %s origin_stock: %s' % (user.id, i, origin_stock))
-                        # import time
-                        # time.sleep(10)
-
-                        # 销量增加，库存减少
-                        # update tb_sku
-                        # set stock=<new_stock>, sales=<new_sales>
-                        # where id=<sku_id>;
-                        # sku.stock -= count
-                        # sku.sales += count
-                        # sku.save()
-
-                        # update tb_sku
-                        # set stock=<new_stock>, sales=<new_sales>
-                        # where id=<sku_id> and stock=<origin_stock>;
-                        # 返回是一个数字：代表被更新的行数
-                        res = SKU.objects.filter(id=sku_id, stock=origin_stock).\
-                            update(stock=new_stock, sales=new_sales)
-
-                        if res == 0:
-                            if i == 2:
-                                # 连续更新了3次，仍然失败，直接下单失败
-                                # 回滚事务到sid保存点，将sid保存点之后的sql语句的执行结果撤销
-                                transaction.savepoint_rollback(sid)
-                                raise serializers.ValidationError('下单失败2')
-                            # 更新失败，商品的库存发生了变化，需要重新进行查询和更新
-                            continue
-
-                        # 向订单商品表中添加一条记录
-                        OrderGoods.objects.create(
-                            order=order,
-                            sku=sku,
-                            count=count,
-                            price=sku.price
-                        )
-
-                        # 累加计算订单商品的总数量和总金额
-                        total_count += count
-                        total_amount += count*sku.price
-
-                        # 跳出循环
-                        break
-
-                # 实付款
-                total_amount += freight
-                order.total_count = total_count
-                order.total_amount = total_amount
-                order.save()
-            except serializers.ValidationError:
-                # 继续向外抛出
-                raise
-            except Exception:
-                # 下单失败，回滚事务到sid保存点，将sid保存点之后的sql语句的执行结果撤销
-                transaction.savepoint_rollback(sid)
-                raise serializers.ValidationError('下单失败1')
+        cart_store = get_cart_store(user.id)
+        cart = cart_store.get_selected()
+
+        order = self.place_order(user, address, pay_method, cart)
 
         # 3）清除购物车对应的购物车记录
-        pl = redis_conn.pipeline()
-        pl.hdel(cart_key, *sku_ids)
-        pl.srem(cart_selected_key, *sku_ids)
-        pl.execute()
+        cart_store.remove(*cart.keys())
 
         return order
 
-    def create_1(self, validated_data):
-        """创建订单并保存订单数据"""
+    def enqueue(self):
+        """
+        异步下单: 保存购物车中被勾选商品的快照，发出下单任务，返回下单任务的token
+        同一用户同时只处理一个下单任务，重复提交时返回正在处理的任务的token
+        下单任务由celery_tasks.orders.tasks.place_order完成
+        """
         # 获取address和pay_method
-        address = validated_data['address']
-        pay_method = validated_data['pay_method']
+        address = self.validated_data['address']
+        pay_method = self.validated_data['pay_method']
 
         # 获取登录用户
         user = self.context['request'].user
 
-        # 订单编号：年月日时分秒+用户id
-        order_id = datetime.now().strftime('%Y%m%d%H%M%S') + '%010d' % user.id
+        # 购物车中被勾选商品的快照: {<sku_id>: <count>, ...}
+        cart = get_cart_store(user.id).get_selected()
+        if not cart:
+            raise serializers.ValidationError('没有要结算的商品')
+
+        # 用户已有正在处理的下单任务(重复点击或者重试请求)时直接返回该任务，不重复下单
+        token, created = create_order_job(user.id)
+        if not created:
+            return token
 
-        # 商品总数量和实付款
-        total_count = 0
-        total_amount = Decimal(0)
+        # 发出下单任务消息
+        from celery_tasks.orders.tasks import place_order
+        try:
+            place_order.delay(token, user.id, address.id, pay_method, list(cart.items()))
+        except Exception:
+            # 消息发送失败(如broker不可用)，任务不会被处理
+            finish_order_job(token, JOB_FAILED, message='下单失败')
+            raise serializers.ValidationError('下单失败，请稍后重试')
+
+        return token
+
+    def place_order(self, user, address, pay_method, cart, strategy=None):
+        """
+        扣减库存并保存订单数据:
+        cart: 要购买的商品 {<sku_id>: <count>, ...}
+        strategy: 库存扣减策略，默认使用配置文件中指定的策略
+        """
+        # 订单编号：按时间递增的19位数字
+        order_id = generate_order_id()
 
         # 运费: 10
         freight = Decimal(10.0)
@@ -213,103 +121,26 @@ class OrderSerializer(serializers.ModelSerializer):
         else:
             status = OrderInfo.ORDER_STATUS_ENUM['UNPAID'] # 待支付
 
-        # redis链接
-        redis_conn = get_redis_connection('cart')
-
-        # 从redis set中获取用户购物车中被勾选的商品sku_id(勾选就是要购买的)
-        cart_selected_key = 'cart_selected_%s' % user.id
+        # 组织订单基本信息
+        order_data = {
+            'order_id': order_id,
+            'user': user,
+            'address': address,
+            'total_count': 0,
+            'total_amount': Decimal(0),
+            'freight': freight,
+            'pay_method': pay_method,
+            'status': status
+        }
 
-        # Set(b'<sku_id>', b'<sku_id>', ...)
-        sku_ids = redis_conn.smembers(cart_selected_key)
+        # 使用配置文件中指定的库存扣减策略扣减库存并保存订单数据
+        if strategy is None:
+            strategy = get_inventory_strategy()
 
-        # 从redis hash中获取用户购物车中所有商品sku_id和对应的数量count
-        cart_key = 'cart_%s' % user.id
-        # {
-        #     b'<sku_id>': b'<count>',
-        #     ...
-        # }
-        cart_dict = redis_conn.hgetall(cart_key)
-
-        with transaction.atomic():
-            # with语句块中的代码，凡是涉及到数据库的操作，在进行数据库操作时会放在同一事务中
-
-            # 设置一个事务的保存点
-            sid = transaction.savepoint()
-
-            try:
-                # 1）向订单基本信息表添加一条记录
-                order = OrderInfo.objects.create(
-                    order_id=order_id,
-                    user=user,
-                    address=address,
-                    total_count=total_count,
-                    total_amount=total_amount,
-                    freight=freight,
-                    pay_method=pay_method,
-                    status=status
-                )
-
-                # 2）订单中包含几个商品，就向订单商品表中添加几条记录
-                for sku_id in sku_ids:
-                    # 获取购买的数量
-                    count = cart_dict[sku_id]
-                    count = int(count)
-
-                    # 根据sku_id获取商品对象
-                    # select * from tb_sku where id=<sku_id>;
-                    # sku = SKU.objects.get(id=sku_id)
-
-                    # select * from tb_sku where id=<sku_id> for update;
-                    print('users: %s try get lock' % user.id)
-                    sku = SKU.objects.select_for_update().get(id=sku_id) # 悲观锁(互斥锁)
-                    print('users: %s get locked' % user.id)
-
-                    # 判断库存
-                    if count > sku.stock:
-                        # 回滚事务到sid保存点，将sid保存点之后的sql语句的执行结果撤销
-                        transaction.savepoint_rollback(sid)
-                        raise serializers.ValidationError('商品库存不足')
-
-                    # 模拟产生订单并发
-                    # print('users: %s' % user.id)
-                    import time
-                    time.sleep(10)
-
-                    # 销量增加，库存减少
-                    sku.stock -= count
-                    sku.sales += count
-                    sku.save()
-
-                    # 向订单商品表中添加一条记录
-                    OrderGoods.objects.create(
-                        order=order,
-                        sku=sku,
-                        count=count,
-                        price=sku.price
-                    )
-
-                    # 累加计算订单商品的总数量和总金额
-                    total_count += count
-                    total_amount += count*sku.price
-
-                # 实付款
-                total_amount += freight
-                order.total_count = total_count
-                order.total_amount = total_amount
-                order.save()
-            except serializers.ValidationError:
-                # 继续向外抛出
-                raise
-            except Exception:
-                # 下单失败，回滚事务到sid保存点，将sid保存点之后的sql语句的执行结果撤销
-                transaction.savepoint_rollback(sid)
-                raise serializers.ValidationError('下单失败1')
+        order = strategy.save_order(order_data, cart)
 
-        # 3）清除购物车对应的购物车记录
-        pl = redis_conn.pipeline()
-        pl.hdel(cart_key, *sku_ids)
-        pl.srem(cart_selected_key, *sku_ids)
-        pl.execute()
+        # 添加用户订单摘要
+        add_order_summary(order)
 
         return order
 
@@ -397,4 +228,9 @@ class SaveOrderCommentSerializer(serializers.ModelSerializer):
         if OrderGoods.objects.filter(order_id=order_id, is_commented=False).count() == 0:
             OrderInfo.objects.filter(order_id=order_id).update(status=OrderInfo.ORDER_STATUS_ENUM['FINISHED'])
 
+            # 事务提交之后更新用户订单摘要中的订单状态
+            user = self.context['request'].user
+            transaction.on_commit(lambda: update_order_summary_status(
+                user.id, order_id, OrderInfo.ORDER_STATUS_ENUM['FINISHED']))
+
         return validated_data
@@ -0,0 +1,243 @@
+# 用户订单摘要: 在redis中保存每个用户所有订单的摘要，订单中心的订单列表直接从redis中读取
+# hash: order_summary_<user_id> {<order_id>: <订单摘要json>, ...}
+# zset: order_summary_index_<user_id> member为order_id，score为下单时间
+# string: order_summary_loaded_<user_id> 用户的订单摘要已加载的标记
+# string: order_summary_version_<user_id> 增量更新的计数，加载期间发生了增量更新时放弃本次加载的结果
+# 下单、支付、评价时增量更新，未加载的用户在第一次访问时从数据库加载
+import json
+import uuid
+
+from django.db.models import Prefetch
+from django_redis import get_redis_connection
+
+from orders import constants
+from orders.models import OrderInfo, OrderGoods
+
+# 订单摘要已加载时，添加订单的摘要，未加载时只增加增量更新的计数
+# KEYS[1]: 加载标记 KEYS[2]: 摘要hash KEYS[3]: 下单时间zset KEYS[4]: 增量更新计数
+# ARGV[1]: order_id ARGV[2]: 订单摘要json ARGV[3]: 下单时间 ARGV[4]: 计数的有效期(s)
+ADD_SCRIPT = """
+redis.call('incr', KEYS[4])
+redis.call('expire', KEYS[4], ARGV[4])
+if redis.call('exists', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('hset', KEYS[2], ARGV[1], ARGV[2])
+redis.call('zadd', KEYS[3], ARGV[3], ARGV[1])
+return 1
+"""
+
+# 订单摘要已加载时，修改订单摘要中的订单状态，未加载时只增加增量更新的计数
+# KEYS[1]: 加载标记 KEYS[2]: 摘要hash KEYS[3]: 增量更新计数
+# ARGV[1]: order_id ARGV[2]: 订单状态 ARGV[3]: 计数的有效期(s)
+STATUS_SCRIPT = """
+redis.call('incr', KEYS[3])
+redis.call('expire', KEYS[3], ARGV[3])
+if redis.call('exists', KEYS[1]) == 0 then
+    return 0
+end
+local summary = redis.call('hget', KEYS[2], ARGV[1])
+if not summary then
+    return 0
+end
+summary = cjson.decode(summary)
+summary['status'] = tonumber(ARGV[2])
+redis.call('hset', KEYS[2], ARGV[1], cjson.encode(summary))
+return 1
+"""
+
+# 订单数量，未加载时返回-1
+# KEYS[1]: 加载标记 KEYS[2]: 下单时间zset
+COUNT_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 0 then
+    return -1
+end
+return redis.call('zcard', KEYS[2])
+"""
+
+# 按照下单时间从新到旧获取一页订单的摘要，未加载时返回{0}，否则返回{1, 摘要json, ...}
+# KEYS[1]: 加载标记 KEYS[2]: 摘要hash KEYS[3]: 下单时间zset
+# ARGV[1]: start ARGV[2]: stop
+PAGE_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 0 then
+    return {0}
+end
+local order_ids = redis.call('zrevrange', KEYS[3], ARGV[1], ARGV[2])
+if #order_ids == 0 then
+    return {1}
+end
+local summaries = redis.call('hmget', KEYS[2], unpack(order_ids))
+table.insert(summaries, 1, 1)
+return summaries
+"""
+
+
+# 加载: 加载期间没有发生增量更新时，将临时key中的摘要重命名为正式的key并设置加载标记，否则删除临时key
+# KEYS[1]: 加载标记 KEYS[2]: 摘要hash KEYS[3]: 下单时间zset KEYS[4]: 增量更新计数
+# KEYS[5]: 临时摘要hash KEYS[6]: 临时下单时间zset
+# ARGV[1]: 开始加载时的增量更新计数 ARGV[2]: 有效期(s)
+SWAP_SCRIPT = """
+local version = redis.call('get', KEYS[4]) or ''
+if version ~= ARGV[1] then
+    redis.call('del', KEYS[5], KEYS[6])
+    return 0
+end
+for i = 2, 3 do
+    if redis.call('exists', KEYS[i + 3]) == 1 then
+        redis.call('rename', KEYS[i + 3], KEYS[i])
+        redis.call('expire', KEYS[i], ARGV[2])
+    else
+        redis.call('del', KEYS[i])
+    end
+end
+redis.call('set', KEYS[1], 1, 'EX', ARGV[2])
+return 1
+"""
+
+
+def _keys(user_id):
+    """返回(加载标记, 摘要hash, 下单时间zset, 增量更新计数)的key"""
+    return ['order_summary_loaded_%s' % user_id,
+            'order_summary_%s' % user_id,
+            'order_summary_index_%s' % user_id,
+            'order_summary_version_%s' % user_id]
+
+
+def prefetch_order_goods(queryset):
+    """
+    一次查询预取订单的订单商品和商品，只查询订单列表使用的字段:
+    select ... from tb_order_goods inner join tb_sku on ... where order_id in (...);
+    """
+    order_goods = OrderGoods.objects.select_related('sku').only(
+        'id', 'order', 'count', 'price',
+        'sku__id', 'sku__name', 'sku__price', 'sku__default_image', 'sku__comments')
+
+    return queryset.prefetch_related(Prefetch('skus', queryset=order_goods))
+
+
+def build_order_summary(order):
+    """
+    返回订单的摘要，格式和订单列表接口返回的订单数据相同:
+    skus只保留前ORDER_SUMMARY_SKUS_COUNT个订单商品，sku_count为订单商品的种类数量
+    """
+    from orders.serializers import OrderInfoSerializer
+
+    summary = OrderInfoSerializer(order).data
+    summary['total_count'] = order.total_count
+    summary['sku_count'] = len(summary['skus'])
+    summary['skus'] = summary['skus'][:constants.ORDER_SUMMARY_SKUS_COUNT]
+    return summary
+
+
+def _dumps(summary):
+    return json.dumps(summary, ensure_ascii=False, separators=(',', ':'))
+
+
+def _score(order):
+    return order.create_time.timestamp()
+
+
+class OrderSummaryList(object):
+    """
+    用户的订单摘要列表，按照下单时间从新到旧排列，可以直接交给分页类进行分页:
+    count(): 订单数量(ZCARD)
+    [start:stop]: 一页订单的摘要(ZREVRANGE + HMGET，一次lua脚本调用)
+    多次加载都和增量更新冲突时，直接从数据库中查询
+    """
+    def __init__(self, user_id, redis_conn=None):
+        if redis_conn is None:
+            redis_conn = get_redis_connection('default')
+
+        self.redis_conn = redis_conn
+        self.user_id = user_id
+        self.keys = _keys(user_id)
+
+    def get_queryset(self):
+        return OrderInfo.objects.filter(user_id=self.user_id).order_by('-create_time', '-order_id')
+
+    def load(self):
+        """
+        从数据库中加载用户所有订单的摘要，返回是否加载成功:
+        先写入临时key，加载期间没有发生增量更新时再原子地替换正式的key，避免覆盖加载期间添加或修改的订单
+        """
+        loaded_key, summary_key, index_key, version_key = self.keys
+        script = self.redis_conn.register_script(SWAP_SCRIPT)
+
+        for i in range(constants.ORDER_SUMMARY_LOAD_RETRIES + 1):
+            # 查询数据库之前记录增量更新的计数
+            version = self.redis_conn.get(version_key) or b''
+
+            orders = prefetch_order_goods(self.get_queryset())
+
+            token = uuid.uuid4().hex
+            tmp_summary_key = '%s_tmp_%s' % (summary_key, token)
+            tmp_index_key = '%s_tmp_%s' % (index_key, token)
+
+            pl = self.redis_conn.pipeline()
+            for order in orders:
+                pl.hset(tmp_summary_key, order.order_id, _dumps(build_order_summary(order)))
+                pl.zadd(tmp_index_key, _score(order), order.order_id)
+
+            # 临时key设置有效期，加载中断时自动删除
+            pl.expire(tmp_summary_key, constants.ORDER_SUMMARY_EXPIRES)
+            pl.expire(tmp_index_key, constants.ORDER_SUMMARY_EXPIRES)
+            pl.execute()
+
+            # 设置有效期，增量更新遗漏的修改(如后台发货)在过期之后重新加载时修正
+            if script(keys=self.keys + [tmp_summary_key, tmp_index_key],
+                      args=[version, constants.ORDER_SUMMARY_EXPIRES]) == 1:
+                return True
+
+        return False
+
+    def count(self):
+        script = self.redis_conn.register_script(COUNT_SCRIPT)
+        count = script(keys=[self.keys[0], self.keys[2]])
+
+        if count == -1:
+            if not self.load():
+                return self.get_queryset().count()
+            count = script(keys=[self.keys[0], self.keys[2]])
+
+        return max(count, 0)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            raise TypeError('OrderSummaryList只支持切片')
+
+        start = item.start or 0
+        stop = item.stop if item.stop is not None else 0
+
+        script = self.redis_conn.register_script(PAGE_SCRIPT)
+        res = script(keys=self.keys[:3], args=[start, stop - 1])
+
+        if res[0] == 0:
+            if not self.load():
+                orders = prefetch_order_goods(self.get_queryset())[start:stop]
+                return [build_order_summary(order) for order in orders]
+            res = script(keys=self.keys[:3], args=[start, stop - 1])
+
+        return [json.loads(summary.decode()) for summary in res[1:] if summary]
+
+
+def add_order_summary(order):
+    """订单保存之后添加订单的摘要"""
+    # select ... from tb_order_info where order_id=<order_id>;
+    # select ... from tb_order_goods inner join tb_sku on ... where order_id in (<order_id>);
+    order = prefetch_order_goods(OrderInfo.objects.filter(order_id=order.order_id)).get()
+
+    redis_conn = get_redis_connection('default')
+    script = redis_conn.register_script(ADD_SCRIPT)
+    script(keys=_keys(order.user_id), args=[order.order_id, _dumps(build_order_summary(order)), _score(order),
+                                            constants.ORDER_SUMMARY_EXPIRES])
+
+
+def update_order_summary_status(user_id, order_id, status):
+    """订单状态修改之后更新订单摘要中的订单状态"""
+    redis_conn = get_redis_connection('default')
+    script = redis_conn.register_script(STATUS_SCRIPT)
+    loaded_key, summary_key, index_key, version_key = _keys(user_id)
+    script(keys=[loaded_key, summary_key, version_key], args=[order_id, status, constants.ORDER_SUMMARY_EXPIRES])
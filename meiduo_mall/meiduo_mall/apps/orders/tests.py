@@ -1,3 +1,322 @@
-from django.test import TestCase
+import base64
+import multiprocessing
 
-# Create your tests here.
+import redis
+from unittest import mock
+from decimal import Decimal
+
+from django.db import connection
+from django_redis import get_redis_connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from areas.models import Area
+from goods.models import GoodsCategory, Brand, SPU, SKU
+from orders import constants
+from orders.models import OrderInfo, OrderGoods
+from orders.serializers import OrderInfoSerializer
+from orders.summary import build_order_summary, prefetch_order_goods, OrderSummaryList, add_order_summary, \
+    update_order_summary_status
+from orders.utils import SnowflakeIdGenerator, WorkerIdLease, MAX_SEQUENCE, WORKER_ID_BITS, SEQUENCE_BITS
+from users.models import User, Address
+
+# 每个进程生成的订单编号数量
+IDS_PER_PROCESS = 50000
+PROCESSES = 4
+
+
+def _generate_ids(worker_id):
+    """子进程中使用指定的worker id生成订单编号"""
+    generator = SnowflakeIdGenerator(worker_id)
+    return [generator.next_id() for _ in range(IDS_PER_PROCESS)]
+
+
+class FakeClock(object):
+    """按照给定的时间序列返回时间，用完之后返回最后一个时间+1"""
+    def __init__(self, *timestamps):
+        self.timestamps = list(timestamps)
+        self.last = timestamps[-1]
+
+    def __call__(self):
+        if self.timestamps:
+            return self.timestamps.pop(0)
+        self.last += 1
+        return self.last
+
+
+class SnowflakeIdGeneratorTest(SimpleTestCase):
+    """订单编号生成器的测试"""
+
+    def test_multiprocess_unique(self):
+        """多个进程使用不同的worker id生成的编号不重复，每个进程内按时间递增"""
+        pool = multiprocessing.get_context('fork').Pool(PROCESSES)
+        try:
+            results = pool.map(_generate_ids, range(PROCESSES))
+        finally:
+            pool.close()
+            pool.join()
+
+        all_ids = set()
+        for ids in results:
+            self.assertEqual(ids, sorted(ids))
+            self.assertEqual(len(set(ids)), len(ids))
+            all_ids.update(ids)
+
+        self.assertEqual(len(all_ids), IDS_PER_PROCESS * PROCESSES)
+        # 编号为正的64位整数
+        self.assertLess(max(all_ids), 1 << 63)
+
+    def test_sequence_overflow_waits_next_millisecond(self):
+        """同一毫秒内的序号用完时等待下一毫秒"""
+        clock = FakeClock(*([1000] * (MAX_SEQUENCE + 2)))
+        generator = SnowflakeIdGenerator(1, epoch=0, clock=clock)
+
+        ids = [generator.next_id() for _ in range(MAX_SEQUENCE + 2)]
+
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertEqual(ids[-1] >> (WORKER_ID_BITS + SEQUENCE_BITS), 1001)
+
+    def test_clock_moved_backwards(self):
+        """时钟回拨时不生成重复或变小的编号"""
+        clock = FakeClock(1000, 990, 995)
+        generator = SnowflakeIdGenerator(1, epoch=0, clock=clock)
+
+        first = generator.next_id()
+        second = generator.next_id()
+
+        self.assertGreater(second, first)
+
+    def test_invalid_worker_id(self):
+        with self.assertRaises(ValueError):
+            SnowflakeIdGenerator(1 << WORKER_ID_BITS)
+
+
+class WorkerIdLeaseTest(SimpleTestCase):
+    """订单编号worker id租约的测试"""
+
+    def make_lease(self, *results):
+        """lua脚本依次返回results"""
+        redis_conn = mock.Mock()
+        redis_conn.register_script.return_value = mock.Mock(side_effect=results)
+        return WorkerIdLease(redis_conn)
+
+    def test_no_free_worker_id(self):
+        """没有空闲的worker id时不复用其他进程的worker id"""
+        lease = self.make_lease(-1)
+
+        with self.assertRaises(RuntimeError):
+            lease.acquire()
+
+    def test_renew(self):
+        """超过有效期的1/3才续期，租约已被其他进程获取时返回False"""
+        lease = self.make_lease(5, 1, 0)
+        self.assertEqual(lease.acquire(), 5)
+
+        # 刚获取的租约不需要续期
+        self.assertTrue(lease.renew())
+        self.assertEqual(lease.redis_conn.register_script.call_count, 1)
+
+        lease.renewed_at -= constants.ORDER_ID_WORKER_LEASE
+        self.assertTrue(lease.renew())
+
+        lease.renewed_at -= constants.ORDER_ID_WORKER_LEASE
+        self.assertFalse(lease.renew())
+
+
+class OrderTestCase(TestCase):
+    """添加测试用的商品、用户和收货地址"""
+
+    def setUp(self):
+        category = GoodsCategory.objects.create(name='手机')
+        brand = Brand.objects.create(name='华为', logo='logo.png', first_letter='H')
+        spu = SPU.objects.create(name='华为手机', brand=brand, category1=category,
+                                 category2=category, category3=category)
+
+        self.skus = [
+            SKU.objects.create(name='华为手机%s' % i, caption='', spu=spu, category=category,
+                               price=1000 + i, cost_price=900, market_price=1100, stock=10)
+            for i in range(constants.ORDER_SUMMARY_SKUS_COUNT + 1)
+        ]
+
+        self.user = User.objects.create_user(username='orders', password='12345678', mobile='13000000000')
+
+        area = Area.objects.create(name='北京市')
+        self.address = Address.objects.create(user=self.user, title='家', receiver='张三', province=area,
+                                              city=area, district=area, place='xx', mobile='13000000000')
+
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        self.order_count = 0
+
+    def create_orders(self, count):
+        """添加count个订单，每个订单包含所有商品"""
+        for i in range(count):
+            self.order_count += 1
+            order = OrderInfo.objects.create(order_id='%019d' % self.order_count, user=self.user,
+                                             address=self.address, total_count=len(self.skus),
+                                             total_amount=Decimal(0), freight=Decimal(10))
+            OrderGoods.objects.bulk_create([OrderGoods(order=order, sku=sku, count=1, price=sku.price)
+                                            for sku in self.skus])
+
+    def order_ids(self):
+        """按照下单时间从新到旧返回用户的订单编号"""
+        return list(OrderInfo.objects.filter(user=self.user).order_by(
+            '-create_time', '-order_id').values_list('order_id', flat=True))
+
+
+class OrderListViewTest(OrderTestCase):
+    """用户订单列表的测试"""
+
+    def test_list_query_count(self):
+        """每页的查询数量固定: 订单 + 订单商品和商品"""
+        self.create_orders(1)
+        with CaptureQueriesContext(connection) as one_order:
+            self.client.get('/orders/', {'cursor': '', 'page_size': 5})
+
+        self.create_orders(9)
+        with self.assertNumQueries(2):
+            response = self.client.get('/orders/', {'cursor': '', 'page_size': 5})
+
+        self.assertEqual(len(one_order), 2)
+        self.assertEqual(len(response.data['results']), 5)
+        # 和redis中的订单摘要格式相同: 只返回前几个订单商品
+        self.assertEqual(len(response.data['results'][0]['skus']), constants.ORDER_SUMMARY_SKUS_COUNT)
+        self.assertEqual(response.data['results'][0]['sku_count'], len(self.skus))
+
+    def test_build_order_summary(self):
+        """加载订单摘要的查询数量固定，摘要和订单列表接口的数据格式相同，只保留前几个订单商品"""
+        self.create_orders(5)
+
+        with self.assertNumQueries(2):
+            orders = list(prefetch_order_goods(OrderInfo.objects.filter(user=self.user)))
+
+        with self.assertNumQueries(0):
+            summaries = [build_order_summary(order) for order in orders]
+
+        for order, summary in zip(orders, summaries):
+            data = OrderInfoSerializer(order).data
+            self.assertEqual(summary['order_id'], data['order_id'])
+            self.assertEqual(summary['status'], data['status'])
+            self.assertEqual(summary['total_amount'], data['total_amount'])
+            self.assertEqual(summary['skus'], data['skus'][:constants.ORDER_SUMMARY_SKUS_COUNT])
+            self.assertEqual(summary['sku_count'], len(self.skus))
+
+    def test_keyset_pagination(self):
+        """键集分页按照(下单时间, 订单编号)从新到旧返回所有订单，每页2次查询"""
+        self.create_orders(7)
+
+        order_ids = []
+        url = '/orders/?cursor=&page_size=3'
+        while url:
+            with self.assertNumQueries(2):
+                response = self.client.get(url)
+            order_ids.extend(order['order_id'] for order in response.data['results'])
+            url = response.data['next']
+
+        self.assertEqual(order_ids, self.order_ids())
+
+    def test_invalid_cursor(self):
+        """游标无法解析或者值的类型和字段不匹配时返回404"""
+        self.create_orders(1)
+
+        for data in (b'abc', b'[1]', b'["x", "1"]', b'[null, "1"]', b'["2018-01-01T00:00:00", null]'):
+            cursor = base64.urlsafe_b64encode(data).decode().rstrip('=')
+            response = self.client.get('/orders/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 404)
+
+
+class OrderSummaryListTest(OrderTestCase):
+    """redis中用户订单摘要的测试，使用redis的15号库，测试开始和结束时会清空该库"""
+
+    def setUp(self):
+        super().setUp()
+
+        connection_kwargs = get_redis_connection('default').connection_pool.connection_kwargs
+        self.redis_conn = redis.StrictRedis(**dict(connection_kwargs, db=15))
+        self.redis_conn.flushdb()
+        self.addCleanup(self.redis_conn.flushdb)
+
+        # 增量更新也使用15号库
+        patcher = mock.patch('orders.summary.get_redis_connection', return_value=self.redis_conn)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.summaries = OrderSummaryList(self.user.id, self.redis_conn)
+
+    def test_lazy_load_count_and_slice(self):
+        """第一次访问时从数据库加载，之后不再查询数据库，切片按照下单时间从新到旧返回"""
+        self.create_orders(5)
+
+        self.assertEqual(self.summaries.count(), 5)
+
+        order_ids = self.order_ids()
+        with self.assertNumQueries(0):
+            self.assertEqual(len(self.summaries), 5)
+            self.assertEqual([s['order_id'] for s in self.summaries[0:2]], order_ids[0:2])
+            self.assertEqual([s['order_id'] for s in self.summaries[2:10]], order_ids[2:])
+            self.assertEqual(self.summaries[10:12], [])
+
+    def test_add_and_update_status(self):
+        """已加载时增量添加订单和修改订单状态"""
+        self.create_orders(2)
+        self.summaries.load()
+
+        self.create_orders(1)
+        order = OrderInfo.objects.get(order_id=self.order_ids()[0])
+        add_order_summary(order)
+
+        update_order_summary_status(self.user.id, order.order_id, OrderInfo.ORDER_STATUS_ENUM['UNSEND'])
+
+        with self.assertNumQueries(0):
+            summaries = self.summaries[0:3]
+
+        self.assertEqual([s['order_id'] for s in summaries], self.order_ids())
+        self.assertEqual(summaries[0]['status'], OrderInfo.ORDER_STATUS_ENUM['UNSEND'])
+        self.assertEqual(summaries[0]['total_amount'], OrderInfoSerializer(order).data['total_amount'])
+
+    def test_update_before_load(self):
+        """未加载时增量更新不写入摘要，第一次访问时加载"""
+        self.create_orders(1)
+        order_id = self.order_ids()[0]
+
+        update_order_summary_status(self.user.id, order_id, OrderInfo.ORDER_STATUS_ENUM['UNSEND'])
+        self.assertFalse(self.redis_conn.exists('order_summary_%s' % self.user.id))
+
+        self.assertEqual([s['order_id'] for s in self.summaries[0:5]], [order_id])
+
+    def test_update_during_load(self):
+        """加载期间发生增量更新时重新加载，不覆盖加载期间的修改"""
+        self.create_orders(2)
+        order_id = self.order_ids()[0]
+
+        def update_once(queryset):
+            # 第一次加载查询数据库之后，订单被支付
+            if prefetch.call_count == 1:
+                OrderInfo.objects.filter(order_id=order_id).update(status=OrderInfo.ORDER_STATUS_ENUM['UNSEND'])
+                update_order_summary_status(self.user.id, order_id, OrderInfo.ORDER_STATUS_ENUM['UNSEND'])
+            return prefetch_order_goods(queryset)
+
+        with mock.patch('orders.summary.prefetch_order_goods', side_effect=update_once) as prefetch:
+            self.assertTrue(self.summaries.load())
+
+        self.assertEqual(prefetch.call_count, 2)
+        self.assertEqual(self.summaries[0:1][0]['status'], OrderInfo.ORDER_STATUS_ENUM['UNSEND'])
+
+    def test_load_conflict_falls_back_to_database(self):
+        """每次加载期间都发生增量更新时放弃加载，直接查询数据库"""
+        self.create_orders(3)
+
+        def update_always(queryset):
+            self.redis_conn.incr('order_summary_version_%s' % self.user.id)
+            return prefetch_order_goods(queryset)
+
+        with mock.patch('orders.summary.prefetch_order_goods', side_effect=update_always):
+            self.assertFalse(self.summaries.load())
+            self.assertEqual(len(self.summaries), 3)
+            summaries = self.summaries[1:3]
+
+        self.assertEqual([s['order_id'] for s in summaries], self.order_ids()[1:3])
+        self.assertFalse(self.redis_conn.exists('order_summary_loaded_%s' % self.user.id))
+        self.assertEqual(self.redis_conn.keys('order_summary_*_tmp_*'), [])
@@ -6,6 +6,7 @@ urlpatterns = [
     # url(r'^orders/$', views.OrdersView.as_view()),
     url(r'^orders/(?P<order_id>\d+)/uncommentgoods/$', views.UncommentOrderGoodsView.as_view()),  # 未评论商品
     url(r'^orders/(?P<order_id>\d+)/comments/$', views.OrderCommentView.as_view()),  # 商品评论
+    url(r'^orders/(?P<token>[0-9a-f]{32})/status/$', views.OrderStatusView.as_view()),  # 异步下单结果
 ]
 
 from rest_framework.routers import DefaultRouter
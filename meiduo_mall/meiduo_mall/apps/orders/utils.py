@@ -0,0 +1,186 @@
+# 订单编号生成器(Snowflake): 在进程内生成按时间递增、不重复的数字订单编号
+# 64位整数: 1位符号位(0) + 41位毫秒时间戳(相对ORDER_ID_EPOCH) + 10位worker id + 12位序号
+# 每个进程使用不同的worker id，同一毫秒内最多生成4096个编号
+import os
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from orders import constants
+
+WORKER_ID_BITS = 10
+SEQUENCE_BITS = 12
+
+MAX_WORKER_ID = (1 << WORKER_ID_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+# 订单编号的位数: 补齐到19位，字符串的大小顺序和数字的大小顺序一致
+ORDER_ID_LENGTH = 19
+
+# 进程分配worker id的计数器，从计数器的值开始查找空闲的worker id，使各个worker id被轮流使用
+WORKER_ID_COUNTER_KEY = 'order_id_worker_counter'
+
+# 获取空闲的worker id: 从计数器的值开始依次尝试SET NX，返回获取到的worker id，没有空闲的worker id时返回-1
+# KEYS[1]: 计数器
+# ARGV[1]: 进程的token ARGV[2]: 租约的有效期(s) ARGV[3]: worker id的数量
+LEASE_ACQUIRE_SCRIPT = """
+local start = redis.call('incr', KEYS[1])
+local count = tonumber(ARGV[3])
+for i = 0, count - 1 do
+    local worker_id = (start + i) % count
+    if redis.call('set', 'order_id_worker_' .. worker_id, ARGV[1], 'EX', ARGV[2], 'NX') then
+        return worker_id
+    end
+end
+return -1
+"""
+
+# 续期: 租约仍然属于当前进程时延长有效期
+# KEYS[1]: 租约key
+# ARGV[1]: 进程的token ARGV[2]: 租约的有效期(s)
+LEASE_RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    redis.call('expire', KEYS[1], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+
+def _lease_key(worker_id):
+    return 'order_id_worker_%s' % worker_id
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+class SnowflakeIdGenerator(object):
+    """
+    Snowflake编号生成器:
+    generator = SnowflakeIdGenerator(worker_id=1)
+    generator.next_id()
+    """
+    def __init__(self, worker_id, epoch=constants.ORDER_ID_EPOCH, clock=_now_ms):
+        if not 0 <= worker_id <= MAX_WORKER_ID:
+            raise ValueError('worker_id必须在0到%s之间' % MAX_WORKER_ID)
+
+        self.worker_id = worker_id
+        self.epoch = epoch
+        self.clock = clock
+
+        self.last_timestamp = -1
+        self.sequence = 0
+        self.lock = threading.Lock()
+
+    def _wait_until(self, timestamp):
+        """等待时钟到达timestamp毫秒"""
+        now = self.clock()
+        while now < timestamp:
+            time.sleep((timestamp - now) / 1000)
+            now = self.clock()
+        return now
+
+    def next_id(self):
+        with self.lock:
+            timestamp = self.clock()
+
+            # 时钟回拨时等待时钟追上上次生成编号的时间，不生成重复的编号
+            if timestamp < self.last_timestamp:
+                timestamp = self._wait_until(self.last_timestamp)
+
+            if timestamp == self.last_timestamp:
+                self.sequence = (self.sequence + 1) & MAX_SEQUENCE
+                # 同一毫秒内的序号用完，等待下一毫秒
+                if self.sequence == 0:
+                    timestamp = self._wait_until(self.last_timestamp + 1)
+            else:
+                self.sequence = 0
+
+            self.last_timestamp = timestamp
+
+            return ((timestamp - self.epoch) << (WORKER_ID_BITS + SEQUENCE_BITS)) | \
+                   (self.worker_id << SEQUENCE_BITS) | self.sequence
+
+
+class WorkerIdLease(object):
+    """
+    worker id租约: 通过redis为进程分配一个没有被其他进程使用的worker id
+    string: order_id_worker_<worker_id> 值为持有租约的进程的token，有效期为ORDER_ID_WORKER_LEASE
+    进程生成订单编号之前检查租约，超过有效期的1/3时续期，租约已经失效时需要重新分配
+    """
+    def __init__(self, redis_conn=None):
+        if redis_conn is None:
+            redis_conn = get_redis_connection('default')
+
+        self.redis_conn = redis_conn
+        self.token = uuid.uuid4().hex
+        self.worker_id = None
+        # 上一次获取或续期租约的时间(time.monotonic)
+        self.renewed_at = 0
+
+    def acquire(self):
+        """获取一个空闲的worker id，没有空闲的worker id时抛出异常"""
+        now = time.monotonic()
+
+        script = self.redis_conn.register_script(LEASE_ACQUIRE_SCRIPT)
+        worker_id = script(keys=[WORKER_ID_COUNTER_KEY],
+                           args=[self.token, constants.ORDER_ID_WORKER_LEASE, MAX_WORKER_ID + 1])
+        if worker_id == -1:
+            raise RuntimeError('没有空闲的订单编号worker id')
+
+        self.worker_id = worker_id
+        self.renewed_at = now
+        return worker_id
+
+    def renew(self):
+        """租约超过有效期的1/3时续期，返回租约是否仍然有效"""
+        now = time.monotonic()
+        if now - self.renewed_at < constants.ORDER_ID_WORKER_LEASE / 3:
+            return True
+
+        script = self.redis_conn.register_script(LEASE_RENEW_SCRIPT)
+        if script(keys=[_lease_key(self.worker_id)], args=[self.token, constants.ORDER_ID_WORKER_LEASE]) != 1:
+            # 租约已经过期(可能已被其他进程获取)
+            return False
+
+        self.renewed_at = now
+        return True
+
+
+_generator = None
+_generator_pid = None
+_lease = None
+_lock = threading.Lock()
+
+
+def _get_generator():
+    """
+    返回当前进程的订单编号生成器:
+    配置了ORDER_ID_WORKER_ID时直接使用(单进程部署)，否则通过redis租约为每个进程分配worker id
+    """
+    global _generator, _generator_pid, _lease
+
+    pid = os.getpid()
+    with _lock:
+        # fork出的子进程不能继续使用父进程的生成器和租约，租约失效时也要重新分配worker id
+        if _generator_pid != pid or (_lease is not None and not _lease.renew()):
+            worker_id = getattr(settings, 'ORDER_ID_WORKER_ID', None)
+            if worker_id is None:
+                _lease = WorkerIdLease()
+                worker_id = _lease.acquire()
+            else:
+                _lease = None
+
+            _generator = SnowflakeIdGenerator(worker_id)
+            _generator_pid = pid
+
+        return _generator
+
+
+def generate_order_id():
+    """生成订单编号(19位数字字符串)"""
+    return '%0*d' % (ORDER_ID_LENGTH, _get_generator().next_id())
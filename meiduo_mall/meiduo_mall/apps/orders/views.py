@@ -1,5 +1,8 @@
 from decimal import Decimal
-from django_redis import get_redis_connection
+
+from django.conf import settings
+from django.http import Http404
+from rest_framework import status
 from rest_framework.exceptions import PermissionDenied
 from rest_framework.generics import ListAPIView, CreateAPIView
 from rest_framework.mixins import CreateModelMixin, ListModelMixin
@@ -8,8 +11,12 @@ from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.viewsets import GenericViewSet
 
-from goods.models import SKU
+from cart.store import get_cart_store
+from goods.cache import get_sku_snapshots
+from meiduo_mall.utils.pagination import StandardResultOrKeysetPagination, KeysetPagination
+from orders.jobs import get_order_job
 from orders.models import OrderInfo, OrderGoods
+from orders.summary import OrderSummaryList, build_order_summary, prefetch_order_goods
 from orders.serializers import OrderSKUSerializer, OrderSerializer, OrderGoodsSerializer, SaveOrderCommentSerializer, \
     OrderInfoSerializer
 
@@ -26,40 +33,21 @@ class OrdersSettlementView(APIView):
         3. 将结算数据序列化并返回
         """
         # 1. 从redis中获取用户所要结算商品的sku_id和结算数量count
-        # redis链接
-        redis_conn = get_redis_connection('cart')
-
-        # 从redis set中获取用户购物车中被勾选的商品的sku_id
-        user = request.user
-        cart_selected_key = 'cart_selected_%s' % user.id
-
-        # Set(b'<sku_id>', b'<sku_id>', ...)
-        sku_ids = redis_conn.smembers(cart_selected_key)
-
-        # 从redis hash中获取用户购物车中所有商品的id和对应的数量count
-        cart_key = 'cart_%s' % user.id
-        # {
-        #     b'<sku_id>': b'<count>',
-        #     ...
-        # }
-        cart_redis = redis_conn.hgetall(cart_key)
-
-        # 转换数据
         # {
-        #     '<sku_id>': '<count>',
+        #     <sku_id>: <count>,
         #     ...
         # }
-        cart_dict = {}
-
-        for sku_id, count in cart_redis.items():
-            cart_dict[int(sku_id)] = int(count)
+        cart_dict = get_cart_store(request.user.id).get_selected()
 
-        # 2. 根据商品sku_id获取对应商品的数据&组织运费
-        skus = SKU.objects.filter(id__in=sku_ids)
+        # 2. 根据商品sku_id获取对应商品的快照数据&组织运费
+        snapshots = get_sku_snapshots(cart_dict.keys())
 
-        for sku in skus:
-            # 给sku对象增加属性count，保存该商品所要结算的数量count
-            sku.count = cart_dict[sku.id]
+        skus = []
+        for sku_id in sorted(snapshots):
+            # 给商品快照增加count，保存该商品所要结算的数量count
+            sku = dict(snapshots[sku_id])
+            sku['count'] = cart_dict[sku_id]
+            skus.append(sku)
 
         # 运费
         freight = Decimal(10.0)
@@ -79,6 +67,10 @@ class OrdersViewSet(CreateModelMixin,
                     ListModelMixin,
                     GenericViewSet):
     permission_classes = [IsAuthenticated]
+    # 默认使用页码分页，携带cursor参数时按照(下单时间, 订单编号)进行键集分页
+    pagination_class = StandardResultOrKeysetPagination
+    ordering = '-create_time'
+    ordering_fields = ('create_time',)
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -87,9 +79,65 @@ class OrdersViewSet(CreateModelMixin,
             return OrderInfoSerializer
 
     def get_queryset(self):
-        """返回当前登录用户的订单数据"""
+        """
+        返回当前登录用户的订单数据:
+        一次查询预取当前页所有订单的订单商品和商品，每页的查询数量和订单数量无关
+        """
         user = self.request.user
-        return OrderInfo.objects.filter(user=user).order_by('-create_time')
+        return prefetch_order_goods(OrderInfo.objects.filter(user=user).order_by('-create_time', '-order_id'))
+
+    # GET /orders/
+    def list(self, request, *args, **kwargs):
+        """
+        获取用户的订单列表:
+        页码分页时直接从redis中读取用户的订单摘要，不查询数据库
+        键集分页(携带cursor参数)时查询数据库，返回和redis中相同格式的订单摘要
+        """
+        if KeysetPagination.cursor_query_param in request.query_params:
+            page = self.paginate_queryset(self.get_queryset())
+            return self.get_paginated_response([build_order_summary(order) for order in page])
+
+        page = self.paginate_queryset(OrderSummaryList(request.user.id))
+        return self.get_paginated_response(page)
+
+    # POST /orders/
+    def create(self, request, *args, **kwargs):
+        """
+        下单:
+        同步下单时直接保存订单并返回订单编号
+        异步下单时校验参数并发出下单任务，返回下单任务的token，通过/orders/<token>/status/获取下单结果
+        """
+        if not settings.ORDER_ASYNC:
+            return super().create(request, *args, **kwargs)
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        token = serializer.enqueue()
+        return Response({'token': token}, status=status.HTTP_202_ACCEPTED)
+
+
+class OrderStatusView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    # GET /orders/(?P<token>[0-9a-f]{32})/status/
+    def get(self, request, token):
+        """
+        获取异步下单的结果:
+        status: queued(处理中) success(下单成功) failed(下单失败)
+        order_id: 下单成功时的订单编号 message: 下单失败的原因
+        """
+        job = get_order_job(token)
+
+        # 只能获取当前登录用户的下单任务
+        if job is None or job['user_id'] != str(request.user.id):
+            raise Http404
+
+        return Response({
+            'status': job['status'],
+            'order_id': job.get('order_id', ''),
+            'message': job.get('message', '')
+        })
 
 
 class UncommentOrderGoodsView(ListAPIView):
@@ -7,6 +7,7 @@ from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 
 from orders.models import OrderInfo
+from orders.summary import update_order_summary_status
 from alipay import AliPay
 
 
@@ -132,5 +133,8 @@ class PaymentStatusView(APIView):
         order.status = OrderInfo.ORDER_STATUS_ENUM['UNSEND'] # 待发货
         order.save()
 
+        # 更新用户订单摘要中的订单状态
+        update_order_summary_status(request.user.id, order_id, order.status)
+
         # 4. 返回应答，支付完成
         return Response({'trade_id': trade_id})
\ No newline at end of file
@@ -6,3 +6,6 @@ USER_ADDRESS_COUNTS_LIMIT = 20
 
 # 浏览记录保存最大数量
 USER_BROWSING_HISTORY_COUNTS_LIMIT = 5
+
+# 获取浏览记录时默认返回的商品数量
+USER_BROWSING_HISTORY_PAGE_SIZE = 3
@@ -0,0 +1,63 @@
+# 封装登录用户浏览记录的redis操作
+import time
+
+from django_redis import get_redis_connection
+
+from users import constants
+
+# 将旧版本的list浏览记录转换为zset，越靠左的商品(越近浏览)分数越大
+# 转换之后的分数都小于时间戳，排在新的浏览记录之后
+# KEYS[1]: 浏览记录key
+MIGRATE_SCRIPT = """
+if redis.call('type', KEYS[1]).ok == 'list' then
+    local sku_ids = redis.call('lrange', KEYS[1], 0, -1)
+    redis.call('del', KEYS[1])
+    for i, sku_id in ipairs(sku_ids) do
+        redis.call('zadd', KEYS[1], #sku_ids - i + 1, sku_id)
+    end
+end
+"""
+
+# 记录浏览: 添加(已存在时更新分数，即去重)并截取最近浏览的limit个商品
+# KEYS[1]: 浏览记录key
+# ARGV[1]: 浏览时间戳 ARGV[2]: 商品sku_id ARGV[3]: 保留的商品数量
+RECORD_SCRIPT = MIGRATE_SCRIPT + """
+redis.call('zadd', KEYS[1], ARGV[1], ARGV[2])
+redis.call('zremrangebyrank', KEYS[1], 0, -tonumber(ARGV[3]) - 1)
+return 1
+"""
+
+# 获取最近浏览的count个商品sku_id
+# KEYS[1]: 浏览记录key
+# ARGV[1]: 商品数量
+GET_SCRIPT = MIGRATE_SCRIPT + """
+return redis.call('zrevrange', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+"""
+
+
+class HistoryStore(object):
+    """
+    登录用户的redis浏览记录:
+    zset: history_<user_id> member为浏览的商品id，score为浏览时间戳(毫秒)
+    每个操作都通过一次lua脚本完成，去重、添加和截取是原子的
+    """
+    def __init__(self, user_id, redis_conn=None):
+        if redis_conn is None:
+            redis_conn = get_redis_connection('histories')
+
+        self.redis_conn = redis_conn
+        self.history_key = 'history_%s' % user_id
+
+    def record(self, sku_id, timestamp=None):
+        """记录用户浏览的商品，timestamp为浏览时间戳(毫秒)"""
+        if timestamp is None:
+            timestamp = int(time.time() * 1000)
+
+        script = self.redis_conn.register_script(RECORD_SCRIPT)
+        script(keys=[self.history_key],
+               args=[timestamp, sku_id, constants.USER_BROWSING_HISTORY_COUNTS_LIMIT])
+
+    def get_sku_ids(self, count=constants.USER_BROWSING_HISTORY_COUNTS_LIMIT):
+        """获取用户最近浏览的count个商品sku_id，最近浏览的在前: [<sku_id>, ...]"""
+        script = self.redis_conn.register_script(GET_SCRIPT)
+        return [int(sku_id) for sku_id in script(keys=[self.history_key], args=[count])]
@@ -1,11 +1,14 @@
 import re
+import time
 
+from django.conf import settings
 from django_redis import get_redis_connection
 from rest_framework import serializers
 from rest_framework.generics import CreateAPIView
 
-from goods.models import SKU
-from users import constants
+from goods.cache import get_sku_snapshot
+from goods.serializers import SKUSnapshotSerializer
+from users.histories import HistoryStore
 from users.models import User, Address
 
 
@@ -206,36 +209,37 @@ class AddressTitleSerializer(serializers.ModelSerializer):
         fields = ('title', )
 
 
+class HistorySKUSerializer(SKUSnapshotSerializer):
+    """浏览记录商品序列化器类"""
+    comments = serializers.IntegerField(label='评价数')
+
+
 class HistorySerializer(serializers.Serializer):
     """浏览记录序列化器类"""
     sku_id = serializers.IntegerField(label='sku商品id')
 
     def validate_sku_id(self, value):
-        # 校验商品是否存在
-        try:
-            sku = SKU.objects.get(id=value)
-        except SKU.DoesNotExist:
+        # 校验商品是否存在(优先从商品快照缓存中获取)
+        if get_sku_snapshot(value) is None:
             raise serializers.ValidationError('商品不存在')
 
         return value
 
     def create(self, validated_data):
-        # 在redis中保存登录用户的浏览记录
-        redis_conn = get_redis_connection('histories')
-
         # 获取登录用户
         user = self.context['request'].user
-
-        # 1. 去重：如果用户已经浏览过该商品，那么商品的id需要先从redis列表中移除
         sku_id = validated_data['sku_id']
-        history_key = 'history_%s' % user.id
-        redis_conn.lrem(history_key, 0, sku_id)
 
-        # 2. 左侧加入：把最新浏览的商品的id添加到列表的最左侧
-        redis_conn.lpush(history_key, sku_id)
+        # 浏览时间戳(毫秒)，作为浏览记录zset的分数
+        timestamp = int(time.time() * 1000)
 
-        # 3. 截取：只保留用户最新浏览的几个商品id
-        redis_conn.ltrim(history_key, 0, constants.USER_BROWSING_HISTORY_COUNTS_LIMIT - 1)
+        if settings.USER_HISTORY_ASYNC:
+            # 发出保存浏览记录的任务，不等待redis
+            from celery_tasks.histories.tasks import record_browse_history
+            record_browse_history.delay(user.id, sku_id, timestamp)
+        else:
+            # 去重、添加和截取在一次lua脚本中完成
+            HistoryStore(user.id).record(sku_id, timestamp)
 
         return validated_data
 
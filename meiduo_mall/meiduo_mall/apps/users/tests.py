@@ -1,3 +1,74 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from goods.cache import invalidate_sku_snapshots
+from goods.models import GoodsCategory, Brand, SPU, SKU
+from users import constants
+from users.models import User
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+})
+class BrowseHistoryViewTest(TestCase):
+    """浏览记录获取的测试"""
+
+    def setUp(self):
+        category = GoodsCategory.objects.create(name='手机')
+        brand = Brand.objects.create(name='华为', logo='logo.png', first_letter='H')
+        spu = SPU.objects.create(name='华为手机', brand=brand, category1=category,
+                                 category2=category, category3=category)
+
+        self.skus = [
+            SKU.objects.create(name='华为手机%s' % i, caption='', spu=spu, category=category,
+                               price=1000 + i, cost_price=900, market_price=1100, stock=10)
+            for i in range(constants.USER_BROWSING_HISTORY_COUNTS_LIMIT)
+        ]
+        # 第二个商品已下架
+        self.skus[1].is_launched = False
+        self.skus[1].save()
+
+        self.user = User.objects.create_user(username='history', password='12345678', mobile='13000000000')
+
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        # 浏览记录: 最近浏览的商品在前，包含一个已删除的商品
+        history = [sku.id for sku in reversed(self.skus)]
+        history.insert(1, 100000)
+
+        history_store = mock.Mock()
+        history_store.get_sku_ids.return_value = history[:constants.USER_BROWSING_HISTORY_COUNTS_LIMIT]
+
+        patcher = mock.patch('users.views.HistoryStore', return_value=history_store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # 清除商品数据缓存
+        invalidate_sku_snapshots([sku.id for sku in self.skus])
+
+    def test_get_histories_in_one_query(self):
+        """缓存未命中时只查询一次数据库，按照浏览顺序返回，跳过已删除和已下架的商品"""
+        with self.assertNumQueries(1):
+            response = self.client.get('/browse_histories/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([sku['id'] for sku in response.data],
+                         [self.skus[4].id, self.skus[3].id, self.skus[2].id])
+
+    def test_get_histories_page_size(self):
+        """page_size指定返回的商品数量，并且不超过浏览记录的最大数量"""
+        response = self.client.get('/browse_histories/', {'page_size': 2})
+        self.assertEqual(len(response.data), 2)
+
+        # 5条浏览记录中有一个已删除、一个已下架的商品
+        response = self.client.get('/browse_histories/', {'page_size': 100})
+        self.assertEqual(len(response.data), 3)
+
+        # 缓存命中时不再查询数据库
+        with self.assertNumQueries(0):
+            self.client.get('/browse_histories/')
@@ -1,6 +1,5 @@
 from datetime import datetime
 
-from django_redis import get_redis_connection
 from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.generics import CreateAPIView, RetrieveAPIView
@@ -13,12 +12,12 @@ from rest_framework_jwt.settings import api_settings
 from rest_framework_jwt.views import ObtainJSONWebToken, jwt_response_payload_handler
 
 from cart.utils import merge_cookie_cart_to_redis
-from goods.models import SKU
-from goods.serializers import SKUSerializer
+from goods.cache import get_sku_snapshots
 from users import constants
+from users.histories import HistoryStore
 from users.models import User
 from users.serializers import UserSerializer, UserDetailSerializer, EmailSerializer, AddressSerializer, \
-    AddressTitleSerializer, HistorySerializer
+    AddressTitleSerializer, HistorySerializer, HistorySKUSerializer
 
 
 # Create your views here.
@@ -324,30 +323,47 @@ class BrowseHistoryView(CreateAPIView):
 
     serializer_class = HistorySerializer
 
-    # GET /browse_histories/
+    # GET /browse_histories/?page_size=<返回的商品数量>
     def get(self, request):
         """
         浏览记录获取:
         1. 从redis中获取登录用户浏览的商品的sku_id
-        2. 根据商品的id获取对应商品的数据
+        2. 根据商品的id一次获取所有商品的数据，按照浏览顺序排列，跳过已删除或已下架的商品
         3. 将商品的数据序列化并返回
         """
+        # 获取返回的商品数量
+        try:
+            page_size = int(request.query_params.get('page_size', constants.USER_BROWSING_HISTORY_PAGE_SIZE))
+        except ValueError:
+            page_size = constants.USER_BROWSING_HISTORY_PAGE_SIZE
+
+        page_size = max(1, min(page_size, constants.USER_BROWSING_HISTORY_COUNTS_LIMIT))
+
         # 1. 从redis中获取登录用户浏览的商品的sku_id
-        redis_conn = get_redis_connection('histories')
+        # 获取全部浏览记录，跳过已删除或已下架的商品之后仍然可以返回page_size个商品
+        # [<sku_id>, <sku_id>, ...]
+        sku_ids = HistoryStore(request.user.id).get_sku_ids()
 
-        history_key = 'history_%s' % request.user.id
-        # [b'<sku_id>', b'<sku_id>', ...]
-        sku_ids = redis_conn.lrange(history_key, 0, 2)
+        # 2. 根据商品的id获取对应商品的快照数据
+        # 缓存未命中时：select * from tb_sku where id in (...);
+        snapshots = get_sku_snapshots(sku_ids)
 
-        # 2. 根据商品的id获取对应商品的数据
         skus = []
 
         for sku_id in sku_ids:
-            sku = SKU.objects.get(id=sku_id) # SKU.objects.get(id=b'1')
+            sku = snapshots.get(sku_id)
+
+            # 跳过已删除或已下架的商品
+            if sku is None or not sku['is_launched']:
+                continue
+
             skus.append(sku)
 
+            if len(skus) >= page_size:
+                break
+
         # 3. 将商品的数据序列化并返回
-        serializer = SKUSerializer(skus, many=True)
+        serializer = HistorySKUSerializer(skus, many=True)
         return Response(serializer.data)
 
     # POST /browse_histories/
@@ -189,6 +189,14 @@ CACHES = {
             "CLIENT_CLASS": "django_redis.client.DefaultClient",
         }
     },
+    # 存储商品热库存(下单时进行库存预占)
+    "stock": {
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": "redis://192.168.19.131:6379/6",
+        "OPTIONS": {
+            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+        }
+    },
 }
 # 设置将session信息存储到缓存中，上面已经将缓存改为了redis，所有session会存放到redis中
 SESSION_ENGINE = "django.contrib.sessions.backends.cache"
@@ -326,8 +334,10 @@ GENERATED_STATIC_HTML_FILES_DIR = os.path.join(os.path.dirname(os.path.dirname(B
 
 # 定时任务配置
 CRONJOBS = [
-    # 每1分钟执行一次生成主页静态文件
-    ('*/1 * * * *', 'contents.crons.generate_static_index_html', '>> ' + os.path.dirname(BASE_DIR) + '/logs/crontab.log')
+    # 每5分钟执行一次redis热库存与数据库库存的对账
+    ('*/5 * * * *', 'goods.crons.reconcile_sku_stock', '>> ' + os.path.dirname(BASE_DIR) + '/logs/crontab.log'),
+    # 每30分钟执行一次分类商品列表和热销排行的对账
+    ('*/30 * * * *', 'goods.crons.reconcile_sku_listing', '>> ' + os.path.dirname(BASE_DIR) + '/logs/crontab.log'),
 ]
 
 # 解决crontab中文问题
@@ -356,3 +366,24 @@ ALIPAY_DEBUG = True # 是否使用沙箱环境
 
 # 指定收集静态文件的保存目录
 # STATIC_ROOT = os.path.join(os.path.dirname(os.path.dirname(BASE_DIR)), 'front_page/static')
+
+# 下单时扣减商品库存的策略
+# orders.inventory.OptimisticStrategy: 数据库条件更新(乐观锁)
+# orders.inventory.PessimisticStrategy: select ... for update(悲观锁)
+# orders.inventory.ReservationStrategy: redis热库存预占，异步回写数据库
+ORDER_INVENTORY_STRATEGY = 'orders.inventory.ReservationStrategy'
+
+# 是否异步下单(开启时下单请求只发出下单任务，由orders队列的worker保存订单)
+ORDER_ASYNC = False
+
+# 生成订单编号的worker id(0~1023)，为None时由redis以租约的方式为每个进程分配空闲的worker id
+# 多台服务器或多个进程共用同一个配置值时必须保持为None，否则订单编号可能重复
+ORDER_ID_WORKER_ID = None
+
+# 登录用户购物车记录的存储类
+# cart.store.CartStore: hash(cart_<id>) + set(cart_selected_<id>)
+# cart.store.PackedCartStore: 单hash(cart_packed_<id>)，value = count * 2 + selected
+CART_STORE_CLASS = 'cart.store.CartStore'
+
+# 是否通过celery异步保存浏览记录(开启时商品详情页的浏览请求不需要等待redis)
+USER_HISTORY_ASYNC = False
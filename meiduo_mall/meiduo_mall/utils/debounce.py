@@ -0,0 +1,15 @@
+from django.core.cache import cache
+
+
+def debounce_task(task, key, countdown, args=()):
+    """
+    防抖发出celery任务: countdown秒内以相同key多次调用时只发出一次任务，
+    任务延迟countdown秒执行，执行时可以读取到这段时间内的所有修改
+    返回True表示发出了任务
+    """
+    # cache.add: key不存在时才设置(redis: SET NX EX)
+    if not cache.add('debounce_%s' % key, 1, countdown):
+        return False
+
+    task.apply_async(args=args, countdown=countdown)
+    return True
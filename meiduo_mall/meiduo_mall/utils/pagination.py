@@ -1,4 +1,14 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import datetime
+import decimal
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 # ?page=<页码>&page_size=<页容量>
@@ -9,3 +19,137 @@ class StandardResultPagination(PageNumberPagination):
     max_page_size = 20
     # 获取分页数据时，指定页容量参数的名称
     page_size_query_param = 'page_size'
+
+
+# ?cursor=<游标>&page_size=<页容量>&ordering=<排序字段>
+class KeysetPagination(BasePagination):
+    """
+    键集(seek)分页: 按照(排序字段, 主键)定位下一页的起始位置，不使用COUNT和OFFSET，
+    翻页的耗时和页码无关，需要(过滤字段, 排序字段, 主键)的联合索引
+    游标: base64url(json([<排序字段的值>, <主键>]))，第一页不传cursor的值
+    排序字段: 视图的ordering_fields中的字段，默认使用视图的ordering
+    """
+    # 默认页容量
+    page_size = 6
+    # 最大页容量
+    max_page_size = 20
+    # 获取分页数据时，指定页容量参数的名称
+    page_size_query_param = 'page_size'
+    # 游标参数的名称
+    cursor_query_param = 'cursor'
+    # 排序参数的名称，和OrderingFilter保持一致
+    ordering_param = 'ordering'
+
+    invalid_cursor_message = '无效的cursor'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_ordering(self, request, view):
+        """返回(排序字段, 是否降序)"""
+        ordering = request.query_params.get(self.ordering_param)
+        if not ordering or ordering.lstrip('-') not in getattr(view, 'ordering_fields', ()):
+            ordering = getattr(view, 'ordering', None) or '-id'
+
+        return ordering.lstrip('-'), ordering.startswith('-')
+
+    def decode_cursor(self, request, model):
+        """返回(排序字段的值, 主键)，第一页返回None"""
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+
+        try:
+            value, pk = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode())
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if value is None or pk is None:
+            raise NotFound(self.invalid_cursor_message)
+
+        # 按照模型字段的类型转换游标中的值(整数id或字符串订单编号)，类型不对时数据库不能使用索引，
+        # 无法转换的值(如整数主键传入'abc')在查询时会抛出异常
+        try:
+            value = model._meta.get_field(self.field).to_python(value)
+            pk = model._meta.pk.to_python(pk)
+        except (ValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+        return value, pk
+
+    def encode_cursor(self, obj):
+        value = getattr(obj, self.field)
+        if isinstance(value, (datetime.datetime, datetime.date)):
+            value = value.isoformat()
+        elif isinstance(value, decimal.Decimal):
+            value = str(value)
+
+        data = json.dumps([value, obj.pk], separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.field, self.desc = self.get_ordering(request, view)
+        page_size = self.get_page_size(request)
+
+        # 按照(排序字段, id)排序，id保证排序结果唯一
+        if self.desc:
+            queryset = queryset.order_by('-' + self.field, '-pk')
+        else:
+            queryset = queryset.order_by(self.field, 'pk')
+
+        cursor = self.decode_cursor(request, queryset.model)
+        if cursor is not None:
+            value, pk = cursor
+            # 降序: field < value or (field = value and id < pk)
+            # 升序: field > value or (field = value and id > pk)
+            lookup = 'lt' if self.desc else 'gt'
+            queryset = queryset.filter(
+                Q(**{'%s__%s' % (self.field, lookup): value}) |
+                Q(**{self.field: value, 'pk__%s' % lookup: pk})
+            )
+
+        # 多查询一条记录，用于判断是否有下一页
+        results = list(queryset[:page_size + 1])
+        self.has_next = len(results) > page_size
+        self.page = results[:page_size]
+
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data
+        })
+
+
+# ?page=<页码>&page_size=<页容量> 或 ?cursor=<游标>&page_size=<页容量>
+class StandardResultOrKeysetPagination(StandardResultPagination):
+    """默认使用页码分页，请求中携带cursor参数(第一页的值为空)时使用键集分页"""
+    keyset_pagination_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.keyset_pagination_class.cursor_query_param in request.query_params:
+            self.keyset = self.keyset_pagination_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+
+        return super().get_paginated_response(data)
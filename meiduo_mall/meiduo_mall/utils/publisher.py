@@ -0,0 +1,106 @@
+# 静态文件发布: 将生成的静态页面保存到GENERATED_STATIC_HTML_FILES_DIR
+# 1. 先写入同一目录下的临时文件，再通过os.replace替换原文件，nginx不会读取到写入了一半的文件
+# 2. 在redis中保存每个文件内容的摘要(manifest)，内容未变化时跳过写入
+# 3. 同时生成预压缩的.gz和.br文件，供nginx的gzip_static和brotli_static直接使用
+import gzip
+import hashlib
+import io
+import os
+import tempfile
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+try:
+    import brotli
+except ImportError:
+    # 未安装brotli时不生成.br文件，并删除之前生成的.br文件
+    brotli = None
+
+# 静态文件内容摘要的redis hash: {<相对路径>: <sha1>}
+MANIFEST_KEY = 'static_files_manifest'
+
+
+def _atomic_write(path, content):
+    """先写入同一目录下的临时文件，再替换原文件"""
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        # mkstemp创建的文件权限为0600，和普通文件保持一致
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except Exception:
+        os.remove(temp_path)
+        raise
+
+
+def _gzip_compress(content):
+    """gzip压缩，mtime=0: 相同内容的压缩结果完全相同"""
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=9, mtime=0) as f:
+        f.write(content)
+    return buf.getvalue()
+
+
+class StaticFilePublisher(object):
+    """
+    静态文件发布器，统计发布过程中写入和跳过的文件数量和字节数:
+    publisher = StaticFilePublisher()
+    publisher.publish('goods/1.html', html)
+    """
+    def __init__(self, root=None, redis_conn=None):
+        if root is None:
+            root = settings.GENERATED_STATIC_HTML_FILES_DIR
+
+        if redis_conn is None:
+            redis_conn = get_redis_connection('default')
+
+        self.root = root
+        self.redis_conn = redis_conn
+
+        # 写入的文件数量和字节数(不包括压缩文件)
+        self.written_files = 0
+        self.written_bytes = 0
+        # 内容未变化跳过的文件数量和字节数
+        self.skipped_files = 0
+        self.skipped_bytes = 0
+
+    def publish(self, name, content):
+        """
+        发布静态文件，name为相对于root的路径:
+        返回True表示写入了文件，False表示内容未变化
+        """
+        if isinstance(content, str):
+            content = content.encode('utf8')
+
+        path = os.path.join(self.root, name)
+        digest = hashlib.sha1(content).hexdigest()
+
+        # 内容摘要和manifest中的相同并且文件存在时，跳过写入
+        saved_digest = self.redis_conn.hget(MANIFEST_KEY, name)
+        if saved_digest == digest.encode() and os.path.exists(path):
+            self.skipped_files += 1
+            self.skipped_bytes += len(content)
+            return False
+
+        # 生成预压缩文件
+        _atomic_write(path + '.gz', _gzip_compress(content))
+        if brotli is not None:
+            _atomic_write(path + '.br', brotli.compress(content))
+        elif os.path.exists(path + '.br'):
+            # 之前生成的.br文件是旧的内容，保留时nginx的brotli_static会返回旧页面
+            os.remove(path + '.br')
+
+        _atomic_write(path, content)
+
+        self.redis_conn.hset(MANIFEST_KEY, name, digest)
+
+        self.written_files += 1
+        self.written_bytes += len(content)
+        return True
+
+    def stats(self):
+        """返回发布统计信息"""
+        return 'written: %s files %s bytes, skipped: %s files %s bytes' % (
+            self.written_files, self.written_bytes, self.skipped_files, self.skipped_bytes)
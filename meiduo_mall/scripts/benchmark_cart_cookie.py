@@ -0,0 +1,62 @@
+#! /usr/bin/env python
+# 对比cookie购物车数据新旧两种编码格式的大小和编解码耗时
+# 用法: python benchmark_cart_cookie.py [重复次数]
+import base64
+import pickle
+import random
+import sys
+import timeit
+
+# 将apps目录添加到当前py程序搜索包目录列表中
+sys.path.insert(0, '../meiduo_mall/apps')
+
+from cart import codec
+
+
+def legacy_dumps(cart_dict):
+    """旧版本格式: base64(pickle(cart_dict))"""
+    return base64.b64encode(pickle.dumps(cart_dict)).decode()
+
+
+def legacy_loads(cookie_cart):
+    return pickle.loads(base64.b64decode(cookie_cart.encode()))
+
+
+def make_cart(lines):
+    """随机生成包含lines个商品的购物车数据"""
+    sku_ids = random.sample(range(1, 100000), lines)
+    return {
+        sku_id: {
+            'count': random.randint(1, 5),
+            'selected': random.random() < 0.7
+        }
+        for sku_id in sku_ids
+    }
+
+
+if __name__ == "__main__":
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    random.seed(0)
+
+    print('%6s | %12s %12s | %14s %14s | %14s %14s' % (
+        'lines', 'pickle(B)', 'codec(B)',
+        'pickle enc(us)', 'codec enc(us)',
+        'pickle dec(us)', 'codec dec(us)'))
+
+    for lines in (1, 5, 10, 30, 100):
+        cart_dict = make_cart(lines)
+
+        legacy_data = legacy_dumps(cart_dict)
+        codec_data = codec.dumps(cart_dict)
+        assert codec.loads(codec_data) == cart_dict
+        assert codec.loads(legacy_data) == cart_dict
+
+        times = [
+            timeit.timeit(lambda: legacy_dumps(cart_dict), number=number),
+            timeit.timeit(lambda: codec.dumps(cart_dict), number=number),
+            timeit.timeit(lambda: legacy_loads(legacy_data), number=number),
+            timeit.timeit(lambda: codec.loads(codec_data), number=number),
+        ]
+
+        print('%6d | %12d %12d | %14.2f %14.2f | %14.2f %14.2f' % (
+            (lines, len(legacy_data), len(codec_data)) + tuple(t / number * 1e6 for t in times)))
@@ -0,0 +1,79 @@
+#! /usr/bin/env python
+# 对比登录用户购物车记录两种redis存储格式的内存占用和操作耗时
+# 用法: python benchmark_cart_layout.py [redis地址] [用户数量] [每个用户的商品数量]
+# 默认使用本地redis的15号库，测试开始和结束时会清空该库
+import random
+import sys
+import time
+
+import redis
+
+# 将apps目录添加到当前py程序搜索包目录列表中
+sys.path.insert(0, '../meiduo_mall/apps')
+
+from cart.store import CartStore, PackedCartStore
+
+
+def memory_usage(redis_conn, pattern):
+    """统计匹配pattern的所有key占用的内存(字节)"""
+    total = 0
+    keys = 0
+    for key in redis_conn.scan_iter(match=pattern, count=1000):
+        total += redis_conn.execute_command('MEMORY', 'USAGE', key) or 0
+        keys += 1
+    return keys, total
+
+
+def timeit(func, number):
+    """返回func的平均耗时(us)"""
+    start = time.perf_counter()
+    for i in range(number):
+        func(i)
+    return (time.perf_counter() - start) / number * 1e6
+
+
+def benchmark(redis_conn, store_class, pattern, users, lines):
+    redis_conn.flushdb()
+    random.seed(0)
+
+    stores = [store_class(user_id, redis_conn) for user_id in range(1, users + 1)]
+
+    # 初始化每个用户的购物车
+    for store in stores:
+        items = [(sku_id, random.randint(1, 5), random.random() < 0.7)
+                 for sku_id in random.sample(range(1, 100000), lines)]
+        store.set_many(items)
+
+    keys, memory = memory_usage(redis_conn, pattern)
+    number = min(users, 2000)
+
+    return {
+        'keys': keys,
+        'memory': memory,
+        'get_cart': timeit(lambda i: stores[i].get_cart(), number),
+        'add': timeit(lambda i: stores[i].add(random.randint(1, 100000), 1, True), number),
+        'set': timeit(lambda i: stores[i].set(random.randint(1, 100000), 2, False), number),
+        'select_all': timeit(lambda i: stores[i].select_all(i % 2 == 0), number),
+    }
+
+
+if __name__ == "__main__":
+    url = sys.argv[1] if len(sys.argv) > 1 else 'redis://127.0.0.1:6379/15'
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    lines = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+
+    redis_conn = redis.StrictRedis.from_url(url)
+
+    results = [
+        ('hash+set', benchmark(redis_conn, CartStore, 'cart_*', users, lines)),
+        ('packed hash', benchmark(redis_conn, PackedCartStore, 'cart_packed_*', users, lines)),
+    ]
+    redis_conn.flushdb()
+
+    print('users: %s lines: %s' % (users, lines))
+    print('%12s | %8s %12s %10s | %12s %10s %10s %15s' % (
+        'layout', 'keys', 'memory(B)', 'B/user', 'get_cart(us)', 'add(us)', 'set(us)', 'select_all(us)'))
+    for name, res in results:
+        print('%12s | %8d %12d %10.1f | %12.1f %10.1f %10.1f %15.1f' % (
+            name, res['keys'], res['memory'], res['memory'] / users,
+            res['get_cart'], res['add'], res['set'], res['select_all']))
@@ -0,0 +1,163 @@
+#! /usr/bin/env python
+# 对比下单时各个库存扣减策略在热门商品并发抢购时的表现
+# 用法: python benchmark_inventory_strategy.py [买家数量] [每个买家的下单次数] [热门商品数量] [每个商品的库存]
+# N个买家线程同时对M个热门商品下单，输出每个策略的吞吐量、p99延迟、重试率和超卖数量
+# 使用第一个有收货地址的用户下单，测试结束之后删除测试订单，恢复商品的库存和销量
+import os
+
+import sys
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+# 将scripts目录的上级目录添加到当前py程序搜索包目录列表中
+sys.path.insert(0, '../')
+
+# 设置django运行所依赖环境变量
+if not os.environ.get('DJANGO_SETTINGS_MODULE'):
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "meiduo_mall.settings.dev")
+
+# 让django进行初始化
+import django
+django.setup()
+
+from django.db import connection
+from django.db.models import Sum
+from rest_framework import serializers
+
+from celery_tasks.stock.tasks import write_back_sku_stock
+from goods.cache import invalidate_sku_snapshots
+from goods.models import SKU
+from goods.stock import StockReservation, SKU_STOCK_PENDING_KEY
+from orders.inventory import OptimisticStrategy, PessimisticStrategy, ReservationStrategy
+from orders.models import OrderInfo, OrderGoods
+from orders.serializers import OrderSerializer
+from orders.summary import OrderSummaryList
+from users.models import Address
+
+
+class BenchmarkReservationStrategy(ReservationStrategy):
+    """库存回写不发送到celery队列，记录下来在测试结束时同步回写"""
+    pending = []
+    lock = threading.Lock()
+
+    def write_back(self, reservation_id, cart):
+        with self.lock:
+            self.pending.append((reservation_id, list(cart.items())))
+
+
+STRATEGIES = (OptimisticStrategy, PessimisticStrategy, BenchmarkReservationStrategy)
+
+
+def reload_hot_stock(sku_ids):
+    """清除商品的待回写数量，使用数据库库存重新加载redis热库存"""
+    reservation = StockReservation()
+    reservation.redis_conn.hdel(SKU_STOCK_PENDING_KEY, *sku_ids)
+    reservation.load(sku_ids, overwrite=True)
+
+    invalidate_sku_snapshots(sku_ids)
+
+
+def reset_stock(sku_ids, stock):
+    """将热门商品的数据库库存和redis热库存都设置为stock"""
+    SKU.objects.filter(id__in=sku_ids).update(stock=stock)
+    reload_hot_stock(sku_ids)
+
+
+def buyer(strategy_class, address, sku_ids, orders):
+    """
+    一个买家连续下单orders次，每次购买一个随机的热门商品
+    返回每次下单的结果 [(耗时, 是否成功, 重试次数, 订单编号), ...]
+    """
+    results = []
+    serializer = OrderSerializer()
+    try:
+        for i in range(orders):
+            strategy = strategy_class()
+            cart = {random.choice(sku_ids): 1}
+
+            start = time.perf_counter()
+            try:
+                order = serializer.place_order(address.user, address, OrderInfo.PAY_METHODS_ENUM['ALIPAY'],
+                                               cart, strategy)
+                order_id = order.order_id
+            except serializers.ValidationError:
+                # 商品库存不足
+                order_id = None
+
+            results.append((time.perf_counter() - start, order_id is not None, strategy.retries, order_id))
+    finally:
+        # 每个线程使用单独的数据库连接，结束时关闭
+        connection.close()
+
+    return results
+
+
+def run(strategy_class, address, skus, buyers, orders, stock):
+    """使用一个策略进行测试，返回统计结果和测试订单的编号"""
+    sku_ids = [sku.id for sku in skus]
+    reset_stock(sku_ids, stock)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=buyers) as executor:
+        futures = [executor.submit(buyer, strategy_class, address, sku_ids, orders) for i in range(buyers)]
+        results = [result for future in futures for result in future.result()]
+    elapsed = time.perf_counter() - start
+
+    # 同步回写redis热库存预占的库存
+    if strategy_class is BenchmarkReservationStrategy:
+        for reservation_id, sku_counts in BenchmarkReservationStrategy.pending:
+            write_back_sku_stock.apply(args=(reservation_id, sku_counts))
+        BenchmarkReservationStrategy.pending.clear()
+
+    order_ids = [order_id for _, ok, _, order_id in results if ok]
+    latencies = sorted(latency for latency, _, _, _ in results)
+    retries = sum(retry for _, _, retry, _ in results)
+
+    # 超卖数量: 卖出的数量超过库存的部分 + 数据库中库存为负数的部分
+    sold = dict(OrderGoods.objects.filter(order_id__in=order_ids).values_list('sku_id').annotate(Sum('count')))
+    oversell = 0
+    for sku in SKU.objects.filter(id__in=sku_ids):
+        oversell += max(sold.get(sku.id, 0) - stock, 0) + max(-sku.stock, 0)
+
+    return {
+        'throughput': len(order_ids) / elapsed,
+        'p99': latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000,
+        'retry_rate': retries / (len(results) + retries),
+        'success': len(order_ids),
+        'oversell': oversell,
+    }, order_ids
+
+
+if __name__ == "__main__":
+    buyers = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    orders = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    hot_skus = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+    stock = int(sys.argv[4]) if len(sys.argv) > 4 else 100
+
+    address = Address.objects.filter(is_delete=False).select_related('user').first()
+    skus = list(SKU.objects.filter(is_launched=True).order_by('id')[:hot_skus])
+
+    # 保存热门商品原来的库存和销量，测试结束之后恢复
+    origin = {sku.id: (sku.stock, sku.sales) for sku in skus}
+
+    print('buyers: %s orders: %s hot skus: %s stock: %s' % (buyers, orders, hot_skus, stock))
+    print('%22s | %12s %10s %8s %8s %8s' % ('strategy', 'orders/s', 'p99(ms)', 'retry', 'success', 'oversell'))
+
+    all_order_ids = []
+    try:
+        for strategy_class in STRATEGIES:
+            stats, order_ids = run(strategy_class, address, skus, buyers, orders, stock)
+            all_order_ids.extend(order_ids)
+
+            print('%22s | %12.1f %10.2f %7.2f%% %8d %8d' % (
+                strategy_class.__name__, stats['throughput'], stats['p99'], stats['retry_rate'] * 100,
+                stats['success'], stats['oversell']))
+    finally:
+        # 删除测试订单，恢复商品的库存和销量
+        OrderInfo.objects.filter(order_id__in=all_order_ids).delete()
+        for sku_id, (sku_stock, sku_sales) in origin.items():
+            SKU.objects.filter(id=sku_id).update(stock=sku_stock, sales=sku_sales)
+        reload_hot_stock(list(origin.keys()))
+        # 重新加载用户的订单摘要，去掉测试订单
+        OrderSummaryList(address.user_id).load()
@@ -0,0 +1,39 @@
+#! /usr/bin/env python
+# 测试订单编号生成器(Snowflake)的生成速度
+# 用法: python benchmark_order_id.py [进程数量] [每个进程生成的编号数量]
+# 每个进程使用不同的worker id，输出每个进程和所有进程合计每秒生成的编号数量
+import multiprocessing
+import sys
+import time
+
+# 将apps目录添加到当前py程序搜索包目录列表中
+sys.path.insert(0, '../meiduo_mall/apps')
+
+from orders.utils import SnowflakeIdGenerator
+
+
+def generate_ids(args):
+    """使用worker_id生成count个编号，返回(编号数量, 耗时)"""
+    worker_id, count = args
+    generator = SnowflakeIdGenerator(worker_id)
+
+    start = time.perf_counter()
+    ids = [generator.next_id() for _ in range(count)]
+    return len(set(ids)), time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+
+    print('processes: %s ids per process: %s' % (processes, count))
+
+    start = time.perf_counter()
+    with multiprocessing.Pool(processes) as pool:
+        results = pool.map(generate_ids, [(worker_id, count) for worker_id in range(processes)])
+    elapsed = time.perf_counter() - start
+
+    for worker_id, (unique, process_elapsed) in enumerate(results):
+        print('worker %4d | %12.1f ids/s unique: %s' % (worker_id, unique / process_elapsed, unique == count))
+
+    print('total       | %12.1f ids/s' % (sum(unique for unique, _ in results) / elapsed))
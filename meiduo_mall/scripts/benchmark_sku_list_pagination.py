@@ -0,0 +1,78 @@
+#! /usr/bin/env python
+# 对比分类商品列表页码分页(COUNT + OFFSET)和键集分页在不同页码的查询耗时
+# 用法: python benchmark_sku_list_pagination.py <分类id> [排序字段] [页容量]
+# 排序字段默认为-create_time，页码分页的耗时随页码线性增长，键集分页的耗时基本不变
+import os
+
+import sys
+import time
+# 将scripts目录的上级目录添加到当前py程序搜索包目录列表中
+sys.path.insert(0, '../')
+
+# 设置django运行所依赖环境变量
+if not os.environ.get('DJANGO_SETTINGS_MODULE'):
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "meiduo_mall.settings.dev")
+
+# 让django进行初始化
+import django
+django.setup()
+
+from django.db.models import Q
+
+from goods.models import SKU
+
+# 测试的页码
+PAGES = (1, 10, 100, 1000, 5000)
+
+
+def timeit(func, number=5):
+    """返回func的平均耗时(ms)"""
+    start = time.perf_counter()
+    for i in range(number):
+        func()
+    return (time.perf_counter() - start) / number * 1000
+
+
+def offset_page(queryset, page, page_size):
+    """页码分页: COUNT(*) + LIMIT OFFSET"""
+    queryset.count()
+    return list(queryset[(page - 1) * page_size:page * page_size])
+
+
+def keyset_page(queryset, field, desc, cursor, page_size):
+    """键集分页: WHERE (field, id) < (value, id) LIMIT"""
+    if cursor is not None:
+        value, pk = cursor
+        lookup = 'lt' if desc else 'gt'
+        queryset = queryset.filter(Q(**{'%s__%s' % (field, lookup): value}) |
+                                   Q(**{field: value, 'id__%s' % lookup: pk}))
+    return list(queryset[:page_size + 1])
+
+
+if __name__ == "__main__":
+    category_id = int(sys.argv[1])
+    ordering = sys.argv[2] if len(sys.argv) > 2 else '-create_time'
+    page_size = int(sys.argv[3]) if len(sys.argv) > 3 else 6
+
+    field, desc = ordering.lstrip('-'), ordering.startswith('-')
+    queryset = SKU.objects.filter(category_id=category_id, is_launched=True).order_by(
+        ordering, '-id' if desc else 'id')
+
+    total = queryset.count()
+    print('category: %s skus: %s ordering: %s page_size: %s' % (category_id, total, ordering, page_size))
+    print('%8s | %12s %12s' % ('page', 'offset(ms)', 'keyset(ms)'))
+
+    for page in PAGES:
+        if (page - 1) * page_size >= total:
+            break
+
+        # 键集分页的游标: 上一页最后一条记录的(排序字段的值, id)
+        cursor = None
+        if page > 1:
+            last = queryset.values_list(field, 'id')[(page - 1) * page_size - 1]
+            cursor = last
+
+        print('%8d | %12.2f %12.2f' % (
+            page,
+            timeit(lambda: offset_page(queryset, page, page_size)),
+            timeit(lambda: keyset_page(queryset, field, desc, cursor, page_size))))
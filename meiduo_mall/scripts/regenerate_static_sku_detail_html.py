@@ -1,4 +1,10 @@
 #! /usr/bin/env python
+# 增量生成所有商品的静态详情页面(单进程)
+# 用法: python regenerate_static_sku_detail_html.py [--full]
+# 每个页面所依赖的数据(SKU、SPU、规格、图片、商品分类)计算出指纹保存在redis中，
+# 只有指纹发生变化或页面文件不存在时才重新渲染，渲染结果和已有文件相同时不再写入
+# --full: 忽略已保存的指纹，重新渲染所有页面
+# 多进程生成: python manage.py build_static_sku_detail_html
 import os
 
 import sys
@@ -13,117 +19,41 @@ if not os.environ.get('DJANGO_SETTINGS_MODULE'):
 import django
 django.setup()
 
-from django.conf import settings
-from django.template import loader
+from goods.utils import get_categories, get_stale_sku_detail_fingerprints, save_sku_detail_fingerprints, \
+    save_sku_detail_html, skipped_sku_detail_fingerprint
+from meiduo_mall.utils.publisher import StaticFilePublisher
 
-from goods.models import SKU
-from goods.utils import get_categories
 
-
-def generate_static_sku_detail_html(sku_id):
-    """生成sku_id对应商品的静态详情页面"""
-    # 1. 查数据
-    # 商品分类菜单
+def regenerate_static_sku_detail_html(full=False):
+    """增量生成所有商品的静态详情页面，返回(渲染数量, 静态文件发布器)"""
+    # 商品分类菜单: 所有页面共用，只获取一次
     categories = get_categories()
 
-    # 获取当前sku的信息
-    sku = SKU.objects.get(id=sku_id)
-    # 获取和商品关联的图片
-    sku.images = sku.skuimage_set.all()
-
-    # 面包屑导航信息中的频道
-    # 获取和sku对象关联SPU对象
-    goods = sku.spu
-    # goods.category1：获取和SPU对象关联的一级分类
-    # category1.goodschannel：获取和一级分类关联的频道对象
-    goods.channel = goods.category1.goodschannel
-
-    # 构建当前商品的规格键
-    # sku_key = [规格1参数id， 规格2参数id， 规格3参数id, ...]
-    sku_specs = sku.skuspecification_set.order_by('spec_id')
-    sku_key = []
-    for spec in sku_specs:
-        sku_key.append(spec.option.id)
-
-    # 获取当前商品的所有SKU
-    skus = goods.sku_set.all()
+    # 需要重新生成页面的商品
+    stale = get_stale_sku_detail_fingerprints(categories, full)
 
-    # 构建不同规格参数（选项）的sku字典
-    # spec_sku_map = {
-    #     (规格1参数id, 规格2参数id, 规格3参数id, ...): sku_id,
-    #     (规格1参数id, 规格2参数id, 规格3参数id, ...): sku_id,
-    #     ...
-    # }
-    spec_sku_map = {}
-    for s in skus:
-        # 获取sku的规格参数
-        s_specs = s.skuspecification_set.order_by('spec_id')
-        # 用于形成规格参数-sku字典的键
-        key = []
-        for spec in s_specs:
-            key.append(spec.option.id)
-        # 向规格参数-sku字典添加记录
-        spec_sku_map[tuple(key)] = s.id
+    publisher = StaticFilePublisher()
+    rendered = 0
+    done = {}
 
-    # 获取当前商品的规格信息
-    # specs = [
-    #    {
-    #        'name': '屏幕尺寸',
-    #        'options': [
-    #            {'value': '13.3寸', 'sku_id': xxx},
-    #            {'value': '15.4寸', 'sku_id': xxx},
-    #        ]
-    #    },
-    #    {
-    #        'name': '颜色',
-    #        'options': [
-    #            {'value': '银色', 'sku_id': xxx},
-    #            {'value': '黑色', 'sku_id': xxx}
-    #        ]
-    #    },
-    #    ...
-    # ]
-    specs = goods.goodsspecification_set.order_by('id')
-    # 若当前sku的规格信息不完整，则不再继续
-    if len(sku_key) < len(specs):
-        return
-    for index, spec in enumerate(specs):
-        # 复制当前sku的规格键
-        key = sku_key[:]
-        # 该规格的选项
-        options = spec.specificationoption_set.all()
-        for option in options:
-            # 在规格参数sku字典中查找符合当前规格的sku
-            key[index] = option.id
-            option.sku_id = spec_sku_map.get(tuple(key))
+    for sku_id, fingerprint in stale.items():
+        # 规格信息不完整的商品不生成页面，保存特殊的指纹，依赖数据未变化时下次不再检查
+        if save_sku_detail_html(sku_id, categories, publisher) is None:
+            fingerprint = skipped_sku_detail_fingerprint(fingerprint)
 
-        spec.options = options
+        rendered += 1
+        done[sku_id] = fingerprint
 
-    # 2. 调模板：detail.html，进行模板渲染
-    context = {
-        'categories': categories,
-        'goods': goods,
-        'specs': specs,
-        'sku': sku
-    }
+        # 分批保存指纹，脚本中断之后已生成的页面不需要重新渲染
+        if len(done) >= 500:
+            save_sku_detail_fingerprints(done)
+            done = {}
 
-    # 加载模板
-    temp = loader.get_template('detail.html')
+    save_sku_detail_fingerprints(done)
 
-    # 模板渲染
-    res_html = temp.render(context)
-
-    # 3. 保存静态页面
-    save_path = os.path.join(settings.GENERATED_STATIC_HTML_FILES_DIR, 'goods/%s.html' % sku_id)
-
-    with open(save_path, 'w') as f:
-        f.write(res_html)
+    return rendered, publisher
 
 
 if __name__ == "__main__":
-    # 获取所有的商品
-    skus = SKU.objects.all()
-
-    for sku in skus:
-        print(sku.id)
-        generate_static_sku_detail_html(sku.id)
+    rendered, publisher = regenerate_static_sku_detail_html(full='--full' in sys.argv[1:])
+    print('rendered: %s %s' % (rendered, publisher.stats()))